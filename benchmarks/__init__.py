@@ -0,0 +1,32 @@
+"""
+Performance benchmarks for the Wishlist service
+
+Each module can be run on its own, e.g.:
+  python -m benchmarks.bench_core_reads
+
+The benchmarks that seed data drop and recreate the tables of their
+database. They ignore DATABASE_URI, which the dev container points at the
+developer's database, and use a temporary SQLite file unless
+BENCH_DATABASE_URI names a database set aside for them.
+"""
+import os
+import tempfile
+
+_SCRATCH_DIR = None
+
+
+def use_scratch_database():
+    """
+    Points DATABASE_URI, for this process and the ones it starts, at the
+    database the benchmarks may wipe, and returns it
+
+    Call it before importing the service, which reads DATABASE_URI once.
+    """
+    global _SCRATCH_DIR  # pylint: disable=global-statement
+    database_uri = os.getenv("BENCH_DATABASE_URI")
+    if not database_uri:
+        if _SCRATCH_DIR is None:
+            _SCRATCH_DIR = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        database_uri = f"sqlite:///{_SCRATCH_DIR.name}/bench.db"
+    os.environ["DATABASE_URI"] = database_uri
+    return database_uri
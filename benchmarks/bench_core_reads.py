@@ -0,0 +1,98 @@
+"""
+Benchmark of the Core read path against ORM reads
+
+Compares the two ways the list of Wishlists can be read and serialized:
+  orm   Wishlist.all() followed by serialize() on every Wishlist
+  core  Wishlist.rows_page(), which builds the dictionaries from Core rows
+
+The database is seeded with the given numbers of Wishlists, each with the
+same number of Products. A new session is used for every run, so the ORM
+path pays for hydrating its objects every time, as a request would.
+
+Usage:
+  python -m benchmarks.bench_core_reads [--rows N [N ...]] [--products N] [--repeat N]
+
+By default the benchmark runs on a temporary SQLite file. Set
+BENCH_DATABASE_URI to run it against another database; its tables are
+dropped and recreated. DATABASE_URI is ignored.
+"""
+import argparse
+import timeit
+from benchmarks import use_scratch_database
+
+use_scratch_database()
+
+# pylint: disable=wrong-import-position, wrong-import-order
+from sqlalchemy import insert  # noqa: E402
+# Building the Flask app pushes the context the models run in
+from service import app  # noqa: E402, F401 pylint: disable=unused-import
+from service.models import Wishlist, Product, db  # noqa: E402
+
+
+def seed(count, products):
+    """Recreates the tables and inserts count Wishlists with their Products"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.execute(
+        insert(Wishlist),
+        [
+            {"id": i, "user_id": i % 97, "wishlist_name": f"wishlist-{i}", "archived": bool(i % 2), "version": 1}
+            for i in range(1, count + 1)
+        ],
+    )
+    db.session.execute(
+        insert(Product),
+        [
+            {
+                "wishlist_id": i,
+                "product_id": j,
+                "product_name": f"product-{j}",
+                "product_price": j * 1.5,
+            }
+            for i in range(1, count + 1)
+            for j in range(products)
+        ],
+    )
+    db.session.commit()
+    db.session.remove()
+
+
+def orm_path():
+    """The ORM path: hydrate every Wishlist and Product, then serialize()"""
+    try:
+        return [wishlist.serialize() for wishlist in Wishlist.all()]
+    finally:
+        db.session.remove()
+
+
+def core_path():
+    """The Core path: plain column tuples turned into dictionaries"""
+    try:
+        return Wishlist.rows_page()
+    finally:
+        db.session.remove()
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--products", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        seed(count, args.products)
+        assert orm_path() == core_path()
+
+        print(f"{count} wishlists x {args.products} products, best of {args.repeat}")
+        results = {}
+        for name, path in (("orm", orm_path), ("core", core_path)):
+            results[name] = min(timeit.repeat(path, number=1, repeat=args.repeat))
+            print(f"  {name:<5} {results[name] * 1000:9.1f} ms  {count / results[name]:12,.0f} wishlists/s")
+        print(f"  speedup {results['orm'] / results['core']:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
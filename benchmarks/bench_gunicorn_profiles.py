@@ -0,0 +1,151 @@
+"""
+Benchmark of the gunicorn worker profiles
+
+Starts gunicorn with gunicorn.conf.py once per profile and drives it with
+concurrent keep-alive HTTP clients for a fixed time, reading single
+wishlists and pages of wishlists. A profile is the set of environment
+variables that gunicorn.conf.py reads:
+
+  tuned      the settings chosen for --cpus and --memory
+  sync-1     1 sync worker
+  gthread-1  1 gthread worker with 4 threads
+  gevent-1   1 gevent worker (needs psycogreen on Postgres)
+  sync-3     3 preloaded sync workers
+  gthread-3  3 preloaded gthread workers with 4 threads each
+
+Usage:
+  python -m benchmarks.bench_gunicorn_profiles [--profiles NAME [NAME ...]]
+      [--cpus N] [--memory MIB] [--clients N] [--duration SECONDS]
+
+By default the benchmark runs on a temporary SQLite file. Set
+BENCH_DATABASE_URI to run it against another database; its tables are
+dropped and recreated. DATABASE_URI is ignored.
+The clients run on the same machine as the server, so run it with the
+CPUs pinned (for example with taskset) to compare profiles fairly.
+"""
+import argparse
+import http.client
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks import use_scratch_database
+
+use_scratch_database()
+
+# pylint: disable=wrong-import-position
+from benchmarks.bench_core_reads import seed  # noqa: E402
+
+PORT = 8097
+
+PROFILES = {
+    "tuned": {},
+    "sync-1": {"GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "1"},
+    "gthread-1": {"GUNICORN_WORKER_CLASS": "gthread", "WEB_CONCURRENCY": "1", "GUNICORN_THREADS": "4"},
+    "gevent-1": {"GUNICORN_WORKER_CLASS": "gevent", "WEB_CONCURRENCY": "1"},
+    "sync-3": {"GUNICORN_WORKER_CLASS": "sync", "WEB_CONCURRENCY": "3"},
+    "gthread-3": {"GUNICORN_WORKER_CLASS": "gthread", "WEB_CONCURRENCY": "3", "GUNICORN_THREADS": "4"},
+}
+
+
+def start_server(profile, cpus, memory):
+    """Starts gunicorn with a profile and waits until it answers"""
+    env = dict(os.environ, GUNICORN_CPUS=str(cpus), GUNICORN_MEMORY=str(memory), **PROFILES[profile])
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable, "-m", "gunicorn", "--config=gunicorn.conf.py", "--log-level=warning",
+            f"--bind=127.0.0.1:{PORT}", "service:app",
+        ],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"gunicorn did not start with profile {profile}")
+
+
+def client(count, deadline, latencies, errors):
+    """Sends requests until the deadline, recording the latency of each one"""
+    connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=30)
+    while time.perf_counter() < deadline:
+        if random.random() < 0.8:
+            path = f"/api/wishlists/{random.randint(1, count)}"
+        else:
+            path = "/api/wishlists?limit=20"
+        start = time.perf_counter()
+        try:
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+            except http.client.RemoteDisconnected:
+                # The server closed an idle keep-alive connection: retry, like any client would
+                connection.close()
+                connection.request("GET", path)
+                response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            # Sync workers close the connection after every response
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException) as error:
+            errors.append(str(error))
+            connection.close()
+        latencies.append(time.perf_counter() - start)
+
+
+def run(count, clients, duration):
+    """Drives the server with concurrent clients and returns the latencies and errors"""
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(count, deadline, latencies, errors)) for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES))
+    parser.add_argument("--cpus", type=float, default=0.2)
+    parser.add_argument("--memory", type=int, default=128)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    seed(args.rows, 3)
+    print(f"{args.clients} clients for {args.duration}s, tuned for {args.cpus} CPUs and {args.memory} MiB")
+    for profile in args.profiles:
+        server = start_server(profile, args.cpus, args.memory)
+        try:
+            run(args.rows, args.clients, 1)  # warm up
+            latencies, errors = run(args.rows, args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(
+            f"  {profile:<10} {len(latencies) / args.duration:8.0f} req/s"
+            f"  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  errors {len(errors)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the import time and memory of the service
+
+Imports the WSGI application in fresh interpreters, once per run, and
+reports the medians of:
+  import    wall time of "import service.wsgi", third-party packages included
+  own       the same, with Flask, flask-restx and SQLAlchemy already imported
+  rss       resident memory of the interpreter once the service is imported
+  swagger   time of the first GET /api/swagger.json, which builds the
+            Swagger specification
+
+Usage:
+  python -m benchmarks.bench_import [--runs N]
+
+Compile the bytecode first (python -m compileall service), as the Docker
+image does, or the timings include compiling the sources.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in a fresh interpreter and prints its measurements as JSON
+PROBE = """
+import json, sys, time
+if sys.argv[1] == "own":
+    import flask, flask_restx, flask_sqlalchemy, jsonschema, retry, sqlalchemy.orm
+start = time.perf_counter()
+import service.wsgi
+elapsed = time.perf_counter() - start
+with open("/proc/self/statm") as statm:
+    rss = int(statm.read().split()[1]) * 4096
+start = time.perf_counter()
+service.app.test_client().get("/api/swagger.json")
+swagger = time.perf_counter() - start
+print(json.dumps({"import": elapsed, "rss": rss, "swagger": swagger}))
+"""
+
+
+def probe(what, database_uri):
+    """Imports the service in a new interpreter and returns its measurements"""
+    env = dict(os.environ, DATABASE_URI=database_uri, PYTHONPATH=os.getcwd())
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, what], env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_uri = f"sqlite:///{scratch}/bench.db"
+        full = [probe("full", database_uri) for _ in range(args.runs)]
+        own = [probe("own", database_uri) for _ in range(args.runs)]
+        print(
+            f"median of {args.runs} runs:"
+            f" import {statistics.median(run['import'] for run in full) * 1000:7.1f} ms"
+            f"  own {statistics.median(run['import'] for run in own) * 1000:6.1f} ms"
+            f"  rss {statistics.median(run['rss'] for run in full) / 2 ** 20:6.1f} MiB"
+            f"  swagger {statistics.median(run['swagger'] for run in full) * 1000:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+"""
+Benchmark of every REST route, in process and over HTTP
+
+Seeds the database with --wishlists Wishlists of --products Products each,
+whose SKUs are spread over --skus SKUs, then sends --requests requests to
+each scenario below and reports its throughput and its p50, p95 and p99
+latencies. Reads come first, then writes; the writes that need something
+to change (a Product to delete, ...) create it first, untimed.
+
+The requests are sent by one of two drivers:
+  client   the Flask test client, in this process: the cost of the service
+           itself, without HTTP parsing or sockets
+  http     a gunicorn server started on the same database, driven by
+           --clients concurrent keep-alive connections
+
+Usage:
+  python -m benchmarks.bench_routes [--driver client|http] [--wishlists N]
+      [--products N] [--skus N] [--requests N] [--clients N]
+      [--scenarios NAME [NAME ...]] [--database URI] [--output FILE]
+  python -m benchmarks.bench_routes --compare BASE [HEAD] [--metric p95]
+      [--threshold FRACTION] [--floor MS] [same options]
+
+--compare runs the benchmark on two git revisions, each checked out in a
+temporary worktree (HEAD defaults to ".", the working tree), and exits
+with status 1 when a scenario got slower by more than --threshold and
+--floor milliseconds, or fails on HEAD but not on BASE. Scenarios that
+fail on BASE, like routes that do not exist there yet, are reported as not
+comparable.
+
+By default the benchmark runs on a temporary SQLite file. Set
+BENCH_DATABASE_URI, or pass --database, to run it against another
+database, e.g. a local Postgres; its tables are dropped and recreated.
+DATABASE_URI is ignored. Run it with the CPUs pinned (for example with
+taskset) to compare results between runs.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+# No query budget warnings
+os.environ.setdefault("QUERY_BUDGET", "off")
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+# A request: its method, path, body and content type
+Call = namedtuple("Call", "method path body content_type", defaults=(None, None))
+
+
+######################################################################
+#  S C E N A R I O S
+######################################################################
+class Dataset:
+    """The seeded rows, and the random choices the scenarios make among them"""
+
+    def __init__(self, wishlists, products, skus, random_seed=42):
+        self.wishlists = wishlists
+        self.products = products
+        self.skus = skus
+        self.random = random.Random(random_seed)
+
+    def wishlist_id(self):
+        """Returns the id of a random seeded Wishlist"""
+        return self.random.randint(1, self.wishlists)
+
+    def product(self):
+        """Returns the Wishlist id and the id of a random seeded Product"""
+        wishlist_id = self.wishlist_id()
+        return wishlist_id, (wishlist_id - 1) * self.products + self.random.randint(1, self.products)
+
+    def sku(self):
+        """Returns a random seeded SKU"""
+        return self.random.randrange(self.skus)
+
+    def new_product(self, wishlist_id):
+        """Returns the body of a new Product"""
+        sku = self.sku()
+        return {
+            "wishlist_id": wishlist_id, "product_id": sku, "product_name": f"product-{sku}",
+            "product_price": round(self.random.uniform(1, 100), 2),
+        }
+
+    def new_wishlist(self):
+        """Returns the body of a new Wishlist with a unique name"""
+        return {
+            "user_id": self.random.randrange(97), "wishlist_name": f"bench-{uuid.uuid4().hex[:16]}", "archived": False,
+        }
+
+
+def created_id(status, data):
+    """Returns the id of the object created by a setup request"""
+    if status != 201:
+        raise RuntimeError(f"setup request failed with {status}: {data[:200]!r}")
+    return json.loads(data)["id"]
+
+
+def delete_wishlist(send, data):
+    """Creates a Wishlist, and deletes it"""
+    wishlist_id = created_id(*send(Call("POST", "/api/wishlists", data.new_wishlist(), JSON)))
+    return Call("DELETE", f"/api/wishlists/{wishlist_id}")
+
+
+def delete_item(send, data):
+    """Creates a Product, and deletes it"""
+    wishlist_id = data.wishlist_id()
+    product = data.new_product(wishlist_id)
+    product_id = created_id(*send(Call("POST", f"/api/wishlists/{wishlist_id}/products", product, JSON)))
+    return Call("DELETE", f"/api/wishlists/{wishlist_id}/products/{product_id}")
+
+
+def update_wishlist(_, data):
+    """Updates a Wishlist, keeping its name"""
+    wishlist_id = data.wishlist_id()
+    body = {"user_id": wishlist_id % 97, "wishlist_name": f"wishlist-{wishlist_id}", "archived": False}
+    return Call("PUT", f"/api/wishlists/{wishlist_id}", body, JSON)
+
+
+def get_item(_, data):
+    """Reads a Product"""
+    wishlist_id, product_id = data.product()
+    return Call("GET", f"/api/wishlists/{wishlist_id}/products/{product_id}")
+
+
+def create_item(_, data):
+    """Adds a Product to a Wishlist"""
+    wishlist_id = data.wishlist_id()
+    return Call("POST", f"/api/wishlists/{wishlist_id}/products", data.new_product(wishlist_id), JSON)
+
+
+def update_item(_, data):
+    """Updates a Product"""
+    wishlist_id, product_id = data.product()
+    return Call("PUT", f"/api/wishlists/{wishlist_id}/products/{product_id}", data.new_product(wishlist_id), JSON)
+
+
+def import_wishlists(_, data):
+    """Imports 10 Wishlists of 3 Products"""
+    lines = []
+    for _ in range(10):
+        wishlist = data.new_wishlist()
+        wishlist["wishlist_products"] = [data.new_product(None) for _ in range(3)]
+        lines.append(json.dumps(wishlist))
+    return Call("POST", "/api/wishlists/import", "\n".join(lines) + "\n", NDJSON)
+
+
+def add_batch(_, data):
+    """Adds 10 Products to a Wishlist at once"""
+    wishlist_id = data.wishlist_id()
+    products = [data.new_product(wishlist_id) for _ in range(10)]
+    return Call("POST", f"/api/wishlists/{wishlist_id}/products/batch", products, JSON)
+
+
+# Every scenario returns the request to time; it may send untimed requests first
+SCENARIOS = {
+    # Reads
+    "index": lambda send, data: Call("GET", "/"),
+    "health": lambda send, data: Call("GET", "/health"),
+    "stats_cache": lambda send, data: Call("GET", "/stats/cache"),
+    "stats_pool": lambda send, data: Call("GET", "/stats/pool"),
+    "metrics": lambda send, data: Call("GET", "/metrics"),
+    "get_wishlist": lambda send, data: Call("GET", f"/api/wishlists/{data.wishlist_id()}"),
+    "list_wishlists": lambda send, data: Call("GET", "/api/wishlists?limit=20"),
+    "list_user_wishlists": lambda send, data: Call("GET", f"/api/wishlists?user_id={data.random.randrange(97)}&limit=20"),
+    "find_wishlist_by_name": lambda send, data: Call("GET", f"/api/wishlists?wishlist_name=wishlist-{data.wishlist_id()}"),
+    "list_summaries": lambda send, data: Call("GET", "/api/wishlists/summaries?limit=20"),
+    "get_summary": lambda send, data: Call("GET", f"/api/wishlists/{data.wishlist_id()}/summary"),
+    "list_items": lambda send, data: Call("GET", f"/api/wishlists/{data.wishlist_id()}/products"),
+    "page_items": lambda send, data: Call(
+        "GET", f"/api/wishlists/{data.wishlist_id()}/products?sort=product_price&limit=5"
+    ),
+    "get_item": get_item,
+    "list_sku_wishlists": lambda send, data: Call("GET", f"/api/skus/{data.sku()}/wishlists?limit=20"),
+    "export_sku_wishlists": lambda send, data: Call("GET", f"/api/skus/{data.sku()}/wishlists/export"),
+    "export_wishlists": lambda send, data: Call("GET", "/api/wishlists/export"),
+    # Writes
+    "create_wishlist": lambda send, data: Call("POST", "/api/wishlists", data.new_wishlist(), JSON),
+    "update_wishlist": update_wishlist,
+    "archive_wishlist": lambda send, data: Call("PUT", f"/api/wishlists/{data.wishlist_id()}/archive"),
+    "unarchive_wishlist": lambda send, data: Call("PUT", f"/api/wishlists/{data.wishlist_id()}/unarchive"),
+    "delete_wishlist": delete_wishlist,
+    "create_item": create_item,
+    "update_item": update_item,
+    "delete_item": delete_item,
+    "add_item_batch": add_batch,
+    "import_wishlists": import_wishlists,
+    "reprice_sku": lambda send, data: Call(
+        "PUT", f"/api/skus/{data.sku()}", {"product_price": round(data.random.uniform(1, 100), 2)}, JSON
+    ),
+}
+
+
+######################################################################
+#  S E E D I N G
+######################################################################
+def seed(wishlists, products, skus):
+    """Recreates the tables with wishlists Wishlists of products Products each"""
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy import insert, text
+    from service import app
+    from service.models import Wishlist, Product, db
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        rows = random.Random(7)
+        for start in range(0, wishlists, 1000):
+            ids = range(start + 1, min(start + 1000, wishlists) + 1)
+            db.session.execute(
+                insert(Wishlist),
+                [{"id": i, "user_id": i % 97, "wishlist_name": f"wishlist-{i}", "archived": False} for i in ids],
+            )
+            db.session.execute(
+                insert(Product),
+                [
+                    {
+                        "id": (i - 1) * products + j + 1,
+                        "wishlist_id": i,
+                        "product_id": rows.randrange(skus),
+                        "product_name": f"product-{i}-{j}",
+                        "product_price": round(rows.uniform(1, 100), 2),
+                    }
+                    for i in ids
+                    for j in range(products)
+                ],
+            )
+        if db.engine.dialect.name == "postgresql":
+            # The ids were given explicitly, so move the sequences past them
+            for table in ("wishlist", "product"):
+                db.session.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                ))
+        db.session.commit()
+        db.session.remove()
+
+
+######################################################################
+#  D R I V E R S
+######################################################################
+def encode(call):
+    """Returns the body of a request as bytes"""
+    if call.body is None:
+        return None
+    if isinstance(call.body, str):
+        return call.body.encode("utf-8")
+    return json.dumps(call.body).encode("utf-8")
+
+
+class ClientDriver:
+    """Sends the requests with the Flask test client"""
+
+    def __init__(self):
+        from service import app  # pylint: disable=import-outside-toplevel
+        self.client = app.test_client()
+
+    def connect(self):
+        """Returns a function sending a request and returning its status and body"""
+        def send(call):
+            response = self.client.open(
+                call.path, method=call.method, data=encode(call), content_type=call.content_type
+            )
+            return response.status_code, response.get_data()
+
+        return send
+
+    def close(self):
+        """Nothing to stop"""
+
+
+class HttpDriver:
+    """Sends the requests to a gunicorn server over keep-alive connections"""
+
+    def __init__(self, workers, threads):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        # Options given on the command line win over gunicorn.conf.py
+        self.server = subprocess.Popen(  # pylint: disable=consider-using-with
+            [
+                sys.executable, "-m", "gunicorn", f"--bind=127.0.0.1:{self.port}", f"--workers={workers}",
+                "--worker-class=gthread", f"--threads={threads}", "--log-level=warning", "service:app",
+            ],
+            env=dict(os.environ, PYTHONPATH=os.getcwd()),
+        )
+        for _ in range(100):
+            try:
+                if self.connect()(Call("GET", "/health"))[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.1)
+        self.close()
+        raise RuntimeError("gunicorn did not start")
+
+    def connect(self):
+        """Returns a function sending a request on a new connection and returning its status and body"""
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+
+        def send(call):
+            headers = {"Content-Type": call.content_type} if call.content_type else {}
+            try:
+                connection.request(call.method, call.path, encode(call), headers)
+                response = connection.getresponse()
+            except http.client.RemoteDisconnected:
+                # The server closed an idle keep-alive connection: retry, like any client would
+                connection.close()
+                connection.request(call.method, call.path, encode(call), headers)
+                response = connection.getresponse()
+            data = response.read()
+            if response.will_close:
+                connection.close()
+            return response.status, data
+
+        return send
+
+    def close(self):
+        """Stops the server"""
+        self.server.terminate()
+        self.server.wait()
+
+
+######################################################################
+#  M E A S U R E M E N T S
+######################################################################
+def drive(driver, scenario, data, requests, clients):
+    """Sends requests to a scenario from concurrent clients, and returns the latencies and errors"""
+    latencies = []
+    errors = []
+
+    def client(count):
+        send = driver.connect()
+        for _ in range(count):
+            try:
+                call = SCENARIOS[scenario](send, data)
+                start = time.perf_counter()
+                status, body = send(call)
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors.append(f"{status} {body[:200]!r}")
+            except (OSError, RuntimeError, http.client.HTTPException) as error:
+                errors.append(str(error))
+
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=client, args=(requests // clients + (index < requests % clients),))
+        for index in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+    """Returns the throughput and latency percentiles, in milliseconds, of a scenario"""
+    result = {"requests": len(latencies), "errors": len(errors), "rps": len(latencies) / elapsed if elapsed else 0}
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        result.update(p50=cuts[49] * 1000, p95=cuts[94] * 1000, p99=cuts[98] * 1000)
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def run(args):
+    """Seeds the database, runs every scenario and returns their results"""
+    seed(args.wishlists, args.products, args.skus)
+    driver = ClientDriver() if args.driver == "client" else HttpDriver(args.workers, args.threads)
+    clients = 1 if args.driver == "client" else args.clients
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            data = Dataset(args.wishlists, args.products, args.skus)
+            drive(driver, scenario, data, args.warmup, clients)
+            results[scenario] = summarize(*drive(driver, scenario, data, args.requests, clients))
+            print_result(scenario, results[scenario])
+    finally:
+        driver.close()
+    return results
+
+
+def print_result(scenario, result):
+    """Prints the results of a scenario"""
+    if "p50" not in result:
+        print(f"  {scenario:<22} failed: {result.get('first_error', 'no requests')}")
+        return
+    line = (
+        f"  {scenario:<22} {result['rps']:8.0f} req/s"
+        f"  p50 {result['p50']:8.2f} ms  p95 {result['p95']:8.2f} ms  p99 {result['p99']:8.2f} ms"
+    )
+    if result["errors"]:
+        line += f"  errors {result['errors']}: {result['first_error'][:60]}"
+    print(line)
+
+
+######################################################################
+#  R E V I S I O N   C O M P A R I S O N
+######################################################################
+def run_revision(revision, args, scratch):
+    """Runs this benchmark on a git revision, or on the working tree for ".", and returns its results"""
+    tree = os.getcwd()
+    worktree = None
+    if revision != ".":
+        worktree = os.path.join(scratch, f"tree-{len(os.listdir(scratch))}")
+        subprocess.run(["git", "worktree", "add", "--detach", worktree, revision], check=True, capture_output=True)
+        tree = worktree
+    output = os.path.join(scratch, f"results-{len(os.listdir(scratch))}.json")
+    forwarded = [
+        f"--driver={args.driver}", f"--wishlists={args.wishlists}", f"--products={args.products}",
+        f"--skus={args.skus}", f"--requests={args.requests}", f"--warmup={args.warmup}",
+        f"--clients={args.clients}", f"--workers={args.workers}", f"--threads={args.threads}",
+        f"--database={args.database}", "--scenarios", *args.scenarios,
+    ]
+    print(f"{revision}:")
+    try:
+        # This file, run against the service package of the revision
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *forwarded, f"--output={output}"],
+            cwd=tree, env=dict(os.environ, PYTHONPATH=tree), check=True,
+        )
+    finally:
+        if worktree:
+            subprocess.run(["git", "worktree", "remove", "--force", worktree], check=False)
+    with open(output, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(base, head, metric, threshold, floor):
+    """Prints the change of a metric between two runs, and returns the scenarios that regressed"""
+    regressions = []
+    print(f"{metric} latency, base -> head")
+    for scenario, after in head.items():
+        before = base.get(scenario, {})
+        failed_before = metric not in before or before["errors"]
+        failed_after = metric not in after or after["errors"]
+        if failed_before:
+            print(f"  {scenario:<22} not comparable: missing or failing on base")
+            continue
+        if failed_after:
+            print(f"  {scenario:<22} {before[metric]:8.2f} ->   failed: {after.get('first_error', 'no requests')[:60]}")
+            regressions.append(scenario)
+            continue
+        change = after[metric] / before[metric] - 1
+        regressed = change > threshold and after[metric] - before[metric] > floor
+        print(
+            f"  {scenario:<22} {before[metric]:8.2f} -> {after[metric]:8.2f} ms  {change:+7.1%}"
+            + ("  REGRESSION" if regressed else "")
+        )
+        if regressed:
+            regressions.append(scenario)
+    return regressions
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--driver", choices=("client", "http"), default="client")
+    parser.add_argument("--wishlists", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--skus", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--database", help="the database to recreate, BENCH_DATABASE_URI or a scratch SQLite file")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs="+", metavar="REVISION", help="BASE [HEAD] git revisions to compare")
+    parser.add_argument("--metric", choices=("p50", "p95", "p99"), default="p50")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that is a regression, 0.2 = 20%%")
+    parser.add_argument("--floor", type=float, default=0.2, help="smallest slowdown in ms that is a regression")
+    args = parser.parse_args()
+
+    # Read before the service is first imported, and by the revisions compared
+    if args.database:
+        os.environ["DATABASE_URI"] = args.database
+    else:
+        from benchmarks import use_scratch_database  # pylint: disable=import-outside-toplevel
+        args.database = use_scratch_database()
+
+    if args.compare:
+        if len(args.compare) > 2:
+            parser.error("--compare takes a BASE and an optional HEAD revision")
+        base_revision, head_revision = (args.compare + ["."])[:2]
+        with tempfile.TemporaryDirectory() as scratch:
+            base = run_revision(base_revision, args, scratch)
+            head = run_revision(head_revision, args, scratch)
+        regressions = compare(base, head, args.metric, args.threshold, args.floor)
+        if regressions:
+            print(f"{len(regressions)} scenarios regressed: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    print(
+        f"{args.driver} driver, {args.requests} requests per scenario, "
+        f"{args.wishlists} wishlists x {args.products} products over {args.skus} SKUs"
+    )
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
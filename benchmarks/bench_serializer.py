@@ -0,0 +1,108 @@
+"""
+Benchmark of the compiled serializers against flask-restx marshalling
+
+Compares the two ways the read routes can turn their results into JSON,
+for each of the compiled serializers the routes use:
+  marshal   marshal(..., model), as @api.marshal_with does
+  compiled  the single-pass serializer compiled from the same model
+
+The serializers are timed on what their routes hand them:
+  products   Product objects, serialized by serialize_product
+  summaries  the rows of Wishlist.summary_rows(), serialized by serialize_summary
+  owners     the rows of the Wishlists owning a SKU, serialized by serialize_owner
+
+Usage:
+  python -m benchmarks.bench_serializer [--rows N] [--repeat N]
+
+Serializing does not touch the database; DATABASE_URI is ignored.
+"""
+import argparse
+import json
+import timeit
+from types import SimpleNamespace
+from benchmarks import use_scratch_database
+
+use_scratch_database()
+
+# pylint: disable=wrong-import-position, wrong-import-order
+from flask_restx import marshal  # noqa: E402
+# Building the Flask app pushes the context the models run in
+from service import app  # noqa: E402, F401 pylint: disable=unused-import
+from service.models import Product  # noqa: E402
+from service.routes import (  # noqa: E402
+    product_model, wishlist_summary_model, wishlist_owner_model,
+    serialize_product, serialize_summary, serialize_owner,
+)
+
+
+def row(model, *values):
+    """Builds a stand-in for a Core row with the fields of the model
+
+    Like a Core row it is read by attribute. It is not a tuple, which marshal()
+    would take for a list of values.
+    """
+    return SimpleNamespace(**dict(zip(model, values)))
+
+
+def make_products(count):
+    """Builds transient Products"""
+    return [
+        Product(id=i, wishlist_id=i // 10, product_id=i % 1000, product_name=f"product-{i}", product_price=i * 1.5)
+        for i in range(count)
+    ]
+
+
+def make_summaries(count):
+    """Builds summary rows, with a null price range for the empty Wishlists"""
+    summaries = []
+    for i in range(count):
+        products = i % 10
+        prices = (1.5, products * 1.5) if products else (None, None)
+        summaries.append(row(wishlist_summary_model, i, i % 97, f"wishlist-{i}", bool(i % 2), products,
+                             products * products * 0.75, *prices))
+    return summaries
+
+
+def make_owners(count):
+    """Builds the rows of the Wishlists owning a SKU"""
+    return [row(wishlist_owner_model, i, i % 97) for i in range(count)]
+
+
+SCENARIOS = {
+    "products": (make_products, product_model, serialize_product),
+    "summaries": (make_summaries, wishlist_summary_model, serialize_summary),
+    "owners": (make_owners, wishlist_owner_model, serialize_owner),
+}
+
+
+def marshal_path(rows, model):
+    """The flask-restx path: marshal() walks the model for every row"""
+    return json.dumps(marshal(rows, model))
+
+
+def compiled_path(rows, serializer):
+    """The fast path: one compiled pass over the rows"""
+    return json.dumps([serializer(row) for row in rows])
+
+
+def main():
+    """Runs the benchmark and prints the results"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    for name, (make_rows, model, serializer) in SCENARIOS.items():
+        rows = make_rows(args.rows)
+        assert json.loads(marshal_path(rows, model)) == json.loads(compiled_path(rows, serializer))
+        marshalled = min(timeit.repeat(lambda rows=rows, model=model: marshal_path(rows, model),
+                                       number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda rows=rows, serializer=serializer: compiled_path(rows, serializer),
+                                     number=1, repeat=args.repeat))
+        print(f"  {name:<10} marshal {marshalled * 1000:8.1f} ms  compiled {compiled * 1000:8.1f} ms"
+              f"  speedup {marshalled / compiled:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
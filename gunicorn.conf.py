@@ -0,0 +1,241 @@
+"""
+Gunicorn configuration tuned from the limits of the container
+
+The Procfile and the Dockerfile start gunicorn with this file. The worker
+class, the number of workers and threads, and preloading are derived from
+the CPU quota and memory limit of the cgroup the server runs in:
+
+  - one worker per CPU share, up to 2 x CPUs + 1, as long as they fit in
+    the memory limit; the application is preloaded when there is more
+    than one worker, so that workers share its pages
+  - when the CPU quota is below one CPU, or memory limits the workers,
+    requests are multiplexed inside the workers instead, with gthread
+  - gevent is only used when GUNICORN_WORKER_CLASS asks for it, and then
+    needs psycogreen so that psycopg2 yields while it waits on Postgres
+
+Every setting can be overridden with environment variables:
+
+  GUNICORN_CPUS            CPUs to tune for, instead of the cgroup quota
+  GUNICORN_MEMORY          MiB to tune for, instead of the cgroup limit
+  GUNICORN_WORKER_CLASS    sync, gthread or gevent
+  WEB_CONCURRENCY          number of workers
+  GUNICORN_THREADS         threads per gthread worker
+  GUNICORN_PRELOAD         preload the application (true or false)
+  GUNICORN_MAX_REQUESTS    requests a worker serves before it is restarted
+  GUNICORN_TIMEOUT         seconds before a silent worker is killed
+
+The settings chosen are logged when the server starts, with a warning when
+the memory limit is too low for even a single worker.
+
+When PROMETHEUS_MULTIPROC_DIR is set, the workers write their metrics to
+that directory so that /metrics aggregates all of them: it is emptied when
+the server starts, and the gauges of a worker are dropped when it exits.
+"""
+import glob
+import math
+import os
+import sys
+
+# Memory used by the gunicorn arbiter, without the application
+MASTER_MEMORY = 24
+# Memory used by a worker that imports the application (measured at 50 MiB,
+# plus room to serve requests)
+WORKER_MEMORY = 64
+# Memory used by each worker forked from a preloaded arbiter
+PRELOADED_WORKER_MEMORY = 24
+# Threads or greenlets of a worker never exceed the connections of its pool
+DB_POOL_CAPACITY = int(os.getenv("DB_POOL_SIZE", "5")) + int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+
+######################################################################
+#  C G R O U P   L I M I T S
+######################################################################
+def _read(path):
+    """Returns the stripped content of a file, or None if it cannot be read"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit(root=CGROUP_ROOT):
+    """
+    Returns the number of CPUs the container may use
+
+    The CFS quota of cgroup v2 (cpu.max) or v1 (cpu.cfs_quota_us) wins over
+    the CPUs the process may be scheduled on, which are used without a quota.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = period = None
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    if quota and period and quota not in ("max", "-1"):
+        return min(cpus, int(quota) / int(period))
+    return cpus
+
+
+def memory_limit(root=CGROUP_ROOT):
+    """Returns the memory limit of the container in MiB, or None if it has none"""
+    limit = _read(os.path.join(root, "memory.max")) or _read(os.path.join(root, "memory", "memory.limit_in_bytes"))
+    if not limit or limit == "max":
+        return None
+    # cgroup v1 reports a huge page-aligned number when there is no limit
+    limit = int(limit)
+    if limit >= 2 ** 60:
+        return None
+    return limit // (1024 * 1024)
+
+
+######################################################################
+#  T U N I N G
+######################################################################
+def tune(cpus, memory=None, env=None):
+    """
+    Chooses the gunicorn settings for the given limits
+
+    Args:
+        cpus (float): the CPUs the container may use
+        memory (int): the memory limit of the container in MiB, or None
+        env (dict): the environment variables that override the settings
+
+    Returns:
+        dict: the gunicorn settings
+    """
+    env = os.environ if env is None else env
+    target = int(2 * cpus) + 1 if cpus >= 1 else 1
+
+    # As many workers as the CPUs can keep busy, as long as they fit in memory:
+    # the preloaded arbiter holds the application, and every worker adds its own pages
+    workers = target
+    if memory and target > 1:
+        workers = max(1, min(target, 1 + (memory - MASTER_MEMORY - WORKER_MEMORY) // PRELOADED_WORKER_MEMORY))
+    workers = int(env.get("WEB_CONCURRENCY", workers))
+
+    # Multiplex requests inside the workers when processes cannot be added
+    worker_class = "gthread" if cpus < 1 or workers < target else "sync"
+    worker_class = env.get("GUNICORN_WORKER_CLASS", worker_class)
+    threads = 1
+    if worker_class == "gthread":
+        threads = min(DB_POOL_CAPACITY, max(4, math.ceil(2 * target / workers)))
+    threads = int(env.get("GUNICORN_THREADS", threads))
+
+    # Recycle workers to contain leaks, at staggered times so that they never
+    # all restart together; a lone worker is not recycled, as its restart
+    # would stall every request until the application is imported again
+    max_requests = int(env.get("GUNICORN_MAX_REQUESTS", "10000" if workers > 1 else "0"))
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "threads": threads,
+        # Greenlets beyond the pool wait for a connection, but only up to a point
+        "worker_connections": DB_POOL_CAPACITY * 4,
+        # gevent must patch the standard library before the application is imported
+        "preload_app": env.get("GUNICORN_PRELOAD", str(workers > 1 and worker_class != "gevent")).lower()
+        in ("1", "true", "yes"),
+        "max_requests": max_requests,
+        "max_requests_jitter": max_requests // 10,
+        "timeout": int(env.get("GUNICORN_TIMEOUT", "30")),
+        # Finish in-flight requests well within the 30s grace period of Kubernetes
+        "graceful_timeout": 20,
+        # Let clients reuse their connections between requests
+        "keepalive": 5,
+    }
+
+
+def limits(env=None):
+    """Returns the CPUs and memory to tune for, from the environment or the cgroup"""
+    env = os.environ if env is None else env
+    cpus = float(env["GUNICORN_CPUS"]) if env.get("GUNICORN_CPUS") else cpu_limit()
+    memory = int(env["GUNICORN_MEMORY"]) if env.get("GUNICORN_MEMORY") else memory_limit()
+    return cpus, memory
+
+
+def clear_metrics(directory):
+    """Removes the metrics left in a multiprocess directory by a previous server"""
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+######################################################################
+#  S E T T I N G S
+######################################################################
+_cpus, _memory = limits()
+_settings = tune(_cpus, _memory)
+
+worker_class = _settings["worker_class"]
+workers = _settings["workers"]
+threads = _settings["threads"]
+worker_connections = _settings["worker_connections"]
+preload_app = _settings["preload_app"]
+max_requests = _settings["max_requests"]
+max_requests_jitter = _settings["max_requests_jitter"]
+timeout = _settings["timeout"]
+graceful_timeout = _settings["graceful_timeout"]
+keepalive = _settings["keepalive"]
+
+# The heartbeat files of the workers must not live on a disk-backed overlay
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+######################################################################
+#  S E R V E R   H O O K S
+######################################################################
+def on_starting(server):
+    """Logs the limits and the settings chosen from them, and clears old metrics"""
+    server.log.info(
+        "Tuned for %s CPUs and %s MiB: %s", round(_cpus, 2), _memory or "unlimited",
+        ", ".join(f"{name}={value}" for name, value in _settings.items()),
+    )
+    needed = MASTER_MEMORY + WORKER_MEMORY
+    if preload_app:
+        needed += (workers - 1) * PRELOADED_WORKER_MEMORY
+    else:
+        needed += (workers - 1) * WORKER_MEMORY
+    if _memory and _memory < needed:
+        server.log.warning("The memory limit of %s MiB is below the %s MiB the workers need", _memory, needed)
+    clear_metrics(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Prepares the database driver and connection pool of a new worker"""
+    if worker_class == "gevent" and os.getenv("DATABASE_URI", "postgres").startswith("postgres"):
+        from psycogreen.gevent import patch_psycopg  # pylint: disable=import-outside-toplevel
+        patch_psycopg()
+    # Connections opened by a preloaded arbiter must not be shared with it
+    if "service.models" in sys.modules:
+        from service import app  # pylint: disable=import-outside-toplevel
+        from service.models import db  # pylint: disable=import-outside-toplevel
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """
+    Warms up the connection pool of a worker when DB_WARMUP asks for it
+
+    This runs in the worker once it has loaded the application, so that a
+    preloaded arbiter never connects to the database on behalf of its workers.
+    """
+    from service import app, models  # pylint: disable=import-outside-toplevel
+    with app.app_context():
+        if app.config["DB_WARMUP"]:
+            models.warm_up(app.config["DB_WARMUP_TRIES"], app.config["DB_WARMUP_DELAY"])
+        worker.log.info("Database connection pool: %s", models.pool_status())
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the in-progress gauges of a worker that exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+        multiprocess.mark_process_dead(worker.pid)
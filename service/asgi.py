@@ -0,0 +1,566 @@
+"""
+Wishlist Service, ASGI Entry Point
+
+This module serves the REST API of service.routes as an ASGI application
+running on an async SQLAlchemy engine, so that a single process can keep
+hundreds of requests in flight while they wait on the database. Run it
+with any ASGI server, for example:
+
+    uvicorn service.asgi:app --host 0.0.0.0 --port 8080
+
+The routes answer with the same paths, status codes, headers and bodies as
+the WSGI application, except that the X-Fields fields mask is ignored: every
+field is returned, under the ETag of the full representation. The Swagger
+docs, the NDJSON bulk export and import, the SKU export and the /stats
+endpoints are only served by the WSGI app. Reads are not cached in process:
+every request goes to the database, and ETags are still derived from the
+wishlist versions. Every write bumps the version of the wishlist, which is
+what the WSGI workers check their cached entries against, so both apps can
+serve the same database.
+
+Only the models and the configuration are imported: the Flask app of
+service.wsgi is never built in an ASGI process.
+"""
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from datetime import timezone
+from flask_restx import inputs
+from starlette.applications import Starlette
+from starlette.endpoints import HTTPEndpoint
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.http import http_date, parse_etags, quote_etag
+from service import config
+from service import async_models as store
+from service.common import status
+from service.common.pagination import encode_cursor, keyset_cursor, link_header, parse_page_args
+from service.models import Wishlist, Product, DataValidationError, DataConflictError, PRODUCT_SORT_KEYS
+
+# The columns of a Wishlist summary, in the order of the API model
+SUMMARY_FIELDS = (
+    "id", "user_id", "wishlist_name", "archived", "product_count", "total_price", "min_price", "max_price"
+)
+
+
+class QueryArgsError(Exception):
+    """Used for query string arguments that cannot be parsed"""
+
+    def __init__(self, errors):
+        super().__init__("Input payload validation failed")
+        self.errors = errors
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}
+######################################################################
+class WishlistResource(HTTPEndpoint):
+    """ Handles all interactions with a Wishlist """
+
+    async def get(self, request):
+        """ Get a Wishlist """
+        wishlist_id = request.path_params["wishlist_id"]
+        async with request.app.state.sessions() as session:
+            wishlist, headers = await read_wishlist(request, session, wishlist_id, "wishlist")
+        if wishlist is None:
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        return json_response(wishlist, status.HTTP_200_OK, headers)
+
+    async def put(self, request):
+        """ Update a Wishlist """
+        wishlist_id = request.path_params["wishlist_id"]
+        body = await read_json(request)
+        async with request.app.state.sessions() as session:
+            wishlist = await store.find_wishlist(session, wishlist_id)
+            if not wishlist:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' was not found.")
+            wishlist.deserialize(body)
+            await store.update_wishlist(session, wishlist)
+            return json_response(wishlist.serialize(), status.HTTP_200_OK)
+
+    async def delete(self, request):
+        """ Delete a Wishlist """
+        wishlist_id = request.path_params["wishlist_id"]
+        async with request.app.state.sessions() as session:
+            wishlist = await store.find_wishlist(session, wishlist_id)
+            if wishlist:
+                await store.delete_wishlist(session, wishlist)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+######################################################################
+# PATH: /api/wishlists
+######################################################################
+class WishlistCollection(HTTPEndpoint):
+    """ Handles all interactions with collections of Wishlists """
+
+    async def get(self, request):
+        """ Return all wishlists, one page at a time """
+        args = query_args(
+            request, wishlist_name=str, user_id=int, archived=inputs.boolean, limit=int, after=str
+        )
+        async with request.app.state.sessions() as session:
+            if args["wishlist_name"]:
+                wishlists = await store.wishlist_rows_page(session, limit=1, wishlist_name=args["wishlist_name"])
+                return json_response(wishlists, status.HTTP_200_OK)
+
+            # Fetch one extra row to find out whether there is a next page
+            limit, after = page_args(args, int)
+            filters = {name: args[name] for name in ("user_id", "archived") if args[name] is not None}
+            wishlists = await store.wishlist_rows_page(
+                session, after=after[0] if after else None, limit=limit + 1, **filters
+            )
+        headers = {}
+        if len(wishlists) > limit:
+            wishlists = wishlists[:limit]
+            headers = next_page_headers(request, limit, encode_cursor(wishlists[-1]["id"]))
+        return json_response(wishlists, status.HTTP_200_OK, headers)
+
+    async def post(self, request):
+        """ Create a Wishlist """
+        body = await read_json(request)
+        wishlist = Wishlist()
+        wishlist.deserialize(body)
+        async with request.app.state.sessions() as session:
+            await store.create_wishlist(session, wishlist)
+            location_url = str(request.url_for("wishlist", wishlist_id=wishlist.id))
+            return json_response(wishlist.serialize(), status.HTTP_201_CREATED, {"Location": location_url})
+
+
+######################################################################
+# PATH: /api/wishlists/summaries
+######################################################################
+class WishlistSummaryCollection(HTTPEndpoint):
+    """ Handles the summaries of collections of Wishlists """
+
+    async def get(self, request):
+        """ Return the summaries of all wishlists, one page at a time """
+        args = query_args(
+            request, wishlist_name=str, user_id=int, archived=inputs.boolean, limit=int, after=str
+        )
+        limit, after = page_args(args, int)
+        filters = {name: args[name] for name in ("wishlist_name", "user_id", "archived") if args[name] is not None}
+        async with request.app.state.sessions() as session:
+            summaries = await store.wishlist_summary_rows(
+                session, after=after[0] if after else None, limit=limit + 1, **filters
+            )
+        headers = {}
+        if len(summaries) > limit:
+            summaries = summaries[:limit]
+            headers = next_page_headers(request, limit, encode_cursor(summaries[-1].id))
+        return json_response([serialize_summary(summary) for summary in summaries], status.HTTP_200_OK, headers)
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}/summary
+######################################################################
+class WishlistSummaryResource(HTTPEndpoint):
+    """ Handles the summary of a Wishlist """
+
+    async def get(self, request):
+        """ Retrieve the summary of a single Wishlist """
+        wishlist_id = request.path_params["wishlist_id"]
+        async with request.app.state.sessions() as session:
+            summaries = await store.wishlist_summary_rows(session, id=wishlist_id)
+        if not summaries:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        summary = summaries[0]
+        etag = f"{wishlist_id}-{summary.version}-summary"
+        headers = validator_headers(etag, summary.last_updated)
+        if is_not_modified(request, etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        return json_response(serialize_summary(summary), status.HTTP_200_OK, headers)
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}/archive and /unarchive
+######################################################################
+class ArchiveResource(HTTPEndpoint):
+    """ Archive and unarchive actions on a Wishlist """
+
+    async def put(self, request):
+        """ Archive or unarchive a Wishlist, depending on the path """
+        wishlist_id = request.path_params["wishlist_id"]
+        async with request.app.state.sessions() as session:
+            wishlist = await store.find_wishlist(session, wishlist_id)
+            if not wishlist:
+                raise HTTPException(
+                    status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found."
+                )
+            wishlist.archived = request.url.path.rstrip("/").endswith("/archive")
+            await store.update_wishlist(session, wishlist)
+            return json_response(wishlist.serialize(), status.HTTP_200_OK)
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}/products/{product_id}
+######################################################################
+class ItemResource(HTTPEndpoint):
+    """ Handles all interactions with an Item """
+
+    async def get(self, request):
+        """ Get an Item """
+        product_id = request.path_params["product_id"]
+        async with request.app.state.sessions() as session:
+            found = await store.find_product_with_version(session, product_id)
+            if not found:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
+            product, version, last_updated = found
+            etag = f"{product.wishlist_id}-{version}-product-{product.id}"
+            headers = validator_headers(etag, last_updated)
+            if is_not_modified(request, etag):
+                return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+            return json_response(product.serialize(), status.HTTP_200_OK, headers)
+
+    async def put(self, request):
+        """ Update an Item """
+        product_id = request.path_params["product_id"]
+        body = await read_json(request)
+        async with request.app.state.sessions() as session:
+            product = await store.find_product(session, product_id)
+            if not product:
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found")
+            original_wishlist_id = product.wishlist_id
+            product.deserialize(body)
+            product.id = product_id
+            product.wishlist_id = original_wishlist_id
+            await store.update_product(session, product)
+            return json_response(product.serialize(), status.HTTP_200_OK)
+
+    async def delete(self, request):
+        """ Remove an Item from a Wishlist """
+        product_id = request.path_params["product_id"]
+        async with request.app.state.sessions() as session:
+            product = await store.find_product(session, product_id)
+            if product:
+                await store.delete_product(session, product)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}/products
+######################################################################
+class ItemCollection(HTTPEndpoint):
+    """ Handles all interactions with collections of Items """
+
+    async def get(self, request):
+        """ Return the products in a wishlist, filtered and paged when asked to """
+        wishlist_id = request.path_params["wishlist_id"]
+        args = query_args(
+            request, product_id=int, min_price=float, max_price=float, sort=sort_key, limit=int, after=str
+        )
+        async with request.app.state.sessions() as session:
+            # Without any arguments, the whole list is returned with the version of the Wishlist
+            if all(value is None for value in args.values()):
+                wishlist, headers = await read_wishlist(request, session, wishlist_id, "products")
+                if wishlist is None:
+                    return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+                return json_response(wishlist["wishlist_products"], status.HTTP_200_OK, headers)
+
+            sort = args["sort"] or "id"
+            limit, after = page_args(args, *PRODUCT_SORT_KEYS[sort])
+            found = await store.find_wishlist_version(session, wishlist_id)
+            if not found:
+                raise HTTPException(
+                    status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found."
+                )
+            etag = f"{wishlist_id}-{found.version}-products-{hashlib.sha1(request.url.query.encode()).hexdigest()[:16]}"
+            headers = validator_headers(etag, found.last_updated)
+            if is_not_modified(request, etag):
+                return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+
+            # Fetch one extra row to find out whether there is a next page
+            filters = {name: args[name] for name in ("product_id", "min_price", "max_price")}
+            products = await store.product_rows_page(
+                session, wishlist_id, sort=sort, after=after, limit=limit + 1, **filters
+            )
+        if len(products) > limit:
+            products = products[:limit]
+            headers.update(next_page_headers(request, limit, keyset_cursor(products[-1], sort)))
+        return json_response(products, status.HTTP_200_OK, headers)
+
+    async def post(self, request):
+        """ Add a product to a Wishlist """
+        wishlist_id = request.path_params["wishlist_id"]
+        body = await read_json(request)
+        async with request.app.state.sessions() as session:
+            if not await store.find_wishlist_version(session, wishlist_id):
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' was not found.")
+            product = Product()
+            product.deserialize(body)
+            product.wishlist_id = wishlist_id
+            await store.create_product(session, product)
+            location_url = str(request.url_for("item", wishlist_id=wishlist_id, product_id=product.id))
+            return json_response(product.serialize(), status.HTTP_201_CREATED, {"Location": location_url})
+
+
+######################################################################
+# PATH: /api/wishlists/{wishlist_id}/products/batch
+######################################################################
+class ItemBatch(HTTPEndpoint):
+    """ Handles adding many Items to a Wishlist at once """
+
+    async def post(self, request):
+        """ Add an array of products to a Wishlist in a single transaction """
+        wishlist_id = request.path_params["wishlist_id"]
+        data = await read_json(request)
+        async with request.app.state.sessions() as session:
+            if not await store.find_wishlist_version(session, wishlist_id):
+                raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' was not found.")
+            if not isinstance(data, list) or len(data) == 0:
+                raise HTTPException(status.HTTP_400_BAD_REQUEST, "Request body must be a non-empty array of products")
+            if len(data) > config.BATCH_SIZE_MAX:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST, f"A batch can hold at most {config.BATCH_SIZE_MAX} products"
+                )
+
+            # Validate every product before writing any of them
+            products = []
+            for index, item in enumerate(data):
+                try:
+                    product = Product().deserialize(item)
+                except DataValidationError as error:
+                    raise DataValidationError(f"Product at index {index}: {error}") from error
+                product.wishlist_id = wishlist_id
+                products.append(product)
+
+            created = await store.bulk_create_products(session, products)
+            return json_response([product.serialize() for product in created], status.HTTP_201_CREATED)
+
+
+######################################################################
+# PATH: /api/skus/{product_id}
+######################################################################
+class SkuResource(HTTPEndpoint):
+    """ Handles a SKU across every Wishlist """
+
+    async def put(self, request):
+        """ Reprice a SKU in every Wishlist """
+        product_id = request.path_params["product_id"]
+        body = await read_json(request)
+        if not isinstance(body, dict):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON object")
+        async with request.app.state.sessions() as session:
+            updated, _ = await store.reprice_products(session, [dict(body, product_id=product_id)])
+        return json_response({"product_id": product_id, "updated": updated}, status.HTTP_200_OK)
+
+
+######################################################################
+# PATH: /api/skus/{product_id}/wishlists
+######################################################################
+class SkuWishlistCollection(HTTPEndpoint):
+    """ Handles the Wishlists that contain a SKU """
+
+    async def get(self, request):
+        """ Return the wishlists that contain a SKU, one page at a time """
+        product_id = request.path_params["product_id"]
+        limit, after = page_args(query_args(request, limit=int, after=str), int)
+        async with request.app.state.sessions() as session:
+            owners = await store.find_wishlist_owners(
+                session, product_id, after=after[0] if after else None, limit=limit + 1
+            )
+        headers = {}
+        if len(owners) > limit:
+            owners = owners[:limit]
+            headers = next_page_headers(request, limit, encode_cursor(owners[-1].wishlist_id))
+        owners = [{"wishlist_id": owner.wishlist_id, "user_id": owner.user_id} for owner in owners]
+        return json_response(owners, status.HTTP_200_OK, headers)
+
+
+######################################################################
+# K U B E R N E T E S   H E A L T H   C H E C K
+######################################################################
+async def check_kubernetes(request):  # pylint: disable=unused-argument
+    """ Health check for kubernetes """
+    return json_response({"status": 200, "message": "Healthy"}, status.HTTP_200_OK)
+
+
+######################################################################
+# E R R O R   H A N D L E R S
+######################################################################
+async def http_error(request, error):  # pylint: disable=unused-argument
+    """Returns HTTP errors with the JSON body of flask-restx aborts"""
+    return json_response({"message": error.detail}, error.status_code, getattr(error, "headers", None))
+
+
+async def query_args_error(request, error):  # pylint: disable=unused-argument
+    """Returns invalid query string arguments with the JSON body of flask-restx parsers"""
+    body = {"errors": error.errors, "message": "Input payload validation failed"}
+    return json_response(body, status.HTTP_400_BAD_REQUEST)
+
+
+async def request_validation_error(request, error):  # pylint: disable=unused-argument
+    """Handles Value Errors from bad data"""
+    return error_response(status.HTTP_400_BAD_REQUEST, "Bad Request", str(error))
+
+
+async def request_conflict_error(request, error):  # pylint: disable=unused-argument
+    """Handles changes that conflict with existing data with 409_CONFLICT"""
+    return error_response(status.HTTP_409_CONFLICT, "Conflict", str(error))
+
+
+######################################################################
+# U T I L I T Y   F U N C T I O N S
+######################################################################
+async def read_wishlist(request, session, wishlist_id, representation):
+    """
+    Reads a serialized Wishlist, honoring If-None-Match
+
+    Returns:
+        tuple: the serialized Wishlist, or None if the client's copy is not
+        modified, and the ETag and Last-Modified headers
+    """
+    if request.headers.get("If-None-Match"):
+        found = await store.find_wishlist_version(session, wishlist_id)
+        if not found:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        etag = f"{wishlist_id}-{found.version}-{representation}"
+        if is_not_modified(request, etag):
+            return None, validator_headers(etag, found.last_updated)
+
+    found = await store.find_wishlist_row(session, wishlist_id)
+    if not found:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+    wishlist, version, last_updated = found
+    return wishlist, validator_headers(f"{wishlist_id}-{version}-{representation}", last_updated)
+
+
+async def read_json(request):
+    """Returns the JSON body of a request, checking its Content-Type first"""
+    content_type = request.headers.get("Content-Type")
+    if content_type != "application/json":
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "Content-Type must be application/json")
+    try:
+        return await request.json()
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "The request body is not valid JSON") from error
+
+
+def query_args(request, **types):
+    """
+    Parses the query string arguments of a request
+
+    Args:
+        types (callable): the converter of each argument, which raises a
+            ValueError for invalid values
+
+    Returns:
+        dict: the converted value of each argument, or None if it was not given
+    """
+    args = {}
+    errors = {}
+    for name, convert in types.items():
+        value = request.query_params.get(name)
+        try:
+            args[name] = None if value is None else convert(value)
+        except (TypeError, ValueError) as error:
+            errors[name] = str(error)
+    if errors:
+        raise QueryArgsError(errors)
+    return args
+
+
+def sort_key(value):
+    """Checks the sort order of a list of products"""
+    if value not in PRODUCT_SORT_KEYS:
+        raise ValueError(f"The value '{value}' is not a valid choice for 'sort'.")
+    return value
+
+
+def page_args(args, *key_types):
+    """Returns the page size and the decoded 'after' cursor of a paginated request"""
+    try:
+        return parse_page_args(args, config.PAGE_SIZE_DEFAULT, config.PAGE_SIZE_MAX, *key_types)
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+
+
+def next_page_headers(request, limit, cursor):
+    """Returns the Link and X-Next-Cursor headers pointing to the next page"""
+    next_url = str(request.url.include_query_params(limit=limit, after=cursor))
+    return {"Link": link_header(next_url), "X-Next-Cursor": cursor}
+
+
+def serialize_summary(summary):
+    """Converts a Wishlist summary row into a dictionary"""
+    return {name: getattr(summary, name) for name in SUMMARY_FIELDS}
+
+
+def json_response(data, code, headers=None):
+    """Builds a JSON response, or an empty one when data is None"""
+    body = None if data is None else json.dumps(data, separators=(",", ":"))
+    media_type = None if data is None else "application/json"
+    return Response(body, status_code=code, headers=headers, media_type=media_type)
+
+
+def error_response(code, error, message):
+    """Builds the JSON body of the service error handlers"""
+    return json_response({"status": code, "error": error, "message": message}, code)
+
+
+def validator_headers(etag, last_updated):
+    """Returns the ETag and Last-Modified headers of a representation"""
+    headers = {"ETag": quote_etag(etag)}
+    if last_updated:
+        headers["Last-Modified"] = http_date(last_updated.replace(tzinfo=timezone.utc))
+    return headers
+
+
+def is_not_modified(request, etag):
+    """Checks whether the If-None-Match header of the request matches the ETag"""
+    return parse_etags(request.headers.get("If-None-Match")).contains_weak(etag)
+
+
+######################################################################
+# A P P L I C A T I O N
+######################################################################
+ROUTES = [
+    Route("/health", check_kubernetes, methods=["GET"]),
+    Route("/api/wishlists", WishlistCollection, name="wishlists"),
+    Route("/api/wishlists/summaries", WishlistSummaryCollection, name="wishlist_summaries"),
+    Route("/api/wishlists/{wishlist_id:int}", WishlistResource, name="wishlist"),
+    Route("/api/wishlists/{wishlist_id:int}/summary", WishlistSummaryResource, name="wishlist_summary"),
+    Route("/api/wishlists/{wishlist_id:int}/archive", ArchiveResource, name="archive"),
+    Route("/api/wishlists/{wishlist_id:int}/unarchive", ArchiveResource, name="unarchive"),
+    Route("/api/wishlists/{wishlist_id:int}/products", ItemCollection, name="items"),
+    Route("/api/wishlists/{wishlist_id:int}/products/batch", ItemBatch, name="item_batch"),
+    Route("/api/wishlists/{wishlist_id:int}/products/{product_id:int}", ItemResource, name="item"),
+    Route("/api/skus/{product_id:int}", SkuResource, name="sku"),
+    Route("/api/skus/{product_id:int}/wishlists", SkuWishlistCollection, name="sku_wishlists"),
+]
+
+
+def create_app(database_uri=None, engine_options=None):
+    """
+    Creates the ASGI application
+
+    Args:
+        database_uri (str): the database to use, DATABASE_URI by default
+        engine_options (dict): the pool settings, SQLALCHEMY_ENGINE_OPTIONS by default
+    """
+    engine, sessions = store.init_async_db(
+        database_uri or config.DATABASE_URI,
+        config.SQLALCHEMY_ENGINE_OPTIONS if engine_options is None else engine_options,
+    )
+
+    @asynccontextmanager
+    async def lifespan(application):  # pylint: disable=unused-argument
+        yield
+        await engine.dispose()
+
+    application = Starlette(
+        routes=ROUTES,
+        exception_handlers={
+            HTTPException: http_error,
+            QueryArgsError: query_args_error,
+            DataValidationError: request_validation_error,
+            DataConflictError: request_conflict_error,
+        },
+        lifespan=lifespan,
+    )
+    application.state.sessions = sessions
+    return application
+
+
+app = create_app()
@@ -0,0 +1,251 @@
+"""
+Async Data Access for Wishlist
+
+The ASGI entry point in service.asgi cannot use the Flask-SQLAlchemy session,
+which blocks its worker for every round trip to the database. The functions
+in this module are the async versions of the finders and mutators of
+service.models: they share the mapped classes and the statements built by
+the models, and only run them on an async engine instead.
+
+Every function takes the AsyncSession of the current request. Sessions are
+made with expire_on_commit=False, so that objects can still be serialized
+after a commit without an implicit lazy load, which async sessions forbid.
+"""
+import logging
+from sqlalchemy import insert, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from service.models import (
+    Wishlist, Product, DataConflictError, WISHLIST_COLUMNS, ROWS_IN_CHUNK_SIZE, is_name_conflict, utcnow
+)
+
+# The statement builders of the models are private to the service package
+# pylint: disable=protected-access
+
+logger = logging.getLogger("flask.app")
+
+# The async drivers used in place of the sync drivers of DATABASE_URI
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_uri(uri):
+    """Returns the database URI with its driver replaced by an async one"""
+    scheme, separator, rest = uri.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        return uri
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+
+def init_async_db(database_uri, engine_options=None):
+    """
+    Creates the async engine and the factory of its sessions
+
+    Args:
+        database_uri (str): the URI of the database, with a sync or async driver
+        engine_options (dict): the pool settings, as in SQLALCHEMY_ENGINE_OPTIONS
+
+    Returns:
+        tuple: the engine, to dispose of on shutdown, and the session factory
+    """
+    uri = async_database_uri(database_uri)
+    logger.info("Initializing async Wishlists database with %s", uri.partition("://")[0])
+    engine = create_async_engine(uri, **(engine_options or {}))
+    return engine, async_sessionmaker(engine, expire_on_commit=False)
+
+
+######################################################################
+#  W I S H L I S T   F I N D E R S
+######################################################################
+async def find_wishlist(session, by_id):
+    """ Finds a Wishlist, with its products, by its id """
+    logger.info("Processing async lookup for Wishlist with id %s ...", by_id)
+    return await session.get(Wishlist, by_id, options=[selectinload(Wishlist.wishlist_products)])
+
+
+async def find_wishlist_version(session, by_id):
+    """ Finds the version and last update time of a Wishlist without loading it """
+    logger.info("Processing async version lookup for Wishlist with id %s ...", by_id)
+    return (await session.execute(Wishlist._version_statement(by_id))).first()
+
+
+async def find_wishlist_row(session, by_id):
+    """
+    Finds a serialized Wishlist and its version, read with SQLAlchemy Core
+
+    Returns:
+        tuple: the serialized Wishlist, its version and its last update
+        time, or None if there is no such Wishlist
+    """
+    logger.info("Processing async row lookup for Wishlist with id %s ...", by_id)
+    row = (await session.execute(Wishlist._row_statement(by_id))).mappings().first()
+    if row is None:
+        return None
+    wishlist = {name: row[name] for name in WISHLIST_COLUMNS}
+    wishlist["wishlist_products"] = (await product_rows_by_wishlist(session, [by_id])).get(by_id, [])
+    return wishlist, row["version"], row["last_updated"]
+
+
+async def wishlist_rows_page(session, after=None, limit=None, **filters):
+    """ Returns a page of serialized Wishlists ordered by id, see Wishlist.rows_page() """
+    logger.info("Processing async row page query for Wishlists after id %s ...", after)
+    result = await session.execute(Wishlist._rows_page_statement(after, limit, **filters))
+    wishlists = [dict(row) for row in result.mappings()]
+    products = await product_rows_by_wishlist(session, [wishlist["id"] for wishlist in wishlists])
+    for wishlist in wishlists:
+        wishlist["wishlist_products"] = products.get(wishlist["id"], [])
+    return wishlists
+
+
+async def wishlist_summary_rows(session, after=None, limit=None, **filters):
+    """ Returns a page of Wishlist summaries ordered by id, see Wishlist.summary_rows() """
+    logger.info("Processing async summary query for Wishlists after id %s ...", after)
+    return (await session.execute(Wishlist._summary_statement(after, limit, **filters))).all()
+
+
+######################################################################
+#  W I S H L I S T   M U T A T O R S
+######################################################################
+async def create_wishlist(session, wishlist):
+    """ Creates a Wishlist, and the products it holds, in the database """
+    logger.info("Creating wishlist %s", wishlist.wishlist_name)
+    wishlist.id = None
+    session.add(wishlist)
+    await _commit_unique_name(session, wishlist.wishlist_name)
+    # A new Wishlist holds no other products than its own, but an empty
+    # collection is left unloaded by the flush and serialize() would lazy load it
+    if "wishlist_products" in inspect(wishlist).unloaded:
+        set_committed_value(wishlist, "wishlist_products", [])
+
+
+async def update_wishlist(session, wishlist):
+    """ Updates a Wishlist in the database """
+    logger.info("Saving wishlist %s", wishlist.wishlist_name)
+    wishlist.version = Wishlist.version + 1
+    wishlist.last_updated = utcnow()
+    await _commit_unique_name(session, wishlist.wishlist_name)
+
+
+async def delete_wishlist(session, wishlist):
+    """ Removes a Wishlist from the data store """
+    logger.info("Deleting wishlist %s", wishlist.wishlist_name)
+    await session.delete(wishlist)
+    await session.commit()
+
+
+async def touch_wishlists(session, ids):
+    """ Bumps the version of Wishlists whose products changed, in the current transaction """
+    for start in range(0, len(ids), ROWS_IN_CHUNK_SIZE):
+        await session.execute(
+            Wishlist._touch_statement(ids[start:start + ROWS_IN_CHUNK_SIZE]),
+            execution_options={"synchronize_session": False},
+        )
+
+
+async def _commit_unique_name(session, name):
+    """Commits the session, turning a duplicate name into a DataConflictError"""
+    try:
+        await session.commit()
+    except IntegrityError as error:
+        await session.rollback()
+        if not is_name_conflict(error):
+            raise
+        raise DataConflictError(f"Wishlist with name '{name}' already exists.") from error
+
+
+######################################################################
+#  P R O D U C T   F I N D E R S
+######################################################################
+async def find_product(session, by_id):
+    """ Finds a Product by its id """
+    logger.info("Processing async lookup for Product with id %s ...", by_id)
+    return await session.get(Product, by_id)
+
+
+async def find_product_with_version(session, by_id):
+    """ Finds a Product together with the version of its Wishlist, see Product.find_with_version() """
+    logger.info("Processing async versioned lookup for Product with id %s ...", by_id)
+    return (await session.execute(Product._with_version_statement(by_id))).first()
+
+
+async def product_rows_by_wishlist(session, wishlist_ids):
+    """ Reads the products of Wishlists as plain dictionaries, see Product.rows_by_wishlist() """
+    products = {}
+    for statement in Product._rows_by_wishlist_statements(wishlist_ids):
+        for row in (await session.execute(statement)).mappings():
+            products.setdefault(row["wishlist_id"], []).append(dict(row))
+    return products
+
+
+async def product_rows_page(session, wishlist_id, sort="id", after=None, limit=None, **filters):
+    """ Returns a page of the serialized products of a Wishlist, see Product.rows_page() """
+    logger.info("Processing async row page query for Products of Wishlist %s sorted by %s ...", wishlist_id, sort)
+    result = await session.execute(Product._rows_page_statement(wishlist_id, sort, after, limit, **filters))
+    return [dict(row) for row in result.mappings()]
+
+
+async def find_wishlist_owners(session, by_product_id, after=None, limit=None):
+    """ Returns the ids and owners of the Wishlists that contain a SKU """
+    logger.info("Processing async owner query for Wishlists with product_id %s ...", by_product_id)
+    return (await session.execute(Product._wishlist_owners(by_product_id, after, limit))).all()
+
+
+######################################################################
+#  P R O D U C T   M U T A T O R S
+######################################################################
+async def create_product(session, product):
+    """ Adds a Product to its Wishlist """
+    logger.info("Adding product %s to wishlist %d", product.product_name, product.wishlist_id)
+    product.id = None
+    session.add(product)
+    await touch_wishlists(session, [product.wishlist_id])
+    await session.commit()
+
+
+async def bulk_create_products(session, products):
+    """ Creates many Products with a single INSERT, see Product.bulk_create() """
+    logger.info("Adding %d products in bulk", len(products))
+    created = (await session.scalars(insert(Product).returning(Product), Product._insert_rows(products))).all()
+    await touch_wishlists(session, sorted({product.wishlist_id for product in products}))
+    await session.commit()
+    return sorted(created, key=lambda product: product.id)
+
+
+async def update_product(session, product):
+    """ Saves the changes made to a Product """
+    logger.info("Saving product %s in wishlist %d", product.product_name, product.wishlist_id)
+    await touch_wishlists(session, [product.wishlist_id])
+    await session.commit()
+
+
+async def delete_product(session, product):
+    """ Removes a Product from its Wishlist """
+    logger.info("Deleting product %s from wishlist %d", product.product_name, product.wishlist_id)
+    await session.delete(product)
+    await touch_wishlists(session, [product.wishlist_id])
+    await session.commit()
+
+
+async def reprice_products(session, prices):
+    """
+    Sets the price, and optionally the name, of every Product with the given SKUs
+
+    See Product.reprice() for the arguments and the result.
+    """
+    changes = Product._price_changes(prices)
+    logger.info("Repricing %d SKUs", len(changes))
+    for statement, rows in Product._reprice_statements(changes):
+        await session.execute(statement, rows)
+    owners = []
+    for statement in Product._sku_owner_statements(list(changes)):
+        owners.extend((await session.scalars(statement)).all())
+    wishlist_ids = sorted(set(owners))
+    await touch_wishlists(session, wishlist_ids)
+    await session.commit()
+    return len(owners), wishlist_ids
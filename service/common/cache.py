@@ -0,0 +1,166 @@
+"""
+Wishlist Cache
+
+This module contains the read-through cache of serialized Wishlists, stored
+together with the version they were serialized at. The backend is chosen
+with the CACHE_BACKEND setting:
+
+    memory           an in-process LRU cache with a time-to-live (default)
+    none             no caching at all
+    package.module:Class
+                     any class implementing CacheBackend, e.g. a client for
+                     a cache shared by every worker
+
+The in-process cache is per worker, and the other workers or the ASGI app
+may change a Wishlist without deleting its entry here. Callers therefore
+check the version of an entry against the database before serving it, see
+read_wishlist() in service.routes: a hit saves loading and serializing the
+products, not the round trip to the database.
+"""
+import importlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+logger = logging.getLogger("flask.app")
+
+EXTENSION_NAME = "wishlist_cache"
+
+
+class CacheBackend:
+    """
+    Interface that every cache backend implements
+
+    Values are the entries handed to set(). Callers must not modify the
+    values they get back.
+    """
+
+    def get(self, key):
+        """Returns the value stored for key, or None on a miss"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """Stores value under key"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Removes key, if present"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes every key"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Returns the hit, miss and eviction counters"""
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """A cache that never stores anything"""
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "none", "hits": 0, "misses": self.misses, "evictions": 0, "expirations": 0, "size": 0}
+
+
+class LRUCache(CacheBackend):
+    """
+    An in-process cache with least-recently-used eviction and a time-to-live
+
+    Args:
+        max_size (int): the number of entries kept before evicting the oldest
+        ttl (float): the number of seconds an entry stays valid
+        clock (callable): the time source, in seconds
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+            }
+
+
+def init_cache(app):
+    """Creates the cache backend configured for the app"""
+    name = app.config.get("CACHE_BACKEND", "memory")
+    if name == "memory":
+        backend = LRUCache(app.config["CACHE_MAX_SIZE"], app.config["CACHE_TTL"])
+    elif name == "none":
+        backend = NullCache()
+    else:
+        module_name, _, class_name = name.partition(":")
+        backend = getattr(importlib.import_module(module_name), class_name)()
+    app.extensions[EXTENSION_NAME] = backend
+    logger.info("Wishlist cache backend: %s", type(backend).__name__)
+    return backend
+
+
+def get_cache() -> CacheBackend:
+    """Returns the cache backend of the current app"""
+    return current_app.extensions[EXTENSION_NAME]
@@ -1,8 +1,14 @@
 """
 Flask CLI Command Extensions
 """
-from service import app
-from service.models import db
+import csv
+import time
+import click
+from service import app, migrations
+from service.models import db, Product, DataValidationError
+from service.common.cache import get_cache
+from service.common.datagen import DISTRIBUTIONS, generate_wishlists
+from service.common.ndjson import dump_wishlists, load_wishlists
 
 
 ######################################################################
@@ -19,3 +25,180 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+    migrations.stamp()
+
+
+######################################################################
+# Command to apply pending schema migrations
+# Usage:
+#   flask db-upgrade [--version N]
+######################################################################
+@app.cli.command("db-upgrade")
+@click.option("--version", "target", type=int, default=None, help="Schema version to upgrade to (default: latest)")
+def db_upgrade(target):
+    """
+    Applies the pending schema migrations. Safe to run on production
+    """
+    try:
+        applied = migrations.upgrade(target)
+    except migrations.MigrationError as error:
+        raise click.ClickException(str(error)) from error
+    click.echo(f"Applied migrations: {applied or 'none'}")
+    click.echo(f"Schema version: {migrations.current_version()}")
+
+
+######################################################################
+# Command to revert schema migrations
+# Usage:
+#   flask db-downgrade --version N
+######################################################################
+@app.cli.command("db-downgrade")
+@click.option("--version", "target", type=int, required=True, help="Schema version to downgrade to")
+def db_downgrade(target):
+    """
+    Reverts the schema migrations applied after the given version
+    """
+    reverted = migrations.downgrade(target)
+    click.echo(f"Reverted migrations: {reverted or 'none'}")
+    click.echo(f"Schema version: {migrations.current_version()}")
+
+
+######################################################################
+# Command to show the schema version
+# Usage:
+#   flask db-version
+######################################################################
+@app.cli.command("db-version")
+def db_version():
+    """
+    Shows the current and latest schema versions
+    """
+    current = migrations.current_version()
+    click.echo(f"Schema version: {current} (latest: {migrations.head()})")
+    for migration in migrations.MIGRATIONS:
+        if migration.version > current:
+            click.echo(f"  pending {migration.version}: {migration.description}")
+
+
+######################################################################
+# Command to export every wishlist as newline-delimited JSON
+# Usage:
+#   flask wishlists-export [--output FILE] [--chunk-size N]
+######################################################################
+@app.cli.command("wishlists-export")
+@click.option("--output", type=click.File("w"), default="-", help="File to write to (default: stdout)")
+@click.option("--chunk-size", type=int, default=None, help="Wishlists read per database round trip")
+def wishlists_export(output, chunk_size):
+    """
+    Streams every wishlist and its products as newline-delimited JSON
+    """
+    for line in dump_wishlists(chunk_size or app.config["EXPORT_CHUNK_SIZE"]):
+        output.write(line)
+
+
+######################################################################
+# Command to import wishlists from newline-delimited JSON
+# Usage:
+#   flask wishlists-import FILE [--chunk-size N]
+######################################################################
+@app.cli.command("wishlists-import")
+@click.argument("source", type=click.File("r"))
+@click.option("--chunk-size", type=int, default=None, help="Wishlists written per transaction")
+def wishlists_import(source, chunk_size):
+    """
+    Creates the wishlists read from a newline-delimited JSON file
+    """
+    def report(line, message):
+        click.echo(f"line {line}: {message}", err=True)
+
+    imported, failed = load_wishlists(source, chunk_size or app.config["IMPORT_CHUNK_SIZE"], report)
+    click.echo(f"Imported {imported} wishlists, rejected {failed} lines")
+
+
+######################################################################
+# Command to generate synthetic wishlists for load tests
+# Usage:
+#   flask wishlists-generate COUNT [--products MEAN] [--distribution NAME]
+#       [--skus N] [--sku-skew S] [--archived-ratio R] [--users N] [--seed N]
+#       [--chunk-size N]
+######################################################################
+@app.cli.command("wishlists-generate")
+@click.argument("count", type=click.IntRange(min=1))
+@click.option("--products", type=click.FloatRange(min=0), default=5.0, help="Mean number of products per wishlist")
+@click.option("--distribution", type=click.Choice(DISTRIBUTIONS), default="poisson",
+              help="Distribution of the products per wishlist around the mean")
+@click.option("--skus", type=click.IntRange(min=1), default=10000, help="Number of distinct SKUs")
+@click.option("--sku-skew", type=click.FloatRange(min=0), default=1.0,
+              help="Zipf exponent of the SKU popularity, 0 for uniform")
+@click.option("--archived-ratio", type=click.FloatRange(0, 1), default=0.5, help="Share of archived wishlists")
+@click.option("--users", type=click.IntRange(min=1), default=None, help="Number of owners (default: COUNT / 3)")
+@click.option("--seed", type=int, default=0, help="Seed of the random generator")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=None, help="Wishlists written per transaction")
+def wishlists_generate(count, products, distribution, skus, sku_skew, archived_ratio, users, seed, chunk_size):
+    """
+    Creates COUNT synthetic wishlists with their products, for load tests
+    """
+    start = time.perf_counter()
+    wishlists, created = generate_wishlists(
+        count, products=products, distribution=distribution, skus=skus, skew=sku_skew,
+        archived_ratio=archived_ratio, users=users, seed=seed, chunk_size=chunk_size or app.config["IMPORT_CHUNK_SIZE"],
+    )
+    click.echo(f"Generated {wishlists} wishlists with {created} products in {time.perf_counter() - start:.1f}s")
+
+
+######################################################################
+# Command to change the price of SKUs in every wishlist
+# Usage:
+#   flask skus-reprice --sku SKU --price PRICE [--name NAME]
+#   flask skus-reprice --file FILE [--chunk-size N]
+######################################################################
+@app.cli.command("skus-reprice")
+@click.option("--sku", type=int, default=None, help="SKU to reprice")
+@click.option("--price", type=float, default=None, help="New price of the SKU")
+@click.option("--name", default=None, help="New name of the SKU (default: unchanged)")
+@click.option("--file", "source", type=click.File("r"), default=None,
+              help="CSV file with product_id, product_price and optional product_name columns")
+@click.option("--chunk-size", type=int, default=None, help="SKUs repriced per transaction")
+def skus_reprice(sku, price, name, source, chunk_size):
+    """
+    Changes the price, and optionally the name, of SKUs in every wishlist
+
+    Only the caches this process can reach are invalidated. Running workers
+    still detect the change on their next read: Product.reprice() bumps the
+    version of the Wishlists it touches, and read_wishlist checks that version
+    on every cache hit.
+    """
+    if source is None and (sku is None or price is None):
+        raise click.UsageError("Give either --sku and --price, or --file")
+    if source is None:
+        prices = [{"product_id": sku, "product_price": price, "product_name": name}]
+    else:
+        prices = _read_prices(source)
+
+    chunk_size = chunk_size or app.config["REPRICE_CHUNK_SIZE"]
+    cache = get_cache()
+    total = 0
+    for start in range(0, len(prices), chunk_size):
+        try:
+            updated, wishlist_ids = Product.reprice(prices[start:start + chunk_size])
+        except DataValidationError as error:
+            raise click.ClickException(str(error)) from error
+        for wishlist_id in wishlist_ids:
+            cache.delete(wishlist_id)
+        total += updated
+    click.echo(f"Repriced {len(prices)} SKUs, updated {total} products")
+
+
+def _read_prices(source):
+    """Reads the new prices of SKUs from a CSV file with a header row"""
+    prices = []
+    for line_no, row in enumerate(csv.DictReader(source), start=2):
+        try:
+            prices.append({
+                "product_id": int(row["product_id"]),
+                "product_price": float(row["product_price"]),
+                "product_name": row.get("product_name") or None,
+            })
+        except (KeyError, TypeError, ValueError) as error:
+            raise click.ClickException(f"line {line_no}: invalid price row {row}") from error
+    return prices
@@ -0,0 +1,176 @@
+"""
+Synthetic Data
+
+This module generates large, realistic datasets of Wishlists for load tests
+and benchmarks. The rows mirror what tests/factories.py builds one at a
+time (random owners, word names, SKUs with positive prices, archived or
+not), but are written in bulk: COPY on Postgres, executemany elsewhere,
+one transaction per chunk of Wishlists.
+
+The shape of the data is configurable:
+
+    products per wishlist   "fixed", "uniform" (0 to twice the mean),
+                            "poisson" or "geometric" (long tail) around
+                            a mean
+    SKU popularity          a Zipf distribution over the SKUs: SKU 1 is
+                            the most popular, and a skew of 0 makes them
+                            all equally likely
+    archived ratio          the share of archived Wishlists
+
+The same seed generates the same rows, provided the wishlist table starts
+out with the same ids: new Wishlists take the ids after the highest one.
+Run it against a database the service is not writing to.
+"""
+import csv
+import io
+import itertools
+import logging
+import math
+import random
+from sqlalchemy import func, select, text
+from service.models import db, Wishlist, Product, utcnow
+
+logger = logging.getLogger("flask.app")
+
+DISTRIBUTIONS = ("fixed", "uniform", "poisson", "geometric")
+
+# The words of the Wishlist and Product names, like the Faker words of the factories
+WORDS = (
+    "apple", "birthday", "camping", "desk", "garden", "gift", "holiday", "house", "kitchen", "later",
+    "music", "office", "outdoor", "party", "reading", "school", "shoes", "sport", "summer", "travel",
+    "toys", "wedding", "winter", "work",
+)
+
+WISHLIST_COLUMNS = ("id", "user_id", "wishlist_name", "archived", "version", "last_updated")
+PRODUCT_COLUMNS = ("wishlist_id", "product_id", "product_name", "product_price")
+
+
+def products_per_wishlist(rng, distribution, mean):
+    """Draws the number of products of a Wishlist"""
+    if distribution == "fixed" or mean <= 0:
+        return max(int(mean), 0)
+    if distribution == "uniform":
+        return rng.randint(0, round(2 * mean))
+    if distribution == "geometric":
+        # Failures before the first success, with a mean of mean
+        return int(math.log(1.0 - rng.random()) / math.log(mean / (mean + 1.0)))
+    if distribution == "poisson":
+        if mean > 30:
+            return max(round(rng.gauss(mean, math.sqrt(mean))), 0)
+        # Knuth's method: count the uniform draws until their product drops below e^-mean
+        limit, count, product = math.exp(-mean), 0, rng.random()
+        while product > limit:
+            count += 1
+            product *= rng.random()
+        return count
+    raise ValueError(f"Unknown distribution '{distribution}', expected one of {DISTRIBUTIONS}")
+
+
+def sku_weights(skus, skew):
+    """Returns the cumulative Zipf weights of the SKUs 1 to skus"""
+    return list(itertools.accumulate(1.0 / rank ** skew for rank in range(1, skus + 1)))
+
+
+def draw_skus(rng, cum_weights, count):
+    """Draws count distinct SKUs, the popular ones more often"""
+    population = range(1, len(cum_weights) + 1)
+    count = min(count, len(population))
+    drawn = set()
+    for _ in range(10):
+        drawn.update(rng.choices(population, cum_weights=cum_weights, k=count - len(drawn)))
+        if len(drawn) == count:
+            return sorted(drawn)
+    # A skew too steep for this many distinct SKUs: fill in with the others
+    rest = rng.sample(sorted(set(population) - drawn), count - len(drawn))
+    return sorted(drawn.union(rest))
+
+
+def generate_wishlists(
+    count, products=5, distribution="poisson", skus=10000, skew=1.0, archived_ratio=0.5, users=None, seed=0,
+    chunk_size=1000,
+):
+    """
+    Generates Wishlists with their products, writing chunk_size Wishlists per transaction
+
+    Args:
+        count (int): the number of Wishlists to create
+        products (float): the mean number of products per Wishlist
+        distribution (str): the distribution of the products per Wishlist, one of DISTRIBUTIONS
+        skus (int): the number of distinct SKUs
+        skew (float): the exponent of the Zipf popularity of the SKUs, 0 for uniform
+        archived_ratio (float): the share of archived Wishlists, between 0 and 1
+        users (int): the number of distinct owners (default: a third of count)
+        seed (int): the seed of the random generator
+        chunk_size (int): the number of Wishlists written per transaction
+
+    Returns:
+        tuple: the numbers of Wishlists and Products created
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}', expected one of {DISTRIBUTIONS}")
+    rng = random.Random(seed)
+    users = users or max(count // 3, 1)
+    cum_weights = sku_weights(skus, skew)
+    # Every SKU has one name and one price, as in a catalog
+    catalog = [(f"{rng.choice(WORDS)}-{sku}", round(rng.uniform(1, 500), 2)) for sku in range(skus + 1)]
+
+    first_id = (db.session.scalar(select(func.max(Wishlist.id))) or 0) + 1
+    logger.info("Generating %d wishlists from id %d with seed %d", count, first_id, seed)
+    created = 0
+    for start in range(first_id, first_id + count, chunk_size):
+        wishlists = []
+        rows = []
+        for wishlist_id in range(start, min(start + chunk_size, first_id + count)):
+            wishlists.append((
+                wishlist_id, rng.randrange(1, users + 1), f"{rng.choice(WORDS)}-{wishlist_id}",
+                rng.random() < archived_ratio,
+            ))
+            size = products_per_wishlist(rng, distribution, products)
+            rows.extend(
+                (wishlist_id, sku, *catalog[sku]) for sku in draw_skus(rng, cum_weights, size)
+            )
+        _write_chunk(wishlists, rows)
+        created += len(rows)
+    _advance_sequences()
+    logger.info("Generated %d wishlists with %d products", count, created)
+    return count, created
+
+
+def _write_chunk(wishlists, products):
+    """Writes the rows of a chunk of Wishlists and their Products in one transaction"""
+    now = utcnow()
+    wishlists = [(*wishlist, 1, now) for wishlist in wishlists]
+    write = _copy if db.engine.dialect.name == "postgresql" else _executemany
+    write(Wishlist.__tablename__, WISHLIST_COLUMNS, wishlists)
+    if products:
+        write(Product.__tablename__, PRODUCT_COLUMNS, products)
+    db.session.commit()
+
+
+def _executemany(table, columns, rows):
+    """Writes rows to a table with one executemany, in the transaction of the session"""
+    # The rows are sent as they are: the ORM bulk insert would spend twice as long
+    # as the driver preparing its parameters
+    marker = "?" if db.engine.dialect.paramstyle == "qmark" else "%s"
+    db.session.connection().exec_driver_sql(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([marker] * len(columns))})", rows
+    )
+
+
+def _copy(table, columns, rows):
+    """Writes rows to a table with COPY, in the transaction of the session"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = db.session.connection().connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _advance_sequences():
+    """Moves the id sequence of Postgres past the ids given explicitly"""
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence('wishlist', 'id'), (SELECT max(id) FROM wishlist))"))
+        db.session.commit()
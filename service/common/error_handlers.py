@@ -18,7 +18,7 @@
 Module: error_handlers
 """
 from flask import jsonify
-from service.models import DataValidationError
+from service.models import DataValidationError, DataConflictError
 from service import app
 from . import status
 
@@ -32,6 +32,19 @@ def request_validation_error(error):
     return bad_request(error)
 
 
+@app.errorhandler(DataConflictError)
+def request_conflict_error(error):
+    """Handles changes that conflict with existing data with 409_CONFLICT"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(
+            status=status.HTTP_409_CONFLICT, error="Conflict", message=message
+        ),
+        status.HTTP_409_CONFLICT,
+    )
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
@@ -0,0 +1,201 @@
+"""
+Request Metrics
+
+This module records Prometheus metrics for every request served by the
+Flask app, labelled with the handler that served it: the flask-restx
+resource and method (e.g. WishlistResource.get) or the view function.
+
+    http_request_duration_seconds        latency histogram
+    http_requests_total                  requests, by status code
+    http_requests_in_progress            requests being served
+    db_statements_per_request            SQL statements run per request
+    db_seconds_per_request               time spent in SQL per request
+    db_repeated_statements_per_request   statements run again in a request
+
+all of them prefixed with "wishlists_".
+
+The latency and database metrics cover the whole request, streamed bodies
+included. SQL statements are counted with engine events, so statements run
+outside of a request (CLI commands, warm-up) are not recorded. The
+statements of a request are then checked against the query budget of its
+handler, see service.common.query_budget.
+
+Each gunicorn worker keeps its own metrics. When PROMETHEUS_MULTIPROC_DIR
+is set, before the workers start, they write them to files in that
+directory and render() aggregates the files of every worker, so that
+/metrics returns the same totals whichever worker answers. gunicorn.conf.py
+empties the directory when the server starts and drops the in-progress
+gauges of dead workers.
+"""
+import os
+import time
+from collections import Counter as StatementCounter
+from flask import current_app, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from service.common.query_budget import budget_of, check_budget
+
+NAMESPACE = "wishlists"
+
+# The handler of requests that matched no route (404, 405)
+UNMATCHED = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of the requests, from the first before_request hook to the end of the body",
+    ["handler"],
+    namespace=NAMESPACE,
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS = Counter(
+    "http_requests",
+    "Requests served, by status code",
+    ["handler", "status"],
+    namespace=NAMESPACE,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being served",
+    ["handler"],
+    namespace=NAMESPACE,
+    multiprocess_mode="livesum",
+)
+DB_STATEMENTS = Histogram(
+    "db_statements_per_request",
+    "SQL statements run to serve a request",
+    ["handler"],
+    namespace=NAMESPACE,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+DB_TIME = Histogram(
+    "db_seconds_per_request",
+    "Time spent running SQL statements to serve a request",
+    ["handler"],
+    namespace=NAMESPACE,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_REPEATS = Histogram(
+    "db_repeated_statements_per_request",
+    "SQL statements run again by a request with the same text, the signature of N+1 queries",
+    ["handler"],
+    namespace=NAMESPACE,
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100),
+)
+
+
+class RequestMetrics:
+    """The measurements of the request being served, kept in flask.g"""
+
+    __slots__ = ("handler", "budget", "start", "status", "statements", "db_time")
+
+    def __init__(self, handler, budget=None):
+        self.handler = handler
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.status = None
+        # The number of times each statement was run
+        self.statements = StatementCounter()
+        self.db_time = 0.0
+
+
+def init_metrics(app):
+    """Records the metrics of every request served by the app"""
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_end_request)
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        # Listening on the Engine class covers engines created after this call
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def find_handler():
+    """Returns the name and the function of the resource method or view function of the request"""
+    view = current_app.view_functions.get(request.endpoint)
+    if view is None:
+        return UNMATCHED, None
+    view_class = getattr(view, "view_class", None)
+    if view_class is None:
+        return view.__name__, view
+    method = request.method.lower()
+    handler = getattr(view_class, method, None)
+    if handler is None and method == "head":
+        handler = getattr(view_class, "get", None)
+    return f"{view_class.__name__}.{method}", handler
+
+
+def render():
+    """
+    Returns the metrics in the Prometheus text format, with their content type
+
+    In multiprocess mode, the metrics of every worker are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+######################################################################
+#  R E Q U E S T   H O O K S
+######################################################################
+def _start_request():
+    """Starts measuring a request"""
+    name, handler = find_handler()
+    g.request_metrics = RequestMetrics(name, budget_of(handler))
+    REQUESTS_IN_PROGRESS.labels(g.request_metrics.handler).inc()
+
+
+def _record_status(response):
+    """Remembers the status code of the response"""
+    metrics = g.get("request_metrics")
+    if metrics is not None:
+        metrics.status = response.status_code
+    return response
+
+
+def _end_request(error=None):
+    """Records the measurements of a request once its body has been sent, and checks its budget"""
+    metrics = g.pop("request_metrics", None)
+    if metrics is None:
+        # An earlier before_request hook failed before the request was measured
+        return
+    if metrics.status is None:
+        metrics.status = 500 if error is not None else 200
+    REQUESTS_IN_PROGRESS.labels(metrics.handler).dec()
+    REQUEST_LATENCY.labels(metrics.handler).observe(time.perf_counter() - metrics.start)
+    REQUESTS.labels(metrics.handler, str(metrics.status)).inc()
+    total = sum(metrics.statements.values())
+    DB_STATEMENTS.labels(metrics.handler).observe(total)
+    DB_TIME.labels(metrics.handler).observe(metrics.db_time)
+    DB_REPEATS.labels(metrics.handler).observe(total - len(metrics.statements))
+    check_budget(metrics.handler, metrics.budget, metrics.statements, current_app.config.get("QUERY_BUDGET", "warn"))
+
+
+######################################################################
+#  E N G I N E   E V E N T S
+######################################################################
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Notes when a statement starts"""
+    context.metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=unused-argument
+    """Adds a statement and its duration to the request it was run for"""
+    if has_request_context():
+        metrics = g.get("request_metrics")
+        if metrics is not None:
+            metrics.statements[statement] += 1
+            metrics.db_time += time.perf_counter() - context.metrics_start
@@ -0,0 +1,134 @@
+"""
+NDJSON Bulk Data
+
+This module contains the functions that stream Wishlists to and from
+newline-delimited JSON (one Wishlist object per line), so that the whole
+dataset never has to be held in memory at once.
+"""
+import json
+import logging
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+from service.models import db, Wishlist, Product, DataValidationError
+
+logger = logging.getLogger("flask.app")
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def dump_wishlists(chunk_size):
+    """
+    Generates every Wishlist, with its products, as one line of JSON
+
+    Args:
+        chunk_size (int): the number of Wishlists read per database round trip
+    """
+    for wishlist in Wishlist.iter_all(chunk_size):
+        yield json.dumps(wishlist.serialize(), separators=(",", ":")) + "\n"
+
+
+def dump_wishlist_owners(product_id, chunk_size):
+    """
+    Generates the id and owner of every Wishlist containing a SKU, as one line of JSON
+
+    Args:
+        product_id (int): the SKU of the product
+        chunk_size (int): the number of Wishlists read per database round trip
+    """
+    for row in Product.iter_wishlist_owners(product_id, chunk_size):
+        yield json.dumps({"wishlist_id": row.wishlist_id, "user_id": row.user_id}, separators=(",", ":")) + "\n"
+
+
+def load_wishlists(lines, chunk_size, on_error=None):
+    """
+    Imports Wishlists, with their products, from lines of JSON
+
+    Lines are parsed one at a time and validated with Wishlist.deserialize.
+    Valid Wishlists are written chunk_size at a time, one transaction per
+    chunk. Name conflicts are resolved for a whole chunk with a single query
+    against the unique wishlist_name index. Invalid or conflicting lines are
+    reported to on_error and skipped; they never abort the import. A chunk
+    that the database still refuses is written again one line at a time, so
+    that only the lines at fault are rejected.
+
+    Args:
+        lines (iterable): lines of JSON, as str or bytes
+        chunk_size (int): the number of Wishlists written per transaction
+        on_error (callable): called with the line number and an error message
+
+    Returns:
+        tuple: the number of Wishlists imported and the number of lines rejected
+    """
+    imported = failed = 0
+
+    def reject(line_no, message):
+        nonlocal failed
+        failed += 1
+        if on_error:
+            on_error(line_no, message)
+
+    chunk = []
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            wishlist = Wishlist().deserialize(json.loads(line))
+        except (ValueError, DataValidationError) as error:
+            reject(line_no, str(error))
+            continue
+        chunk.append((line_no, wishlist))
+        if len(chunk) >= chunk_size:
+            imported += _write_chunk(chunk, reject)
+            chunk = []
+    if chunk:
+        imported += _write_chunk(chunk, reject)
+    logger.info("Imported %d wishlists, rejected %d lines", imported, failed)
+    return imported, failed
+
+
+def _write_chunk(chunk, reject):
+    """Writes a chunk of (line number, Wishlist) pairs in one transaction"""
+    names = [wishlist.wishlist_name for _, wishlist in chunk]
+    taken = set(db.session.scalars(select(Wishlist.wishlist_name).where(Wishlist.wishlist_name.in_(names))))
+    accepted = []
+    for line_no, wishlist in chunk:
+        if wishlist.wishlist_name in taken:
+            reject(line_no, f"Wishlist with name '{wishlist.wishlist_name}' already exists")
+            continue
+        taken.add(wishlist.wishlist_name)
+        accepted.append((line_no, wishlist))
+    if not accepted:
+        db.session.rollback()
+        return 0
+
+    try:
+        rows = db.session.execute(
+            insert(Wishlist).returning(Wishlist.id, Wishlist.wishlist_name),
+            [
+                {"user_id": wishlist.user_id, "wishlist_name": wishlist.wishlist_name, "archived": wishlist.archived}
+                for _, wishlist in accepted
+            ],
+        )
+        ids = {name: wishlist_id for wishlist_id, name in rows}
+        products = [
+            {
+                "wishlist_id": ids[wishlist.wishlist_name],
+                "product_id": product.product_id,
+                "product_name": product.product_name,
+                "product_price": product.product_price,
+            }
+            for _, wishlist in accepted
+            for product in wishlist.wishlist_products
+        ]
+        if products:
+            db.session.execute(insert(Product), products)
+        db.session.commit()
+    except DBAPIError as error:
+        # Another writer took one of the names after the check, or a value the
+        # validation let through does not fit its column
+        db.session.rollback()
+        if len(accepted) == 1:
+            reject(accepted[0][0], f"Wishlist could not be written: {error.orig}")
+            return 0
+        return sum(_write_chunk([entry], reject) for entry in accepted)
+    return len(accepted)
@@ -0,0 +1,73 @@
+"""
+Pagination helpers
+
+This module contains the utility functions used to build keyset (cursor)
+paginated collections. Cursors are opaque to clients: they are the
+url-safe base64 encoding of the sort key of the last row on a page.
+"""
+import base64
+import binascii
+import json
+
+
+def encode_cursor(*key) -> str:
+    """Encodes the sort key of the last row of a page into an opaque cursor"""
+    raw = json.dumps(list(key), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> list:
+    """
+    Decodes an opaque cursor back into its sort key
+
+    Args:
+        cursor (str): the cursor previously returned by encode_cursor()
+        types (type): the expected type of each value of the sort key
+
+    Raises:
+        ValueError: if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor '{cursor}'") from error
+    if not isinstance(key, list) or len(key) != len(types):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    for value, expected in zip(key, types):
+        # bool is a subclass of int, but never a valid sort key
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError(f"Invalid cursor '{cursor}'")
+    return key
+
+
+def keyset_cursor(row, sort="id") -> str:
+    """Encodes the cursor after a row sorted by one of its columns, with ties broken by id"""
+    if sort == "id":
+        return encode_cursor(row["id"])
+    return encode_cursor(row[sort], row["id"])
+
+
+def parse_page_args(args, default_limit, max_limit, *types) -> tuple:
+    """
+    Returns the page size and the decoded 'after' cursor of a paginated request
+
+    Args:
+        args (dict): the 'limit' and 'after' query string arguments, None when not given
+        default_limit (int): the page size when no limit is given
+        max_limit (int): the largest page size a client may ask for
+        types (type): the expected type of each value of the sort key
+
+    Raises:
+        ValueError: if the limit is out of range or the cursor is malformed
+    """
+    limit = args["limit"] if args["limit"] is not None else default_limit
+    if not 0 < limit <= max_limit:
+        raise ValueError(f"limit must be between 1 and {max_limit}")
+    after = decode_cursor(args["after"], *types) if args["after"] else None
+    return limit, after
+
+
+def link_header(next_url: str) -> str:
+    """Formats an RFC 8288 Link header pointing to the next page"""
+    return f'<{next_url}>; rel="next"'
@@ -0,0 +1,103 @@
+"""
+SQL Query Budgets
+
+Every route declares the most SQL statements one of its requests may run,
+with the query_budget decorator:
+
+    @query_budget(2)
+    def get(self, wishlist_id):
+        ...
+
+The statements of each request are counted by service.common.metrics and
+checked against the budget of its handler once the body has been sent. The
+QUERY_BUDGET setting chooses what happens to a request over its budget:
+
+    off     nothing
+    warn    a warning is logged (default)
+    raise   QueryBudgetExceeded is raised, which fails the test that made
+            the request
+
+Both the warning and the exception list the statements that the request
+ran more than once: the same statement run again and again with different
+parameters is the signature of an N+1 query, e.g. loading a relationship
+once per row. Executing a statement with many sets of parameters at once
+(executemany) counts as one statement.
+
+A budget of None declares a route whose statements grow with the size of
+its body, like the chunked exports and imports.
+"""
+import logging
+from collections import Counter
+
+logger = logging.getLogger("flask.app")
+
+# The attribute holding the budget of a handler
+BUDGET = "__query_budget__"
+
+# The QUERY_BUDGET modes
+MODES = ("off", "warn", "raise")
+
+# The number of repeated statements listed in a report
+REPEATS_REPORTED = 3
+
+
+class QueryBudgetExceeded(Exception):
+    """ Raised when a request runs more SQL statements than its budget """
+
+
+def query_budget(statements):
+    """
+    Declares the most SQL statements that a request to a handler may run
+
+    Args:
+        statements (int): the budget, or None when it has no bound
+    """
+    def decorator(handler):
+        setattr(handler, BUDGET, statements)
+        return handler
+
+    return decorator
+
+
+def is_declared(handler) -> bool:
+    """Returns whether a handler declares a budget"""
+    return hasattr(handler, BUDGET)
+
+
+def budget_of(handler):
+    """Returns the budget of a handler, or None when it has none"""
+    return getattr(handler, BUDGET, None)
+
+
+def repeated_statements(statements: Counter) -> list:
+    """Returns the statements run more than once, with their counts, most repeated first"""
+    return [(statement, count) for statement, count in statements.most_common() if count > 1]
+
+
+def check_budget(handler_name, budget, statements: Counter, mode="warn"):
+    """
+    Checks the statements run by a request against the budget of its handler
+
+    Args:
+        handler_name (str): the name of the handler, for the report
+        budget (int): the budget of the handler, or None
+        statements (Counter): the number of times each statement was run
+        mode (str): one of MODES
+
+    Raises:
+        QueryBudgetExceeded: when the budget is exceeded in "raise" mode
+    """
+    if mode == "off" or budget is None:
+        return
+    total = sum(statements.values())
+    if total <= budget:
+        return
+    message = f"{handler_name} ran {total} SQL statements, over its budget of {budget}"
+    repeats = repeated_statements(statements)
+    if repeats:
+        message += "; repeated: " + "; ".join(
+            f"{count} x {' '.join(statement.split())}" for statement, count in repeats[:REPEATS_REPORTED]
+        )
+    if mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
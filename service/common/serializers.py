@@ -0,0 +1,95 @@
+"""
+Fast-path Serializers
+
+flask-restx marshalling walks every field of a model for every object it
+outputs, on top of the dictionaries already built by serialize(). This
+module compiles a flask-restx model once into a plain Python function that
+reads the attributes of an ORM object (or of a SQLAlchemy row) and builds
+the marshalled dictionary in a single pass.
+
+The generated functions follow the marshalling rules of the field types the
+service uses (Integer, Float, String, Boolean, List and Nested); any other
+field falls back to its own output() method, so the result is always the
+same as marshal().
+"""
+import keyword
+from flask_restx import fields
+
+# Field types whose output is "None if the value is None else convert(value)"
+CONVERTERS = {
+    fields.Integer: "int",
+    fields.Float: "float",
+    fields.String: "str",
+    fields.Boolean: "bool",
+}
+
+
+def compile_serializer(model):
+    """
+    Compiles a flask-restx model into a function that serializes one object
+
+    Args:
+        model (Model): the flask-restx model describing the output
+
+    Returns:
+        callable: a function taking an object and returning its marshalled dictionary
+    """
+    namespace = {}
+    source = _generate(model, namespace, "serialize")
+    exec(compile(source, f"<serializer {model.name}>", "exec"), namespace)  # pylint: disable=exec-used
+    function = namespace["serialize"]
+    function.source = source
+    return function
+
+
+def _generate(model, namespace, function_name):
+    """Generates the source code of the serializer of a model"""
+    lines = [f"def {function_name}(obj):"]
+    items = []
+    for index, (key, field) in enumerate(model.resolved.items()):
+        field = field() if isinstance(field, type) else field
+        attribute = field.attribute if isinstance(field.attribute, str) else key
+        value = f"v{index}"
+        expression, reads_value = _expression(key, field, value, namespace)
+        if not reads_value:
+            pass  # the field reads the object itself
+        elif attribute.isidentifier() and not keyword.iskeyword(attribute):
+            lines.append(f"    {value} = obj.{attribute}")
+        else:
+            lines.append(f"    {value} = getattr(obj, {attribute!r})")
+        items.append(f"        {key!r}: {expression},")
+    lines.append("    return {")
+    lines.extend(items)
+    lines.append("    }")
+    return "\n".join(lines) + "\n"
+
+
+def _expression(key, field, value, namespace):
+    """
+    Returns the expression that outputs one field, and whether it uses the
+    value read from the object beforehand
+    """
+    if field.default is None and type(field) in CONVERTERS:  # pylint: disable=unidiomatic-typecheck
+        return f"None if {value} is None else {CONVERTERS[type(field)]}({value})", True
+    if _is_plain_list_of_nested(field):
+        nested = f"_nested_{len(namespace)}"
+        namespace[nested] = compile_serializer(field.container.nested)
+        return f"None if {value} is None else [{nested}(item) for item in {value}]", True
+    # Anything else is output by the field itself, exactly like marshal() does
+    name = f"_field_{len(namespace)}"
+    namespace[name] = field
+    return f"{name}.output({key!r}, obj)", False
+
+
+def _is_plain_list_of_nested(field):
+    """Checks whether a field is a List of Nested models without any options"""
+    # pylint: disable=unidiomatic-typecheck
+    return (
+        type(field) is fields.List
+        and field.default is None
+        and type(field.container) is fields.Nested
+        and not field.container.allow_null
+        and not field.container.skip_none
+        and field.container.default is None
+        and field.container.attribute is None
+    )
@@ -11,7 +11,62 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool of each worker process. Size it so that
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays within max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_pre_ping": DB_POOL_PRE_PING,
+    "pool_recycle": DB_POOL_RECYCLE,
+}
+if not DATABASE_URI.startswith("sqlite"):
+    # SQLite uses a different pool class that does not take these options
+    SQLALCHEMY_ENGINE_OPTIONS.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
 ERROR_404_HELP = False
 
+# Optional warm-up of the pool when a gunicorn worker starts, see post_worker_init
+# in gunicorn.conf.py. Workers never create the schema (run "flask db-upgrade"
+# once per release) and start serving even if the database does not answer
+# after DB_WARMUP_TRIES attempts
+DB_WARMUP = os.getenv("DB_WARMUP", "false").lower() in ("1", "true", "yes")
+DB_WARMUP_TRIES = int(os.getenv("DB_WARMUP_TRIES", "3"))
+DB_WARMUP_DELAY = float(os.getenv("DB_WARMUP_DELAY", "1"))
+
+# What happens to a request running more SQL statements than the query budget
+# of its route: "off", "warn" (log a warning) or "raise" (used by the tests)
+QUERY_BUDGET = os.getenv("QUERY_BUDGET", "warn")
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
+
+# Keyset pagination of collections
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Maximum number of products accepted by a single batch request
+BATCH_SIZE_MAX = int(os.getenv("BATCH_SIZE_MAX", "1000"))
+
+# Number of rows fetched per round trip when streaming exports
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+# Number of wishlists written per transaction by bulk imports
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+# Number of rejected lines detailed in the response of an import request
+IMPORT_ERRORS_MAX = int(os.getenv("IMPORT_ERRORS_MAX", "100"))
+
+# Number of SKUs repriced per transaction by the skus-reprice command
+REPRICE_CHUNK_SIZE = int(os.getenv("REPRICE_CHUNK_SIZE", "1000"))
+
+# Read-through cache of serialized wishlists: "memory", "none" or "package.module:Class"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
@@ -0,0 +1,266 @@
+"""
+Schema Migrations for Wishlist
+
+db.create_all() only creates missing tables, so it never evolves the schema
+of an existing database. This module keeps an ordered list of versioned
+migrations and records the ones applied to a database in the
+schema_migrations table. Every migration is idempotent, so it can safely be
+applied to a database whose tables were created from the current models.
+
+Migrations are driven from the Flask CLI:
+    flask db-upgrade      apply all pending migrations
+    flask db-downgrade    revert migrations down to a given version
+    flask db-version      show the current and latest schema versions
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from service.models import db
+
+logger = logging.getLogger("flask.app")
+
+# The bookkeeping table lives outside of db.metadata so that db.drop_all()
+# and db.create_all() leave the migration history alone
+metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+Migration = namedtuple("Migration", ["version", "description", "upgrade", "downgrade"])
+
+
+class MigrationError(Exception):
+    """ Used when the requested schema version cannot be reached """
+
+
+######################################################################
+#  D D L   H E L P E R S
+######################################################################
+def create_index(conn, name, table, *columns):
+    """
+    Creates an index unless it already exists
+
+    On Postgres the index is built with CREATE INDEX CONCURRENTLY on a
+    connection of its own, outside of the migration transaction, so that
+    the table still takes writes during the build. A concurrent build that
+    failed leaves an invalid index behind, which is dropped and built again.
+    """
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        return
+    with _autocommit(conn) as autocommit:
+        invalid = autocommit.execute(
+            text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+        if invalid:
+            autocommit.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        autocommit.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+
+def drop_index(conn, name):
+    """Drops an index if it exists, without blocking the table on Postgres"""
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        return
+    with _autocommit(conn) as autocommit:
+        autocommit.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _autocommit(conn):
+    """
+    Returns a new connection outside of the transaction of conn
+
+    Postgres refuses to build or drop an index concurrently in a transaction.
+    The migration transaction must not have touched the table of the index
+    by then, or the concurrent build would wait for it forever.
+    """
+    return conn.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def add_column(conn, table, name, definition):
+    """Adds a column unless it already exists"""
+    columns = [column["name"] for column in inspect(conn).get_columns(table)]
+    if name not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+
+
+def drop_column(conn, table, name):
+    """Drops a column if it exists"""
+    columns = [column["name"] for column in inspect(conn).get_columns(table)]
+    if name in columns:
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {name}"))
+
+
+######################################################################
+#  M I G R A T I O N S
+######################################################################
+def _add_secondary_indexes(conn):
+    create_index(conn, "ix_product_wishlist_id", "product", "wishlist_id")
+    create_index(conn, "ix_product_product_id", "product", "product_id")
+    create_index(conn, "ix_wishlist_user_id", "wishlist", "user_id")
+
+
+def _drop_secondary_indexes(conn):
+    drop_index(conn, "ix_wishlist_user_id")
+    drop_index(conn, "ix_product_product_id")
+    drop_index(conn, "ix_product_wishlist_id")
+
+
+def _add_wishlist_versions(conn):
+    add_column(conn, "wishlist", "version", "INTEGER DEFAULT 1 NOT NULL")
+    add_column(conn, "wishlist", "last_updated", "TIMESTAMP")
+    conn.execute(text("UPDATE wishlist SET last_updated = CURRENT_TIMESTAMP WHERE last_updated IS NULL"))
+
+
+def _drop_wishlist_versions(conn):
+    drop_column(conn, "wishlist", "last_updated")
+    drop_column(conn, "wishlist", "version")
+
+
+def _add_product_slice_indexes(conn):
+    create_index(conn, "ix_product_wishlist_id_product_id", "product", "wishlist_id", "product_id")
+    create_index(conn, "ix_product_wishlist_id_product_price", "product", "wishlist_id", "product_price", "id")
+    create_index(conn, "ix_product_wishlist_id_product_name", "product", "wishlist_id", "product_name", "id")
+
+
+def _drop_product_slice_indexes(conn):
+    drop_index(conn, "ix_product_wishlist_id_product_name")
+    drop_index(conn, "ix_product_wishlist_id_product_price")
+    drop_index(conn, "ix_product_wishlist_id_product_id")
+
+
+def _add_user_listing_index(conn):
+    # The composite index also serves every lookup by user_id alone
+    create_index(conn, "ix_wishlist_user_id_archived", "wishlist", "user_id", "archived", "id")
+    drop_index(conn, "ix_wishlist_user_id")
+
+
+def _drop_user_listing_index(conn):
+    create_index(conn, "ix_wishlist_user_id", "wishlist", "user_id")
+    drop_index(conn, "ix_wishlist_user_id_archived")
+
+
+def _add_sku_lookup_index(conn):
+    # The composite index also serves every lookup by product_id alone
+    create_index(conn, "ix_product_product_id_wishlist_id", "product", "product_id", "wishlist_id")
+    drop_index(conn, "ix_product_product_id")
+
+
+def _drop_sku_lookup_index(conn):
+    create_index(conn, "ix_product_product_id", "product", "product_id")
+    drop_index(conn, "ix_product_product_id_wishlist_id")
+
+
+# Append new migrations at the end with the next version number
+MIGRATIONS = [
+    Migration(1, "Add secondary indexes on product and wishlist", _add_secondary_indexes, _drop_secondary_indexes),
+    Migration(2, "Add version and last_updated to wishlist", _add_wishlist_versions, _drop_wishlist_versions),
+    Migration(3, "Add indexes for filtering and sorting products", _add_product_slice_indexes, _drop_product_slice_indexes),
+    Migration(4, "Index wishlists by user and archived state", _add_user_listing_index, _drop_user_listing_index),
+    Migration(5, "Index products by SKU and wishlist", _add_sku_lookup_index, _drop_sku_lookup_index),
+]
+
+
+######################################################################
+#  M I G R A T I O N   R U N N E R
+######################################################################
+def head():
+    """Returns the latest schema version known to the service"""
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def current_version(conn=None):
+    """Returns the schema version of the database"""
+    if conn is None:
+        with db.engine.connect() as connection:
+            return current_version(connection)
+    schema_migrations.create(conn, checkfirst=True)
+    version = conn.execute(select(func.max(schema_migrations.c.version))).scalar()  # pylint: disable=not-callable
+    return version or 0
+
+
+def stamp(version=None):
+    """
+    Marks the database as being at the given version without running anything
+
+    This is used after db.create_all() has built the schema from the current
+    models, which already include the effect of every migration.
+    """
+    version = head() if version is None else version
+    with db.engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        conn.execute(schema_migrations.delete())
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                conn.execute(schema_migrations.insert().values(_history(migration)))
+    logger.info("Stamped database schema at version %d", version)
+
+
+def upgrade(target=None):
+    """
+    Applies every pending migration up to the target version
+
+    A database without tables is built from the models and stamped at the
+    latest version, which is then the only valid target. Each migration
+    runs in its own transaction.
+
+    Returns:
+        list: the versions that were applied
+    """
+    target = head() if target is None else target
+    if target > head():
+        raise MigrationError(f"Unknown schema version {target}, latest is {head()}")
+    if not inspect(db.engine).has_table("wishlist"):
+        # The models describe the latest schema only: there is nothing to build an older one from
+        if target != head():
+            raise MigrationError(f"An empty database can only be built at the latest version {head()}, not {target}")
+        logger.info("Creating database schema")
+        db.create_all()
+        stamp()
+        return [migration.version for migration in MIGRATIONS]
+
+    applied = []
+    for migration in MIGRATIONS:
+        with db.engine.begin() as conn:
+            if not current_version(conn) < migration.version <= target:
+                continue
+            logger.info("Applying migration %d: %s", migration.version, migration.description)
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(_history(migration)))
+        applied.append(migration.version)
+    return applied
+
+
+def downgrade(target):
+    """
+    Reverts applied migrations, newest first, down to the target version
+
+    Returns:
+        list: the versions that were reverted
+    """
+    if target < 0:
+        raise MigrationError(f"Invalid schema version {target}")
+    reverted = []
+    for migration in reversed(MIGRATIONS):
+        with db.engine.begin() as conn:
+            if not target < migration.version <= current_version(conn):
+                continue
+            logger.info("Reverting migration %d: %s", migration.version, migration.description)
+            migration.downgrade(conn)
+            conn.execute(schema_migrations.delete().where(schema_migrations.c.version == migration.version))
+        reverted.append(migration.version)
+    return reverted
+
+
+def _history(migration):
+    """Returns the schema_migrations row recording a migration"""
+    return {
+        "version": migration.version,
+        "description": migration.description,
+        "applied_at": datetime.now(timezone.utc).replace(tzinfo=None),
+    }
@@ -4,7 +4,13 @@ Models for Wishlist
 All of the models are stored in this module
 """
 import logging
+import os
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import selectinload
+from retry.api import retry_call
 
 logger = logging.getLogger("flask.app")
 
@@ -18,10 +24,107 @@ def init_db(app):
     Wishlist.init_db(app)
 
 
+def warm_up(tries=3, delay=1.0):
+    """
+    Opens the first connection of the pool before any request needs it
+
+    Connection errors are retried up to tries times, waiting delay seconds
+    before the first retry and twice as long before each following one. A
+    database that still does not answer is only logged: the worker keeps
+    starting and requests connect on demand once the database is back.
+
+    Returns:
+        bool: whether the database answered
+    """
+    try:
+        retry_call(_ping, exceptions=OperationalError, tries=tries, delay=delay, backoff=2, logger=logger)
+    except OperationalError as error:
+        logger.error("Database warm-up failed after %d attempts: %s", tries, error)
+        return False
+    return True
+
+
+def _ping():
+    """Checks out a connection and runs a trivial query on it"""
+    with db.engine.connect() as conn:
+        conn.execute(select(1))
+
+
+def pool_status():
+    """
+    Returns the connection pool counters of this worker process
+
+    checked_out connections are in use by requests, idle ones are pooled and
+    ready, and overflow counts the connections opened beyond the pool size.
+    """
+    pool = db.engine.pool
+    counters = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        counters.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return counters
+
+
+# The number of ids sent in each IN (...) of the Core read path
+ROWS_IN_CHUNK_SIZE = 500
+
+# The longest names and the range of the integer ids the columns can store:
+# Postgres refuses anything beyond them with a DataError
+NAME_LENGTH_MAX = 63
+INTEGER_MIN, INTEGER_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _check_int(field, value):
+    """Checks that an id is an integer the database can store, and returns it"""
+    if not isinstance(value, int):
+        raise TypeError(f"{field} must be an integer")
+    if not INTEGER_MIN <= value <= INTEGER_MAX:
+        raise ValueError(f"{field} is out of range")
+    return value
+
+
+def _check_name(value):
+    """Checks that a name is a populated string the database can store, and returns it"""
+    if not isinstance(value, str):
+        raise TypeError("name must be a string")
+    if len(value) == 0:
+        raise ValueError("name must be populated")
+    if len(value) > NAME_LENGTH_MAX:
+        raise ValueError(f"name must be at most {NAME_LENGTH_MAX} characters")
+    return value
+
+
 class DataValidationError(Exception):
     """ Used for an data validation errors when deserializing """
 
 
+class DataConflictError(Exception):
+    """ Used when a change violates a unique constraint of the database """
+
+
+# The unique constraint on wishlist_name, as Postgres names it
+NAME_CONSTRAINT = "wishlist_wishlist_name_key"
+
+
+def is_name_conflict(error):
+    """
+    Checks whether an IntegrityError violates the unique constraint on wishlist_name
+
+    Postgres names the constraint in its message, and SQLite the column.
+    """
+    message = str(error.orig)
+    return NAME_CONSTRAINT in message or "wishlist.wishlist_name" in message
+
+
+def utcnow():
+    """ Returns the current UTC time as stored in the database """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 ######################################################################
 #  P R O D U C T   M O D E L
 ######################################################################
@@ -39,11 +142,20 @@ class Product(db.Model):
 
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
-    wishlist_id = db.Column(db.Integer, db.ForeignKey("wishlist.id", ondelete="CASCADE"), nullable=False)
+    wishlist_id = db.Column(db.Integer, db.ForeignKey("wishlist.id", ondelete="CASCADE"), nullable=False, index=True)
     product_id = db.Column(db.Integer, nullable=False)
-    product_name = db.Column(db.String(63), nullable=False)
+    product_name = db.Column(db.String(NAME_LENGTH_MAX), nullable=False)
     product_price = db.Column(db.Float, nullable=False)
 
+    # Back the filters and keyset sort orders of the products of one Wishlist,
+    # and the lookup of the Wishlists that contain a SKU
+    __table_args__ = (
+        db.Index("ix_product_product_id_wishlist_id", "product_id", "wishlist_id"),
+        db.Index("ix_product_wishlist_id_product_id", "wishlist_id", "product_id"),
+        db.Index("ix_product_wishlist_id_product_price", "wishlist_id", "product_price", "id"),
+        db.Index("ix_product_wishlist_id_product_name", "wishlist_id", "product_name", "id"),
+    )
+
     def __repr__(self):
         return f"<Product {self.product_name} id=[{self.id}] in Wishlist {self.wishlist_id}>"
 
@@ -54,19 +166,59 @@ class Product(db.Model):
         logger.info("Adding product %s to wishlist %d", self.product_name, self.wishlist_id)
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
+        Wishlist.touch(self.wishlist_id)
+        db.session.commit()
+
+    @classmethod
+    def bulk_create(cls, products):
+        """
+        Creates many Product-Wishlist mappings with a single INSERT
+
+        All of the products are written in one transaction, so either every
+        one of them is created or none is.
+
+        Args:
+            products (list): the deserialized Products to insert
+
+        Returns:
+            list: the created Products, ordered by id
+        """
+        logger.info("Adding %d products in bulk", len(products))
+        created = db.session.scalars(insert(cls).returning(cls), cls._insert_rows(products)).all()
+        Wishlist.touch(*{product.wishlist_id for product in products})
+        # RETURNING already loaded every column: detach the Products so that the
+        # commit does not expire them, or serializing them reloads one at a time
+        for product in created:
+            db.session.expunge(product)
         db.session.commit()
+        return sorted(created, key=lambda product: product.id)
+
+    @staticmethod
+    def _insert_rows(products):
+        """Returns the columns of new Products as the parameters of a bulk INSERT"""
+        return [
+            {
+                "wishlist_id": product.wishlist_id,
+                "product_id": product.product_id,
+                "product_name": product.product_name,
+                "product_price": product.product_price,
+            }
+            for product in products
+        ]
 
     def update(self):
         """
         Updates a Product-Wishlist mapping in the database
         """
         logger.info("Saving product %s in wishlist %d", self.product_name, self.wishlist_id)
+        Wishlist.touch(self.wishlist_id)
         db.session.commit()
 
     def delete(self):
         """ Removes a Product-Wishlist mapping from the database """
         logger.info("Deleting product %s from wishlist %d", self.product_name, self.wishlist_id)
         db.session.delete(self)
+        Wishlist.touch(self.wishlist_id)
         db.session.commit()
 
     def serialize(self):
@@ -89,14 +241,8 @@ class Product(db.Model):
         """
         try:
             self.wishlist_id = data["wishlist_id"]
-            self.product_id = data["product_id"]
-            if not isinstance(self.product_id, int):
-                raise TypeError("Product id must be an integer")
-            self.product_name = data["product_name"]
-            if not isinstance(self.product_name, str):
-                raise TypeError("name must be a string")
-            if len(self.product_name) == 0:
-                raise ValueError("name must be populated")
+            self.product_id = _check_int("Product id", data["product_id"])
+            self.product_name = _check_name(data["product_name"])
             self.product_price = data["product_price"]
             if type(self.product_price) not in [float, int]:
                 raise TypeError("price must be numeric")
@@ -113,18 +259,256 @@ class Product(db.Model):
             ) from error
         return self
 
+    @classmethod
+    def reprice(cls, prices):
+        """
+        Sets the price, and optionally the name, of every Product with the given SKUs
+
+        Each group of SKUs is changed by one UPDATE ... WHERE product_id = ?
+        sent with executemany, whatever the number of Products per SKU. The
+        Wishlists holding those Products are touched in the same transaction.
+
+        Args:
+            prices (list): dictionaries with a product_id, a product_price and
+                optionally a product_name; the last one wins for a repeated SKU
+
+        Returns:
+            tuple: the number of Products updated and the ids of their Wishlists
+        """
+        changes = cls._price_changes(prices)
+        logger.info("Repricing %d SKUs", len(changes))
+        for statement, rows in cls._reprice_statements(changes):
+            db.session.execute(statement, rows)
+
+        # Driver row counts are unreliable for executemany, so count the rows instead
+        owners = []
+        for statement in cls._sku_owner_statements(list(changes)):
+            owners.extend(db.session.scalars(statement))
+        wishlist_ids = sorted(set(owners))
+        for start in range(0, len(wishlist_ids), ROWS_IN_CHUNK_SIZE):
+            Wishlist.touch(*wishlist_ids[start:start + ROWS_IN_CHUNK_SIZE])
+        db.session.commit()
+        return len(owners), wishlist_ids
+
+    @classmethod
+    def _price_changes(cls, prices):
+        """Validates new prices and returns the parameters of their UPDATEs by SKU"""
+        changes = {}
+        for price in prices:
+            change = cls._validate_price(price)
+            changes[change["sku"]] = change
+        return changes
+
+    @classmethod
+    def _reprice_statements(cls, changes):
+        """Returns the UPDATE statements of the price changes, with their executemany rows"""
+        table = cls.__table__
+        statements = []
+        for with_name in (False, True):
+            rows = [change for change in changes.values() if ("new_name" in change) == with_name]
+            if not rows:
+                continue
+            values = {"product_price": bindparam("new_price")}
+            if with_name:
+                values["product_name"] = bindparam("new_name")
+            statements.append((update(table).where(table.c.product_id == bindparam("sku")).values(**values), rows))
+        return statements
+
+    @classmethod
+    def _sku_owner_statements(cls, skus):
+        """Returns the queries of the wishlist_id of every Product with the given SKUs"""
+        table = cls.__table__
+        return [
+            select(table.c.wishlist_id).where(table.c.product_id.in_(skus[start:start + ROWS_IN_CHUNK_SIZE]))
+            for start in range(0, len(skus), ROWS_IN_CHUNK_SIZE)
+        ]
+
+    @staticmethod
+    def _validate_price(data):
+        """Checks a new price of a SKU and returns the parameters of its UPDATE"""
+        try:
+            change = {"sku": data["product_id"], "new_price": data["product_price"]}
+            if isinstance(_check_int("Product id", change["sku"]), bool):
+                raise TypeError("Product id must be an integer")
+            if type(change["new_price"]) not in [float, int]:
+                raise TypeError("price must be numeric")
+            if change["new_price"] < 0:
+                raise ValueError("price must be strictly positive")
+            if data.get("product_name") is not None:
+                change["new_name"] = _check_name(data["product_name"])
+        except KeyError as error:
+            raise DataValidationError(
+                "Invalid price: missing " + error.args[0]
+            ) from error
+        except (ValueError, TypeError) as error:
+            raise DataValidationError(
+                "Invalid price: body of request contained bad or no data - "
+                "Error message: " + error.args[0]
+            ) from error
+        return change
+
     @classmethod
     def find(cls, by_id):
         """ Finds a Product by its id """
         logger.info("Processing lookup for Product with id %s ...", by_id)
         return cls.query.get(by_id)
 
+    @classmethod
+    def find_with_version(cls, by_id):
+        """
+        Finds a Product together with the version of its Wishlist
+
+        Returns:
+            tuple: the Product, the Wishlist version and its last update time,
+            or None if there is no such Product
+        """
+        logger.info("Processing versioned lookup for Product with id %s ...", by_id)
+        return db.session.execute(cls._with_version_statement(by_id)).first()
+
+    @classmethod
+    def _with_version_statement(cls, by_id):
+        """Builds the query of a Product and the version of its Wishlist"""
+        return (
+            select(cls, Wishlist.version, Wishlist.last_updated)
+            .join(Wishlist, Wishlist.id == cls.wishlist_id)
+            .where(cls.id == by_id)
+        )
+
     @classmethod
     def find_by_product_id(cls, by_product_id):
         """ Finds a Product by its id """
         logger.info("Processing lookup for Product with product_id %s ...", by_product_id)
         return cls.query.filter(cls.product_id == by_product_id).all()
 
+    @classmethod
+    def find_wishlist_owners(cls, by_product_id, after=None, limit=None):
+        """Returns the ids and owners of the Wishlists that contain a SKU
+
+        Args:
+            by_product_id (int): the SKU of the product
+            after (int): only return Wishlists whose id is greater than this one
+            limit (int): the maximum number of Wishlists to return
+        """
+        logger.info("Processing owner query for Wishlists with product_id %s ...", by_product_id)
+        return db.session.execute(cls._wishlist_owners(by_product_id, after, limit)).all()
+
+    @classmethod
+    def iter_wishlist_owners(cls, by_product_id, chunk_size):
+        """
+        Iterates over the ids and owners of the Wishlists that contain a SKU
+
+        Rows are read through a server-side cursor chunk_size at a time, for
+        SKUs that are in too many Wishlists to hold in memory.
+        """
+        logger.info("Processing streaming owner query for Wishlists with product_id %s ...", by_product_id)
+        statement = cls._wishlist_owners(by_product_id)
+        return db.session.execute(statement.execution_options(stream_results=True, yield_per=chunk_size))
+
+    @classmethod
+    def _wishlist_owners(cls, by_product_id, after=None, limit=None):
+        """
+        Builds the query of the Wishlists that contain a SKU, ordered by id
+
+        The page is picked in the subquery, by a range scan of the
+        (product_id, wishlist_id) index that starts after the cursor and
+        stops after limit distinct Wishlists, so deep pages cost as much as
+        the first one. A Wishlist holding the SKU more than once is only
+        returned once.
+        """
+        table, wishlists = cls.__table__, Wishlist.__table__
+        containing = (
+            select(table.c.wishlist_id)
+            .where(table.c.product_id == by_product_id)
+            .distinct()
+            .order_by(table.c.wishlist_id)
+            .limit(limit)
+        )
+        if after is not None:
+            containing = containing.where(table.c.wishlist_id > after)
+        page = containing.subquery()
+        return (
+            select(wishlists.c.id.label("wishlist_id"), wishlists.c.user_id)
+            .join(page, wishlists.c.id == page.c.wishlist_id)
+            .order_by(wishlists.c.id)
+        )
+
+    @classmethod
+    def rows_by_wishlist(cls, wishlist_ids):
+        """
+        Reads the products of Wishlists as plain dictionaries
+
+        This is a read-only path: the columns are selected with SQLAlchemy
+        Core, so no ORM objects are created or tracked by the session. Like
+        selectinload, the ids are sent ROWS_IN_CHUNK_SIZE at a time to stay
+        under the bind parameter limits of the database drivers.
+
+        Returns:
+            dict: the serialized products of each Wishlist id, ordered by id
+        """
+        products = {}
+        for statement in cls._rows_by_wishlist_statements(wishlist_ids):
+            for row in db.session.execute(statement).mappings():
+                products.setdefault(row["wishlist_id"], []).append(dict(row))
+        return products
+
+    @classmethod
+    def _rows_by_wishlist_statements(cls, wishlist_ids):
+        """Builds the queries of the products of Wishlists, one per chunk of ids"""
+        table = cls.__table__
+        return [
+            select(*table.c)
+            .where(table.c.wishlist_id.in_(wishlist_ids[start:start + ROWS_IN_CHUNK_SIZE]))
+            .order_by(table.c.id)
+            for start in range(0, len(wishlist_ids), ROWS_IN_CHUNK_SIZE)
+        ]
+
+    @classmethod
+    def rows_page(cls, wishlist_id, sort="id", after=None, limit=None, **filters):
+        """Returns a page of the serialized products of a Wishlist, read with SQLAlchemy Core
+
+        The filters, the sort order and the page boundary are all part of the
+        query, so only the requested slice of the Wishlist is read.
+
+        Args:
+            wishlist_id (int): the id of the Wishlist
+            sort (str): the column to sort by, one of PRODUCT_SORT_KEYS; ties are broken by id
+            after (list): the sort key of the last product of the previous page
+            limit (int): the maximum number of products to return
+            product_id (int): only return products with this SKU
+            min_price (float): only return products at this price or above
+            max_price (float): only return products at this price or below
+        """
+        logger.info("Processing row page query for Products of Wishlist %s sorted by %s ...", wishlist_id, sort)
+        statement = cls._rows_page_statement(wishlist_id, sort, after, limit, **filters)
+        return [dict(row) for row in db.session.execute(statement).mappings()]
+
+    @classmethod
+    def _rows_page_statement(cls, wishlist_id, sort, after, limit, **filters):
+        """Builds the query of a page of the products of a Wishlist"""
+        table = cls.__table__
+        statement = select(*table.c).where(table.c.wishlist_id == wishlist_id)
+        if filters.get("product_id") is not None:
+            statement = statement.where(table.c.product_id == filters["product_id"])
+        if filters.get("min_price") is not None:
+            statement = statement.where(table.c.product_price >= filters["min_price"])
+        if filters.get("max_price") is not None:
+            statement = statement.where(table.c.product_price <= filters["max_price"])
+        key = [table.c[sort], table.c.id] if sort != "id" else [table.c.id]
+        if after is not None:
+            statement = statement.where(tuple_(*key) > tuple_(*after))
+        return statement.order_by(*key).limit(limit)
+
+
+# The sort orders of the products of a Wishlist, with the types of their keyset cursor
+PRODUCT_SORT_KEYS = {
+    "id": (int,),
+    "product_price": (float, int),
+    "product_name": (str, int),
+}
+
+# The columns of a serialized Wishlist, without its products
+WISHLIST_COLUMNS = ("id", "user_id", "wishlist_name", "archived")
+
 
 ######################################################################
 #  W I S H L I S T   M O D E L
@@ -138,6 +522,8 @@ class Wishlist(db.Model):
     user_id = id of the user who owns the wishlist
     wishlist_name = user-assigned name of the wishlist
     wishlist_products = collection of products in the wishlist
+    version = incremented every time the wishlist or one of its products changes
+    last_updated = time of the last change to the wishlist or its products
     """
 
     app = None
@@ -145,9 +531,19 @@ class Wishlist(db.Model):
     # Table Schema
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
-    wishlist_name = db.Column(db.String(63), nullable=False, unique=True)
+    wishlist_name = db.Column(db.String(NAME_LENGTH_MAX), nullable=False, unique=True)
     archived = db.Column(db.Boolean(), nullable=False, default=False)
-    wishlist_products = db.relationship("Product", backref="wishlist", passive_deletes=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    last_updated = db.Column(db.DateTime, default=utcnow)
+    # Products are removed by the ON DELETE CASCADE, even when they were eagerly loaded
+    wishlist_products = db.relationship(
+        "Product", backref="wishlist", passive_deletes="all", order_by="Product.id"
+    )
+
+    # Backs the pages of a user's Wishlists, archived or not, in id order
+    __table_args__ = (
+        db.Index("ix_wishlist_user_id_archived", "user_id", "archived", "id"),
+    )
 
     def __repr__(self):
         return f"<Wishlist {self.wishlist_name} id=[{self.id}]>"
@@ -159,14 +555,34 @@ class Wishlist(db.Model):
         logger.info("Creating wishlist %s", self.wishlist_name)
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
-        db.session.commit()
+        self._commit_unique_name()
 
     def update(self):
         """
         Updates a Wishlist in the database
         """
         logger.info("Saving wishlist %s", self.wishlist_name)
-        db.session.commit()
+        self.version = Wishlist.version + 1
+        self.last_updated = utcnow()
+        self._commit_unique_name()
+
+    def _commit_unique_name(self):
+        """
+        Commits the session, turning a duplicate name into a DataConflictError
+
+        The unique constraint on wishlist_name is checked by the database in
+        the same round trip as the INSERT or UPDATE, instead of by a SELECT
+        beforehand that a concurrent write could slip past. Any other
+        violation, e.g. by the products being added, is raised as it is.
+        """
+        name = self.wishlist_name
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            if not is_name_conflict(error):
+                raise
+            raise DataConflictError(f"Wishlist with name '{name}' already exists.") from error
 
     def delete(self):
         """ Removes a Wishlist from the data store """
@@ -195,14 +611,8 @@ class Wishlist(db.Model):
             data (dict): A dictionary containing the wishlist data
         """
         try:
-            self.user_id = data["user_id"]
-            if not isinstance(self.user_id, int):
-                raise TypeError("user id must be an integer")
-            self.wishlist_name = data["wishlist_name"]
-            if not isinstance(self.wishlist_name, str):
-                raise TypeError("name must be a string")
-            if len(self.wishlist_name) == 0:
-                raise ValueError("name must be populated")
+            self.user_id = _check_int("user id", data["user_id"])
+            self.wishlist_name = _check_name(data["wishlist_name"])
             self.archived = data["archived"]
             if not isinstance(self.archived, bool):
                 raise TypeError("archived must be boolean")
@@ -225,25 +635,89 @@ class Wishlist(db.Model):
 
     @classmethod
     def init_db(cls, app):
-        """ Initializes the database session """
+        """
+        Initializes the database session
+
+        Nothing is sent to the database here: the schema is created and
+        migrated by "flask db-upgrade", and connections are opened on demand.
+        """
         logger.info("Initializing Wishlists database")
         cls.app = app
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+
+    @classmethod
+    def touch(cls, *ids):
+        """
+        Bumps the version of Wishlists whose products changed
+
+        The UPDATE joins the current transaction, so it is committed or rolled
+        back together with the product change.
+        """
+        db.session.execute(cls._touch_statement(ids), execution_options={"synchronize_session": False})
+
+    @classmethod
+    def _touch_statement(cls, ids):
+        """Builds the UPDATE that bumps the version of Wishlists"""
+        return update(cls).where(cls.id.in_(ids)).values(version=cls.version + 1, last_updated=utcnow())
+
+    @classmethod
+    def with_products(cls):
+        """
+        Returns a Wishlist query that eagerly loads the products
+
+        The products of every Wishlist the query returns are fetched with a
+        single batched SELECT ... WHERE wishlist_id IN (...), so serializing
+        N Wishlists costs 2 queries instead of 1 + N lazy loads.
+        """
+        return cls.query.options(selectinload(cls.wishlist_products))
 
     @classmethod
     def all(cls):
         """ Returns all Wishlists in the database """
         logger.info("Processing all Wishlists")
-        return cls.query.all()
+        return cls.with_products().all()
+
+    @classmethod
+    def iter_all(cls, chunk_size):
+        """
+        Iterates over all Wishlists without holding them all in memory
+
+        Rows are read through a server-side cursor chunk_size at a time, and
+        the products of each chunk are loaded with one batched query.
+        """
+        logger.info("Processing streaming read of all Wishlists")
+        statement = select(cls).options(selectinload(cls.wishlist_products)).order_by(cls.id)
+        return db.session.scalars(statement.execution_options(stream_results=True, yield_per=chunk_size))
 
     @classmethod
     def find(cls, by_id):
         """ Finds a Wishlist by its id """
         logger.info("Processing lookup for Wishlist with id %s ...", by_id)
-        return cls.query.get(by_id)
+        return db.session.get(cls, by_id, options=[selectinload(cls.wishlist_products)])
+
+    @classmethod
+    def find_version(cls, by_id):
+        """
+        Finds the version of a Wishlist without loading it
+
+        Returns:
+            Row: the version and last_updated columns, or None if there is no such Wishlist
+        """
+        logger.info("Processing version lookup for Wishlist with id %s ...", by_id)
+        return db.session.execute(cls._version_statement(by_id)).first()
+
+    @classmethod
+    def _version_statement(cls, by_id):
+        """Builds the query of the version of a Wishlist"""
+        return select(cls.version, cls.last_updated).where(cls.id == by_id)
+
+    @classmethod
+    def exists(cls, by_id):
+        """ Checks whether a Wishlist exists without loading it """
+        logger.info("Processing existence check for Wishlist with id %s ...", by_id)
+        return db.session.query(cls.id).filter(cls.id == by_id).first() is not None
 
     @classmethod
     def find_by_name(cls, by_name):
@@ -253,4 +727,124 @@ class Wishlist(db.Model):
             name (string): the name of the Wishlists you want to match
         """
         logger.info("Processing name query for Wishlist with name %s ...", by_name)
-        return cls.query.filter(cls.wishlist_name == by_name).all()
+        return cls.with_products().filter(cls.wishlist_name == by_name).all()
+
+    @classmethod
+    def find_page(cls, after=None, limit=None):
+        """Returns a page of Wishlists ordered by id using keyset pagination
+
+        Args:
+            after (int): only return Wishlists whose id is greater than this one
+            limit (int): the maximum number of Wishlists to return
+        """
+        logger.info("Processing page query for Wishlists after id %s ...", after)
+        query = cls.with_products()
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id).limit(limit).all()
+
+    @classmethod
+    def rows_page(cls, after=None, limit=None, **filters):
+        """Returns a page of serialized Wishlists ordered by id, read with SQLAlchemy Core
+
+        The same page as find_page(), but built from plain column tuples
+        instead of ORM objects: one query for the Wishlists and one for their
+        products.
+
+        Args:
+            after (int): only return Wishlists whose id is greater than this one
+            limit (int): the maximum number of Wishlists to return
+            wishlist_name (str): only return the Wishlist with this name
+            user_id (int): only return the Wishlists of this user
+            archived (bool): only return archived, or unarchived, Wishlists
+        """
+        logger.info("Processing row page query for Wishlists after id %s ...", after)
+        statement = cls._rows_page_statement(after, limit, **filters)
+        wishlists = [dict(row) for row in db.session.execute(statement).mappings()]
+        products = Product.rows_by_wishlist([wishlist["id"] for wishlist in wishlists])
+        for wishlist in wishlists:
+            wishlist["wishlist_products"] = products.get(wishlist["id"], [])
+        return wishlists
+
+    @classmethod
+    def _rows_page_statement(cls, after, limit, **filters):
+        """Builds the query of a page of Wishlists, without their products"""
+        table = cls.__table__
+        statement = select(*[table.c[name] for name in WISHLIST_COLUMNS]).order_by(table.c.id).limit(limit)
+        if after is not None:
+            statement = statement.where(table.c.id > after)
+        for name in ("wishlist_name", "user_id", "archived"):
+            if filters.get(name) is not None:
+                statement = statement.where(table.c[name] == filters[name])
+        return statement
+
+    @classmethod
+    def summary_rows(cls, after=None, limit=None, **filters):
+        """Returns a page of Wishlist summaries ordered by id
+
+        The product count and the total, lowest and highest product prices
+        are aggregated by the database with a GROUP BY, so no product is
+        sent back. Every summary also carries the version and last_updated
+        columns of its Wishlist.
+
+        Args:
+            after (int): only return Wishlists whose id is greater than this one
+            limit (int): the maximum number of Wishlists to return
+            id (int): only return the Wishlist with this id
+            wishlist_name (str): only return the Wishlist with this name
+            user_id (int): only return the Wishlists of this user
+            archived (bool): only return archived, or unarchived, Wishlists
+        """
+        logger.info("Processing summary query for Wishlists after id %s ...", after)
+        return db.session.execute(cls._summary_statement(after, limit, **filters)).all()
+
+    @classmethod
+    def _summary_statement(cls, after, limit, **filters):
+        """Builds the GROUP BY query of a page of Wishlist summaries"""
+        # func makes its SQL functions on attribute access, which pylint cannot follow
+        # pylint: disable=not-callable
+        table, products = cls.__table__, Product.__table__
+        columns = [table.c[name] for name in WISHLIST_COLUMNS] + [table.c.version, table.c.last_updated]
+        statement = (
+            select(
+                *columns,
+                func.count(products.c.id).label("product_count"),
+                func.coalesce(func.sum(products.c.product_price), 0.0).label("total_price"),
+                func.min(products.c.product_price).label("min_price"),
+                func.max(products.c.product_price).label("max_price"),
+            )
+            .select_from(table.outerjoin(products, products.c.wishlist_id == table.c.id))
+            .group_by(*columns)
+            .order_by(table.c.id)
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(table.c.id > after)
+        for name in ("id", "wishlist_name", "user_id", "archived"):
+            if filters.get(name) is not None:
+                statement = statement.where(table.c[name] == filters[name])
+        return statement
+
+    @classmethod
+    def find_row(cls, by_id):
+        """
+        Finds a serialized Wishlist and its version, read with SQLAlchemy Core
+
+        Returns:
+            tuple: the serialized Wishlist, its version and its last update
+            time, or None if there is no such Wishlist
+        """
+        logger.info("Processing row lookup for Wishlist with id %s ...", by_id)
+        row = db.session.execute(cls._row_statement(by_id)).mappings().first()
+        if row is None:
+            return None
+        wishlist = {name: row[name] for name in WISHLIST_COLUMNS}
+        wishlist["wishlist_products"] = Product.rows_by_wishlist([by_id]).get(by_id, [])
+        return wishlist, row["version"], row["last_updated"]
+
+    @classmethod
+    def _row_statement(cls, by_id):
+        """Builds the query of the columns and version of a Wishlist"""
+        table = cls.__table__
+        columns = [table.c[name] for name in WISHLIST_COLUMNS]
+        return select(*columns, table.c.version, table.c.last_updated).where(table.c.id == by_id)
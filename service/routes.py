@@ -4,19 +4,35 @@ Wishlist Service
 This microservice handles the management of wishlists and their contents
 """
 
-from flask import jsonify, request, make_response, abort
-from flask_restx import Resource, fields, reqparse
+# pylint: disable=too-many-lines
+import hashlib
+import json
+from datetime import timezone
+from flask import Response, jsonify, request, make_response, abort, stream_with_context
+from flask_restx import Resource, fields, inputs, reqparse
+from flask_restx.mask import apply as apply_mask
+from werkzeug.http import http_date, quote_etag
 from service.common import status  # HTTP Status Codes
-from service.models import Wishlist, Product
+from service.common.cache import get_cache
+from service.common.metrics import render as render_metrics
+from service.common.ndjson import NDJSON_MIMETYPE, dump_wishlists, dump_wishlist_owners, load_wishlists
+from service.common.pagination import encode_cursor, keyset_cursor, link_header, parse_page_args
+from service.common.query_budget import query_budget
+from service.common.serializers import compile_serializer
+from service.models import Wishlist, Product, DataValidationError, PRODUCT_SORT_KEYS, ROWS_IN_CHUNK_SIZE, pool_status
 
 # Import Flask application
 from . import app, api
 
+# The queries of the products of a full page of Wishlists, read ROWS_IN_CHUNK_SIZE Wishlists at a time
+PAGE_PRODUCT_QUERIES = -(-(app.config["PAGE_SIZE_MAX"] + 1) // ROWS_IN_CHUNK_SIZE)
+
 
 ######################################################################
 # GET INDEX
 ######################################################################
 @app.route("/")
+@query_budget(0)
 def index():
     """ Base URL for Wishlists service """
     return app.send_static_file("index.html")
@@ -76,17 +92,126 @@ wishlist_model = api.inherit(
     },
 )
 
+# Define the summary of a Wishlist, aggregated over its products
+wishlist_summary_model = api.model(
+    "WishlistSummary",
+    {
+        "id": fields.Integer(readOnly=True, description="The Id of the wishlist"),
+        "user_id": fields.Integer(readOnly=True, description="Id of the user owning the wishlist"),
+        "wishlist_name": fields.String(readOnly=True, description="Name of the wishlist"),
+        "archived": fields.Boolean(readOnly=True, description="Is the wishlist archived?"),
+        "product_count": fields.Integer(readOnly=True, description="Number of products in the wishlist"),
+        "total_price": fields.Float(readOnly=True, description="Sum of the prices of the products"),
+        "min_price": fields.Float(readOnly=True, description="Lowest product price, null when empty"),
+        "max_price": fields.Float(readOnly=True, description="Highest product price, null when empty"),
+    },
+)
+
+# Single-pass serializers generated from the models above, used by the read routes
+# of ORM objects and rows; the Wishlists and their products are read as plain
+# dictionaries that are already serialized
+serialize_product = compile_serializer(product_model)
+serialize_summary = compile_serializer(wishlist_summary_model)
+
+# The fields mask header that json_response() honors, documented like @api.marshal_with does
+MASK_HEADER = app.config["RESTX_MASK_HEADER"]
+MASK_PARAMS = {
+    MASK_HEADER: {"in": "header", "type": "string", "format": "mask", "description": "An optional fields mask"}
+}
+
+# Define the result of a bulk import
+import_error_model = api.model(
+    "ImportError",
+    {
+        "line": fields.Integer(description="Line number of the rejected Wishlist"),
+        "message": fields.String(description="Reason the line was rejected"),
+    },
+)
+
+import_result_model = api.model(
+    "ImportResult",
+    {
+        "imported": fields.Integer(description="Number of Wishlists created"),
+        "failed": fields.Integer(description="Number of lines rejected"),
+        "errors": fields.List(fields.Nested(import_error_model), description="The first rejected lines"),
+    },
+)
+
+# Define a Wishlist that contains a given SKU
+wishlist_owner_model = api.model(
+    "WishlistOwner",
+    {
+        "wishlist_id": fields.Integer(readOnly=True, description="The Id of the wishlist"),
+        "user_id": fields.Integer(readOnly=True, description="Id of the user owning the wishlist"),
+    },
+)
+serialize_owner = compile_serializer(wishlist_owner_model)
+
+# Define the new price of a SKU, and the result of repricing it
+sku_price_model = api.model(
+    "SkuPrice",
+    {
+        "product_price": fields.Float(required=True, description="New price of the product"),
+        "product_name": fields.String(required=False, description="New name of the product, if it changes"),
+    },
+)
+
+reprice_result_model = api.model(
+    "RepriceResult",
+    {
+        "product_id": fields.Integer(readOnly=True, description="SKU of the product"),
+        "updated": fields.Integer(readOnly=True, description="Number of wishlist items updated"),
+    },
+)
+
 # Wishlist Query String Arguments
 wishlist_args = reqparse.RequestParser()
 wishlist_args.add_argument(
     "wishlist_name", type=str, location="args", required=False, help="Filter Wishlists by name"
 )
+wishlist_args.add_argument(
+    "user_id", type=int, location="args", required=False, help="Filter Wishlists by owner"
+)
+wishlist_args.add_argument(
+    "archived", type=inputs.boolean, location="args", required=False, help="Filter Wishlists by archived state"
+)
+wishlist_args.add_argument(
+    "limit", type=int, location="args", required=False, help="Maximum number of Wishlists per page"
+)
+wishlist_args.add_argument(
+    "after", type=str, location="args", required=False, help="Cursor returned with the previous page"
+)
 
 # Product Query String Arguments
 product_args = reqparse.RequestParser()
 product_args.add_argument(
     "product_id", type=int, location="args", required=False, help="Filter Wishlists by SKU"
 )
+product_args.add_argument(
+    "min_price", type=float, location="args", required=False, help="Only list Products at this price or above"
+)
+product_args.add_argument(
+    "max_price", type=float, location="args", required=False, help="Only list Products at this price or below"
+)
+product_args.add_argument(
+    "sort", type=str, location="args", required=False, choices=list(PRODUCT_SORT_KEYS),
+    help="Sort the Products by this field, then by id"
+)
+product_args.add_argument(
+    "limit", type=int, location="args", required=False, help="Maximum number of Products per page"
+)
+product_args.add_argument(
+    "after", type=str, location="args", required=False, help="Cursor returned with the previous page"
+)
+
+# Pagination Query String Arguments
+page_args = reqparse.RequestParser()
+page_args.add_argument(
+    "limit", type=int, location="args", required=False, help="Maximum number of results per page"
+)
+page_args.add_argument(
+    "after", type=str, location="args", required=False, help="Cursor returned with the previous page"
+)
 
 
 ######################################################################
@@ -100,9 +225,13 @@ class WishlistResource(Resource):
     # ---------------------------------------------------------------------
     #                READ A WISHLIST
     # ---------------------------------------------------------------------
-    @api.doc("get_wishlists")
+    @query_budget(3)
+    @api.doc("get_wishlists", params=MASK_PARAMS)
+    @api.response(200, "Success", wishlist_model)
+    @api.response(304, "Wishlist not modified since the ETag in If-None-Match")
     @api.response(404, "Wishlist could not be found")
-    @api.marshal_with(wishlist_model)
+    @api.header("ETag", "Version of the Wishlist")
+    @api.header("Last-Modified", "Time of the last change to the Wishlist")
     def get(self, wishlist_id):
         """
         Get a Wishlist
@@ -112,18 +241,16 @@ class WishlistResource(Resource):
         app.logger.info("Request for Wishlist with id: %s", wishlist_id)
 
         # See if the wishlist exists and abort if it doesn't
-        wishlist = Wishlist.find(wishlist_id)
-        if not wishlist:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Wishlist with id '{wishlist_id}' could not be found."
-            )
+        wishlist, headers = read_wishlist(wishlist_id, "wishlist")
+        if wishlist is None:
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
 
-        return wishlist.serialize(), status.HTTP_200_OK
+        return json_response(wishlist, status.HTTP_200_OK, headers)
 
     # ---------------------------------------------------------------------
     #                UPDATE A WISHLIST
     # ---------------------------------------------------------------------
+    @query_budget(5)
     @api.doc("update_wishlists")
     @api.response(404, "Wishlist not found")
     @api.response(400, "The posted Wishlist data was not valid")
@@ -151,23 +278,17 @@ class WishlistResource(Resource):
         # Update the wishlist with the data posted
         body = api.payload
 
-        # Checking for conflicts when renaming
-        update_wl = Wishlist.find_by_name(body['wishlist_name'])
-        if len(update_wl) > 0:
-            if update_wl[0].id != wishlist.id:
-                abort(
-                    status.HTTP_409_CONFLICT,
-                    f"Wishlist with '{body['wishlist_name']}' already exists."
-                )
-
+        # A rename to a name that is taken is rejected by the database with a 409
         wishlist.deserialize(body)
         wishlist.update()
+        get_cache().delete(wishlist.id)
 
         return wishlist.serialize(), status.HTTP_200_OK
 
     # ---------------------------------------------------------------------
     #                DELETE A WISHLIST
     # ---------------------------------------------------------------------
+    @query_budget(3)
     @api.doc("delete_wishlists")
     @api.response(204, "Wishlist deleted")
     def delete(self, wishlist_id):
@@ -182,6 +303,7 @@ class WishlistResource(Resource):
         wishlist = Wishlist.find(wishlist_id)
         if wishlist:
             wishlist.delete()
+            get_cache().delete(wishlist_id)
 
         return "", status.HTTP_204_NO_CONTENT
 
@@ -196,31 +318,46 @@ class WishlistCollection(Resource):
     # ---------------------------------------------------------------------
     #                LIST ALL WISHLISTS
     # ---------------------------------------------------------------------
-    @api.doc("list_wishlists")
+    @query_budget(1 + PAGE_PRODUCT_QUERIES)
+    @api.doc("list_wishlists", params=MASK_PARAMS)
+    @api.response(400, "Invalid pagination arguments")
+    @api.header("Link", "URL of the next page, if there is one")
+    @api.header("X-Next-Cursor", "Cursor to pass as 'after' to get the next page")
+    @api.response(200, "Success", [wishlist_model])
     @api.expect(wishlist_args, validate=True)
-    @api.marshal_list_with(wishlist_model)
     def get(self):
         """
         Return all wishlists
 
-        This endpoint will return all Wishlists in the database
+        This endpoint will return the Wishlists in the database one page at a time,
+        ordered by id. Pass the cursor of the previous page as 'after' to continue.
+        The Wishlists can be narrowed down to those of one user and archived state.
         """
         app.logger.info("Request for a list of Wishlists")
 
         # Filtering by wishlist name, if needed
         args = wishlist_args.parse_args()
         if args["wishlist_name"]:
-            wishlists = Wishlist.find_by_name(args["wishlist_name"])
-            wishlists = [] if len(wishlists) == 0 else [wishlists[0].serialize()]
-        else:
-            # Return as an array of JSON
-            wishlists = [wishlist.serialize() for wishlist in Wishlist.all()]
-
-        return wishlists, status.HTTP_200_OK
+            wishlists = Wishlist.rows_page(limit=1, wishlist_name=args["wishlist_name"])
+            return json_response(wishlists, status.HTTP_200_OK)
+
+        # Fetch one extra row to find out whether there is a next page
+        limit, after = get_page_args(args, int)
+        # The rows are read-only, so they skip the ORM and are already serialized
+        filters = {name: args[name] for name in ("user_id", "archived") if args[name] is not None}
+        wishlists = Wishlist.rows_page(after=after[0] if after else None, limit=limit + 1, **filters)
+        headers = {}
+        if len(wishlists) > limit:
+            wishlists = wishlists[:limit]
+            headers = next_page_headers(WishlistCollection, encode_cursor(wishlists[-1]["id"]), limit=limit, **filters)
+
+        # Return as an array of JSON
+        return json_response(wishlists, status.HTTP_200_OK, headers)
 
     # ---------------------------------------------------------------------
     #                CREATE A WISHLIST
     # ---------------------------------------------------------------------
+    @query_budget(3)
     @api.doc("create_wishlists")
     @api.response(400, "Invalid wishlist request body")
     @api.response(409, "Wishlist name taken")
@@ -240,13 +377,8 @@ class WishlistCollection(Resource):
         wishlist = Wishlist()
         data = api.payload
         wishlist.deserialize(data)
-        if len(Wishlist.find_by_name(data["wishlist_name"])) > 0:
-            abort(
-                status.HTTP_409_CONFLICT,
-                f"Name: {data['wishlist_name']} has been taken."
-            )
-        else:
-            wishlist.create()
+        # A name that is taken is rejected by the database with a 409
+        wishlist.create()
 
         res = wishlist.serialize()
         location_url = api.url_for(WishlistResource, wishlist_id=wishlist.id, _external=True)
@@ -254,6 +386,143 @@ class WishlistCollection(Resource):
         return res, status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+# PATH: /wishlists/export
+######################################################################
+@api.route("/wishlists/export", strict_slashes=False)
+class WishlistExport(Resource):
+    """ Handles exporting every Wishlist """
+
+    # ---------------------------------------------------------------------
+    #                EXPORT ALL WISHLISTS
+    # ---------------------------------------------------------------------
+    # Reads the Wishlists EXPORT_CHUNK_SIZE at a time
+    @query_budget(None)
+    @api.doc("export_wishlists")
+    @api.produces([NDJSON_MIMETYPE])
+    @api.response(200, "One Wishlist per line as newline-delimited JSON")
+    def get(self):
+        """
+        Export all wishlists
+
+        This endpoint streams every Wishlist and its products as newline-delimited JSON
+        """
+        app.logger.info("Request to export all Wishlists")
+        lines = dump_wishlists(app.config["EXPORT_CHUNK_SIZE"])
+        return Response(stream_with_context(lines), status=status.HTTP_200_OK, mimetype=NDJSON_MIMETYPE)
+
+
+######################################################################
+# PATH: /wishlists/import
+######################################################################
+@api.route("/wishlists/import", strict_slashes=False)
+class WishlistImport(Resource):
+    """ Handles importing many Wishlists """
+
+    # ---------------------------------------------------------------------
+    #                IMPORT WISHLISTS
+    # ---------------------------------------------------------------------
+    # Writes the Wishlists IMPORT_CHUNK_SIZE at a time
+    @query_budget(None)
+    @api.doc("import_wishlists")
+    @api.response(415, "Invalid header content-type")
+    @api.marshal_with(import_result_model)
+    def post(self):
+        """
+        Import wishlists
+
+        This endpoint creates the Wishlists posted as newline-delimited JSON, one per line.
+        Lines that are invalid or whose name is taken are reported and skipped.
+        """
+        app.logger.info("Request to import Wishlists")
+        check_content_type(NDJSON_MIMETYPE)
+
+        errors = []
+
+        def report(line, message):
+            if len(errors) < app.config["IMPORT_ERRORS_MAX"]:
+                errors.append({"line": line, "message": message})
+
+        lines = iter(request.stream.readline, b"")
+        imported, failed = load_wishlists(lines, app.config["IMPORT_CHUNK_SIZE"], report)
+        return {"imported": imported, "failed": failed, "errors": errors}, status.HTTP_200_OK
+
+
+######################################################################
+# PATH: /wishlists/summaries
+######################################################################
+@api.route("/wishlists/summaries", strict_slashes=False)
+class WishlistSummaryCollection(Resource):
+    """ Handles the summaries of collections of Wishlists """
+
+    # ---------------------------------------------------------------------
+    #                LIST ALL WISHLIST SUMMARIES
+    # ---------------------------------------------------------------------
+    @query_budget(1)
+    @api.doc("list_wishlist_summaries", params=MASK_PARAMS)
+    @api.response(400, "Invalid pagination arguments")
+    @api.header("Link", "URL of the next page, if there is one")
+    @api.header("X-Next-Cursor", "Cursor to pass as 'after' to get the next page")
+    @api.response(200, "Success", [wishlist_summary_model])
+    @api.expect(wishlist_args, validate=True)
+    def get(self):
+        """
+        Return the summaries of all wishlists
+
+        This endpoint will return the product count and price totals of the Wishlists,
+        one page at a time and with the same filters as the list of Wishlists
+        """
+        app.logger.info("Request for a list of Wishlist summaries")
+        args = wishlist_args.parse_args()
+        limit, after = get_page_args(args, int)
+
+        # Fetch one extra row to find out whether there is a next page
+        filters = {name: args[name] for name in ("wishlist_name", "user_id", "archived") if args[name] is not None}
+        summaries = Wishlist.summary_rows(after=after[0] if after else None, limit=limit + 1, **filters)
+        headers = {}
+        if len(summaries) > limit:
+            summaries = summaries[:limit]
+            cursor = encode_cursor(summaries[-1].id)
+            headers = next_page_headers(WishlistSummaryCollection, cursor, limit=limit, **filters)
+        return json_response([serialize_summary(summary) for summary in summaries], status.HTTP_200_OK, headers)
+
+
+######################################################################
+# PATH: /wishlists/<wishlist_id>/summary
+######################################################################
+@api.route("/wishlists/<int:wishlist_id>/summary")
+@api.param("wishlist_id", "The Wishlist identifier")
+class WishlistSummaryResource(Resource):
+    """ Handles the summary of a Wishlist """
+
+    # ---------------------------------------------------------------------
+    #                RETRIEVE A WISHLIST SUMMARY
+    # ---------------------------------------------------------------------
+    @query_budget(1)
+    @api.doc("get_wishlist_summary", params=MASK_PARAMS)
+    @api.response(200, "Success", wishlist_summary_model)
+    @api.response(304, "Summary not modified since the ETag in If-None-Match")
+    @api.response(404, "Wishlist not found")
+    @api.header("ETag", "Version of the Wishlist")
+    @api.header("Last-Modified", "Time of the last change to the Wishlist")
+    def get(self, wishlist_id):
+        """
+        Retrieve the summary of a single Wishlist
+
+        This endpoint will return the product count and price totals of a Wishlist
+        """
+        app.logger.info("Request for the summary of Wishlist with id: %s", wishlist_id)
+        summaries = Wishlist.summary_rows(id=wishlist_id)
+        if not summaries:
+            abort(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        summary = summaries[0]
+        etag = f"{wishlist_id}-{summary.version}-summary"
+        headers = validator_headers(etag, summary.last_updated)
+        if is_not_modified(etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+        return json_response(serialize_summary(summary), status.HTTP_200_OK, headers)
+
+
 ######################################################################
 # PATH: /wishlists/<wishlist_id>/archive
 ######################################################################
@@ -265,6 +534,7 @@ class ArchiveResource(Resource):
     # ---------------------------------------------------------------------
     #                ARCHIVE A WISHLIST
     # ---------------------------------------------------------------------
+    @query_budget(5)
     @api.doc("archive_wishlists")
     @api.response(404, "Wishlist not found")
     @api.marshal_with(wishlist_model)
@@ -287,6 +557,7 @@ class ArchiveResource(Resource):
         # Archive the fetched wishlist
         wishlist.archived = True
         wishlist.update()
+        get_cache().delete(wishlist.id)
 
         return wishlist.serialize(), status.HTTP_200_OK
 
@@ -302,6 +573,7 @@ class UnarchiveResource(Resource):
     # ---------------------------------------------------------------------
     #                UNARCHIVE A WISHLIST
     # ---------------------------------------------------------------------
+    @query_budget(5)
     @api.doc("unarchive_wishlists")
     @api.response(404, "Wishlist not found")
     @api.marshal_with(wishlist_model)
@@ -324,6 +596,7 @@ class UnarchiveResource(Resource):
         # Archive the fetched wishlist
         wishlist.archived = False
         wishlist.update()
+        get_cache().delete(wishlist.id)
 
         return wishlist.serialize(), status.HTTP_200_OK
 
@@ -340,9 +613,13 @@ class ItemResource(Resource):
     # ---------------------------------------------------------------------
     #                READ AN ITEM
     # ---------------------------------------------------------------------
-    @api.doc("get_items")
+    @query_budget(1)
+    @api.doc("get_items", params=MASK_PARAMS)
+    @api.response(200, "Success", product_model)
+    @api.response(304, "Item not modified since the ETag in If-None-Match")
     @api.response(404, "Item not found")
-    @api.marshal_with(product_model)
+    @api.header("ETag", "Version of the Item")
+    @api.header("Last-Modified", "Time of the last change to the Wishlist of the Item")
     def get(self, wishlist_id, product_id):
         """
         Get an Item
@@ -352,15 +629,22 @@ class ItemResource(Resource):
         app.logger.info("Request to retrieve a Product with id %s from Wishlist %s", product_id, wishlist_id)
 
         # See if the product exists, and abort if it does not
-        product = Product.find(product_id)
-        if not product:
+        found = Product.find_with_version(product_id)
+        if not found:
             abort(status.HTTP_404_NOT_FOUND, f"Product with id '{product_id}' was not found.")
 
-        return product.serialize(), status.HTTP_200_OK
+        product, version, last_updated = found
+        etag = f"{product.wishlist_id}-{version}-product-{product.id}"
+        headers = validator_headers(etag, last_updated)
+        if is_not_modified(etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+
+        return json_response(serialize_product(product), status.HTTP_200_OK, headers)
 
     # ---------------------------------------------------------------------
     #                UPDATE AN ITEM
     # ---------------------------------------------------------------------
+    @query_budget(4)
     @api.doc("update_items")
     @api.response(404, "Wishlist Item not found")
     @api.response(400, "Posted Item data not valid")
@@ -386,12 +670,14 @@ class ItemResource(Resource):
         product.id = product_id
         product.wishlist_id = original_wishlist_id
         product.update()
+        get_cache().delete(original_wishlist_id)
 
         return product.serialize(), status.HTTP_200_OK
 
     # ---------------------------------------------------------------------
     #                DELETE AN ITEM
     # ---------------------------------------------------------------------
+    @query_budget(3)
     @api.doc("delete_items")
     @api.response(204, 'Item deleted')
     def delete(self, wishlist_id, product_id):
@@ -405,7 +691,9 @@ class ItemResource(Resource):
         # See if the product exists, and delete it if it does
         product = Product.find(product_id)
         if product:
+            owner_id = product.wishlist_id
             product.delete()
+            get_cache().delete(owner_id)
 
         return "", status.HTTP_204_NO_CONTENT
 
@@ -421,36 +709,61 @@ class ItemCollection(Resource):
     # ---------------------------------------------------------------------
     #                LIST ALL ITEMS
     # ---------------------------------------------------------------------
-    @api.doc("list_items")
+    @query_budget(3)
+    @api.doc("list_items", params=MASK_PARAMS)
+    @api.response(200, "Success", [product_model])
+    @api.response(304, "Items not modified since the ETag in If-None-Match")
+    @api.response(400, "Invalid filter or pagination arguments")
     @api.response(404, 'Wishlist not found')
-    @api.marshal_list_with(product_model)
+    @api.header("ETag", "Version of the Wishlist")
+    @api.header("Last-Modified", "Time of the last change to the Wishlist")
+    @api.header("Link", "URL of the next page, if there is one")
+    @api.header("X-Next-Cursor", "Cursor to pass as 'after' to get the next page")
+    @api.expect(product_args, validate=True)
     def get(self, wishlist_id):
         """
         Return all products in a wishlist
 
-        This endpoint will return all products in the given wishlist
+        This endpoint will return all products in the given wishlist. When any
+        filter, sort order or page size is given, the products are filtered and
+        sorted by the database and returned one page at a time.
         """
         app.logger.info("Request for all Products in Wishlist with id: %s", wishlist_id)
+        args = product_args.parse_args()
 
-        # See if the wishlist exists, and abort if it does not
-        wishlist = Wishlist.find(wishlist_id)
-        if not wishlist:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Wishlist with id '{wishlist_id}' cannot be found."
-            )
+        # Without any arguments, the whole list is served from the cached Wishlist
+        if all(value is None for value in args.values()):
+            wishlist, headers = read_wishlist(wishlist_id, "products")
+            if wishlist is None:
+                return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+            return json_response(wishlist["wishlist_products"], status.HTTP_200_OK, headers)
 
-        res = [product.serialize() for product in wishlist.wishlist_products]
+        sort = args["sort"] or "id"
+        limit, after = get_page_args(args, *PRODUCT_SORT_KEYS[sort])
 
-        # Filtering, if needed
-        args = product_args.parse_args()
-        if args["product_id"]:
-            res = [product for product in res if product["product_id"] == int(args["product_id"])]
-        return res, status.HTTP_200_OK
+        # See if the wishlist exists, and abort if it does not
+        found = Wishlist.find_version(wishlist_id)
+        if not found:
+            abort(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        etag = f"{wishlist_id}-{found.version}-products-{hashlib.sha1(request.query_string).hexdigest()[:16]}"
+        headers = validator_headers(etag, found.last_updated)
+        if is_not_modified(etag):
+            return json_response(None, status.HTTP_304_NOT_MODIFIED, headers)
+
+        # Fetch one extra row to find out whether there is a next page
+        filters = {name: args[name] for name in ("product_id", "min_price", "max_price")}
+        products = Product.rows_page(wishlist_id, sort=sort, after=after, limit=limit + 1, **filters)
+        if len(products) > limit:
+            products = products[:limit]
+            cursor = keyset_cursor(products[-1], sort)
+            query = {name: value for name, value in args.items() if value is not None and name != "after"}
+            headers.update(next_page_headers(ItemCollection, cursor, wishlist_id=wishlist_id, **dict(query, limit=limit)))
+        return json_response(products, status.HTTP_200_OK, headers)
 
     # ---------------------------------------------------------------------
     #                CREATE AN ITEM
     # ---------------------------------------------------------------------
+    @query_budget(6)
     @api.doc("create_items")
     @api.response(400, "Invalid item request body")
     @api.response(404, "Wishlist id not found")
@@ -481,16 +794,181 @@ class ItemCollection(Resource):
         # Adding the product to the wishlist
         wishlist.wishlist_products.append(product)
         wishlist.update()
+        get_cache().delete(wishlist.id)
 
         message = product.serialize()
         location_url = api.url_for(ItemResource, wishlist_id=wishlist.id, product_id=product.id, _external=True)
         return message, status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+# PATH: /wishlists/<wishlist_id>/products/batch
+######################################################################
+@api.route("/wishlists/<int:wishlist_id>/products/batch", strict_slashes=False)
+@api.param("wishlist_id", "Wishlist identifier")
+class ItemBatch(Resource):
+    """ Handles adding many Items to a Wishlist at once """
+
+    # ---------------------------------------------------------------------
+    #                CREATE MANY ITEMS
+    # ---------------------------------------------------------------------
+    @query_budget(3)
+    @api.doc("create_item_batch")
+    @api.response(400, "Invalid item request body")
+    @api.response(404, "Wishlist id not found")
+    @api.response(415, "Invalid header content-type")
+    @api.expect([create_product_model])
+    @api.marshal_list_with(product_model, code=201)
+    def post(self, wishlist_id):
+        """
+        Create many Items
+
+        This endpoint will add an array of products to a wishlist in a single transaction.
+        Every product is validated before any of them is added.
+        """
+        app.logger.info("Request to add a batch of Products to Wishlist with id: %s", wishlist_id)
+        check_content_type("application/json")
+
+        # See if the wishlist exists, and abort if it does not
+        if not Wishlist.exists(wishlist_id):
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{wishlist_id}' was not found."
+            )
+
+        data = api.payload
+        if not isinstance(data, list) or len(data) == 0:
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be a non-empty array of products")
+        if len(data) > app.config["BATCH_SIZE_MAX"]:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                f"A batch can hold at most {app.config['BATCH_SIZE_MAX']} products"
+            )
+
+        # Validate every product before writing any of them
+        products = []
+        for position, item in enumerate(data):
+            try:
+                product = Product().deserialize(item)
+            except DataValidationError as error:
+                raise DataValidationError(f"Product at index {position}: {error}") from error
+            product.wishlist_id = wishlist_id
+            products.append(product)
+
+        created = Product.bulk_create(products)
+        get_cache().delete(wishlist_id)
+        return [product.serialize() for product in created], status.HTTP_201_CREATED
+
+
+######################################################################
+# PATH: /skus/<product_id>
+######################################################################
+@api.route("/skus/<int:product_id>")
+@api.param("product_id", "The SKU of the product")
+class SkuResource(Resource):
+    """ Handles a SKU across every Wishlist """
+
+    # ---------------------------------------------------------------------
+    #                REPRICE A SKU
+    # ---------------------------------------------------------------------
+    # Touches the Wishlists holding the SKU ROWS_IN_CHUNK_SIZE at a time
+    @query_budget(None)
+    @api.doc("reprice_sku")
+    @api.response(400, "The posted price was not valid")
+    @api.response(415, "Invalid header content-type")
+    @api.expect(sku_price_model)
+    @api.marshal_with(reprice_result_model)
+    def put(self, product_id):
+        """
+        Reprice a SKU
+
+        This endpoint will change the price, and optionally the name, of the product
+        in every Wishlist that contains it, with a single UPDATE
+        """
+        app.logger.info("Request to reprice SKU: %s", product_id)
+        check_content_type("application/json")
+        body = api.payload
+        if not isinstance(body, dict):
+            abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON object")
+
+        updated, wishlist_ids = Product.reprice([dict(body, product_id=product_id)])
+        cache = get_cache()
+        for wishlist_id in wishlist_ids:
+            cache.delete(wishlist_id)
+        return {"product_id": product_id, "updated": updated}, status.HTTP_200_OK
+
+
+######################################################################
+# PATH: /skus/<product_id>/wishlists
+######################################################################
+@api.route("/skus/<int:product_id>/wishlists", strict_slashes=False)
+@api.param("product_id", "The SKU of the product")
+class SkuWishlistCollection(Resource):
+    """ Handles the Wishlists that contain a SKU """
+
+    # ---------------------------------------------------------------------
+    #                LIST THE WISHLISTS CONTAINING A SKU
+    # ---------------------------------------------------------------------
+    @query_budget(1)
+    @api.doc("list_sku_wishlists", params=MASK_PARAMS)
+    @api.response(400, "Invalid pagination arguments")
+    @api.header("Link", "URL of the next page, if there is one")
+    @api.header("X-Next-Cursor", "Cursor to pass as 'after' to get the next page")
+    @api.response(200, "Success", [wishlist_owner_model])
+    @api.expect(page_args, validate=True)
+    def get(self, product_id):
+        """
+        Return the wishlists that contain a SKU
+
+        This endpoint will return the ids and owners of the Wishlists containing the product,
+        one page at a time and ordered by Wishlist id
+        """
+        app.logger.info("Request for the Wishlists containing SKU: %s", product_id)
+        limit, after = get_page_args(page_args.parse_args(), int)
+
+        # Fetch one extra row to find out whether there is a next page
+        owners = Product.find_wishlist_owners(product_id, after=after[0] if after else None, limit=limit + 1)
+        headers = {}
+        if len(owners) > limit:
+            owners = owners[:limit]
+            cursor = encode_cursor(owners[-1].wishlist_id)
+            headers = next_page_headers(SkuWishlistCollection, cursor, product_id=product_id, limit=limit)
+        return json_response([serialize_owner(owner) for owner in owners], status.HTTP_200_OK, headers)
+
+
+######################################################################
+# PATH: /skus/<product_id>/wishlists/export
+######################################################################
+@api.route("/skus/<int:product_id>/wishlists/export", strict_slashes=False)
+@api.param("product_id", "The SKU of the product")
+class SkuWishlistExport(Resource):
+    """ Handles exporting the Wishlists that contain a SKU """
+
+    # ---------------------------------------------------------------------
+    #                EXPORT THE WISHLISTS CONTAINING A SKU
+    # ---------------------------------------------------------------------
+    # Reads the owners EXPORT_CHUNK_SIZE at a time
+    @query_budget(None)
+    @api.doc("export_sku_wishlists")
+    @api.produces([NDJSON_MIMETYPE])
+    @api.response(200, "One Wishlist id and owner per line as newline-delimited JSON")
+    def get(self, product_id):
+        """
+        Export the wishlists that contain a SKU
+
+        This endpoint streams the ids and owners of every Wishlist containing the product
+        as newline-delimited JSON, for SKUs that are in too many Wishlists to page through
+        """
+        app.logger.info("Request to export the Wishlists containing SKU: %s", product_id)
+        lines = dump_wishlist_owners(product_id, app.config["EXPORT_CHUNK_SIZE"])
+        return Response(stream_with_context(lines), status=status.HTTP_200_OK, mimetype=NDJSON_MIMETYPE)
+
+
 ######################################################################
 # K U B E R N E T E S   H E A L T H   C H E C K
 ######################################################################
 @app.route('/health')
+@query_budget(0)
 def check_kubernetes():
     """
     Health check for kubernetes
@@ -498,11 +976,151 @@ def check_kubernetes():
     return make_response(jsonify(status=200, message="Healthy"), status.HTTP_200_OK)
 
 
+######################################################################
+# C A C H E   S T A T I S T I C S
+######################################################################
+@app.route('/stats/cache')
+@query_budget(0)
+def cache_stats():
+    """
+    Hit, miss and eviction counters of the wishlist cache in this worker
+    """
+    return make_response(jsonify(get_cache().stats()), status.HTTP_200_OK)
+
+
+######################################################################
+# C O N N E C T I O N   P O O L   S T A T I S T I C S
+######################################################################
+@app.route('/stats/pool')
+@query_budget(0)
+def connection_pool_stats():
+    """
+    Checked-out, idle and overflow connection counts of this worker
+    """
+    stats = pool_status()
+    stats["max_overflow"] = app.config["DB_MAX_OVERFLOW"]
+    return make_response(jsonify(stats), status.HTTP_200_OK)
+
+
+######################################################################
+# P R O M E T H E U S   M E T R I C S
+######################################################################
+@app.route('/metrics')
+@query_budget(0)
+def prometheus_metrics():
+    """
+    Request latency, status and database metrics of every worker, for Prometheus
+    """
+    data, content_type = render_metrics()
+    return Response(data, status=status.HTTP_200_OK, content_type=content_type)
+
+
 ######################################################################
 # U T I L I T Y   F U N C T I O N S
 ######################################################################
 
 
+def read_wishlist(wishlist_id, representation):
+    """
+    Reads a serialized Wishlist through the cache, honoring If-None-Match
+
+    The cache is not shared with the other workers nor with the ASGI app, so
+    a cached entry is only served once a lookup of the version of the
+    Wishlist by its primary key has shown that it is still current; the
+    same lookup answers the clients that already hold the current version.
+    Entries cached by a read that raced with a write are caught that way
+    too. Otherwise the Wishlist is read as plain rows, without hydrating
+    ORM objects.
+
+    Args:
+        wishlist_id (int): the id of the Wishlist
+        representation (str): the name of the representation, part of its ETag
+
+    Returns:
+        tuple: the serialized Wishlist, or None if the client's copy is not
+        modified, and the ETag and Last-Modified headers
+    """
+    cache = get_cache()
+    entry = cache.get(wishlist_id)
+    if entry is not None or request.if_none_match:
+        found = Wishlist.find_version(wishlist_id)
+        if not found:
+            cache.delete(wishlist_id)
+            abort(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        etag = f"{wishlist_id}-{found.version}-{representation}"
+        if is_not_modified(etag):
+            return None, validator_headers(etag, found.last_updated)
+        if entry is not None and entry["version"] != found.version:
+            # Changed by another process since it was cached
+            cache.delete(wishlist_id)
+            entry = None
+
+    if entry is None:
+        found = Wishlist.find_row(wishlist_id)
+        if not found:
+            abort(status.HTTP_404_NOT_FOUND, f"Wishlist with id '{wishlist_id}' could not be found.")
+        wishlist, version, last_updated = found
+        entry = {"wishlist": wishlist, "version": version, "last_updated": last_updated}
+        cache.set(wishlist_id, entry)
+
+    etag = f"{wishlist_id}-{entry['version']}-{representation}"
+    headers = validator_headers(etag, entry["last_updated"])
+    if is_not_modified(etag):
+        return None, headers
+    return entry["wishlist"], headers
+
+
+def json_response(data, code, headers=None):
+    """
+    Builds a JSON response from data that is already in its marshalled form
+
+    The read routes use this instead of @api.marshal_with, so their output
+    is not walked again field by field. Like @api.marshal_with, it keeps
+    only the fields selected by the mask of the X-Fields header, if any.
+    """
+    mask = request.headers.get(MASK_HEADER)
+    if data is not None and mask:
+        data = apply_mask(data, mask, skip=True)
+    body = None if data is None else json.dumps(data, separators=(",", ":"))
+    return app.response_class(body, status=code, headers=headers, mimetype="application/json")
+
+
+def validator_headers(etag, last_updated):
+    """Returns the ETag and Last-Modified headers of a representation"""
+    headers = {"ETag": quote_etag(masked_etag(etag))}
+    if last_updated:
+        headers["Last-Modified"] = http_date(last_updated.replace(tzinfo=timezone.utc))
+    return headers
+
+
+def is_not_modified(etag):
+    """Checks whether the If-None-Match header of the request matches the ETag"""
+    return request.if_none_match.contains_weak(masked_etag(etag))
+
+
+def masked_etag(etag):
+    """Returns the ETag of the fields selected by the mask of the request, if any"""
+    mask = request.headers.get(MASK_HEADER)
+    if not mask:
+        return etag
+    return f"{etag}-fields-{hashlib.sha1(mask.encode()).hexdigest()[:16]}"
+
+
+def next_page_headers(resource, cursor, **params):
+    """Returns the Link and X-Next-Cursor headers of the page after cursor, with the same params"""
+    next_url = api.url_for(resource, after=cursor, _external=True, **params)
+    return {"Link": link_header(next_url), "X-Next-Cursor": cursor}
+
+
+def get_page_args(args, *key_types):
+    """Returns the page size and the decoded 'after' cursor of a paginated request"""
+    try:
+        page = parse_page_args(args, app.config["PAGE_SIZE_DEFAULT"], app.config["PAGE_SIZE_MAX"], *key_types)
+    except ValueError as error:
+        abort(status.HTTP_400_BAD_REQUEST, str(error))
+    return page
+
+
 def check_content_type(media_type):
     """Checks that the media type is correct"""
     content_type = request.headers.get("Content-Type")
@@ -0,0 +1,131 @@
+"""
+Test cases for the Wishlist Cache
+
+"""
+from unittest import TestCase
+from flask import Flask
+from service.common.cache import CacheBackend, LRUCache, NullCache, init_cache
+
+
+class FakeClock:
+    """A clock that only moves when told to"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DictCache(CacheBackend):
+    """A stand-in for the client of a shared cache, keeping its entries in a dict"""
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "dict", "hits": self.hits, "misses": self.misses, "evictions": 0, "expirations": 0,
+            "size": len(self.entries),
+        }
+
+
+######################################################################
+#  C A C H E   T E S T   C A S E S
+######################################################################
+class TestCache(TestCase):
+    """ Test Cases for the Wishlist Cache """
+
+    def test_hit_and_miss(self):
+        """It should count hits and misses"""
+        cache = LRUCache(max_size=2, ttl=10)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, {"id": 1})
+        self.assertEqual(cache.get(1), {"id": 1})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+
+    def test_lru_eviction(self):
+        """It should evict the least recently used entry"""
+        cache = LRUCache(max_size=2, ttl=10)
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.get(1)
+        cache.set(3, "three")
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), "one")
+        self.assertEqual(cache.get(3), "three")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiration(self):
+        """It should expire entries after their time-to-live"""
+        clock = FakeClock()
+        cache = LRUCache(max_size=2, ttl=10, clock=clock)
+        cache.set(1, "one")
+        clock.now = 9.9
+        self.assertEqual(cache.get(1), "one")
+        clock.now = 10
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_delete_and_clear(self):
+        """It should invalidate single entries and everything"""
+        cache = LRUCache()
+        cache.set(1, "one")
+        cache.set(2, "two")
+        cache.delete(1)
+        cache.delete(42)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), "two")
+        cache.clear()
+        self.assertIsNone(cache.get(2))
+
+    def test_null_cache(self):
+        """It should never store anything when caching is disabled"""
+        cache = NullCache()
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+        cache.delete(1)
+        cache.clear()
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_backend_interface(self):
+        """It should require backends to implement every operation"""
+        cache = CacheBackend()
+        self.assertRaises(NotImplementedError, cache.get, 1)
+        self.assertRaises(NotImplementedError, cache.set, 1, "one")
+        self.assertRaises(NotImplementedError, cache.delete, 1)
+        self.assertRaises(NotImplementedError, cache.clear)
+        self.assertRaises(NotImplementedError, cache.stats)
+
+    def test_init_cache(self):
+        """It should create the configured backend"""
+        app = Flask(__name__)
+        app.config.update(CACHE_BACKEND="memory", CACHE_MAX_SIZE=5, CACHE_TTL=1)
+        self.assertIsInstance(init_cache(app), LRUCache)
+        app.config["CACHE_BACKEND"] = "none"
+        self.assertIsInstance(init_cache(app), NullCache)
+        app.config["CACHE_BACKEND"] = "tests.test_cache:DictCache"
+        self.assertIsInstance(init_cache(app), DictCache)
+        self.assertIsInstance(app.extensions["wishlist_cache"], DictCache)
@@ -5,7 +5,11 @@ import os
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service.migrations import MigrationError
+from service.common.cli_commands import (
+    db_create, db_upgrade, db_downgrade, db_version, wishlists_export, wishlists_import, wishlists_generate,
+    skus_reprice,
+)
 
 
 class TestFlaskCLI(TestCase):
@@ -14,10 +18,120 @@ class TestFlaskCLI(TestCase):
     def setUp(self):
         self.runner = CliRunner()
 
+    @patch('service.common.cli_commands.migrations')
     @patch('service.common.cli_commands.db')
-    def test_db_create(self, db_mock):
+    def test_db_create(self, db_mock, migrations_mock):
         """It should call the db-create command"""
         db_mock.return_value = MagicMock()
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+        migrations_mock.stamp.assert_called_once_with()
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_upgrade(self, migrations_mock):
+        """It should call the db-upgrade command"""
+        migrations_mock.upgrade.return_value = [1]
+        migrations_mock.current_version.return_value = 1
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade, ["--version", "1"])
+            self.assertEqual(result.exit_code, 0)
+        migrations_mock.upgrade.assert_called_once_with(1)
+        self.assertIn("Schema version: 1", result.output)
+
+        migrations_mock.MigrationError = MigrationError
+        migrations_mock.upgrade.side_effect = MigrationError("Unknown schema version 9, latest is 5")
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_upgrade, ["--version", "9"])
+            self.assertEqual(result.exit_code, 1)
+        self.assertIn("Unknown schema version 9", result.output)
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_downgrade(self, migrations_mock):
+        """It should call the db-downgrade command"""
+        migrations_mock.downgrade.return_value = [1]
+        migrations_mock.current_version.return_value = 0
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_downgrade, ["--version", "0"])
+            self.assertEqual(result.exit_code, 0)
+        migrations_mock.downgrade.assert_called_once_with(0)
+        self.assertIn("Reverted migrations: [1]", result.output)
+
+    @patch('service.common.cli_commands.migrations')
+    def test_db_version(self, migrations_mock):
+        """It should call the db-version command"""
+        migrations_mock.current_version.return_value = 0
+        migrations_mock.head.return_value = 1
+        migrations_mock.MIGRATIONS = [MagicMock(version=1, description="first")]
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_version)
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("pending 1: first", result.output)
+
+    @patch('service.common.cli_commands.dump_wishlists')
+    def test_wishlists_export(self, dump_mock):
+        """It should call the wishlists-export command"""
+        dump_mock.return_value = iter(['{"id":1}\n', '{"id":2}\n'])
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(wishlists_export, ["--chunk-size", "10"])
+            self.assertEqual(result.exit_code, 0)
+        dump_mock.assert_called_once_with(10)
+        self.assertEqual(result.output, '{"id":1}\n{"id":2}\n')
+
+    @patch('service.common.cli_commands.load_wishlists')
+    def test_wishlists_import(self, load_mock):
+        """It should call the wishlists-import command and report rejected lines"""
+        def load(lines, chunk_size, on_error):  # pylint: disable=unused-argument
+            on_error(2, "bad line")
+            return 1, 1
+
+        load_mock.side_effect = load
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(wishlists_import, ["-", "--chunk-size", "10"], input='{"id":1}\n')
+            self.assertEqual(result.exit_code, 0)
+        self.assertIn("line 2: bad line", result.output)
+        self.assertIn("Imported 1 wishlists, rejected 1 lines", result.output)
+
+    @patch('service.common.cli_commands.generate_wishlists')
+    def test_wishlists_generate(self, generate_mock):
+        """It should call the wishlists-generate command"""
+        generate_mock.return_value = (100, 480)
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(
+                wishlists_generate, ["100", "--distribution", "geometric", "--sku-skew", "0", "--seed", "7"]
+            )
+            self.assertEqual(result.exit_code, 0)
+        generate_mock.assert_called_once_with(
+            100, products=5.0, distribution="geometric", skus=10000, skew=0.0, archived_ratio=0.5, users=None,
+            seed=7, chunk_size=500,
+        )
+        self.assertIn("Generated 100 wishlists with 480 products", result.output)
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(wishlists_generate, ["100", "--distribution", "normal"])
+            self.assertEqual(result.exit_code, 2)
+
+    @patch('service.common.cli_commands.get_cache')
+    @patch('service.common.cli_commands.Product')
+    def test_skus_reprice(self, product_mock, cache_mock):
+        """It should call the skus-reprice command for one SKU or a CSV file"""
+        product_mock.reprice.return_value = (3, [1, 2])
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(skus_reprice, ["--sku", "42", "--price", "9.5"])
+            self.assertEqual(result.exit_code, 0)
+            product_mock.reprice.assert_called_once_with([{"product_id": 42, "product_price": 9.5, "product_name": None}])
+            cache_mock.return_value.delete.assert_any_call(2)
+            self.assertIn("Repriced 1 SKUs, updated 3 products", result.output)
+
+            product_mock.reprice.reset_mock()
+            source = "product_id,product_price,product_name\n1,2.5,\n2,3,New name\n3,4,\n"
+            result = self.runner.invoke(skus_reprice, ["--file", "-", "--chunk-size", "2"], input=source)
+            self.assertEqual(result.exit_code, 0)
+            self.assertEqual(product_mock.reprice.call_count, 2)
+            first_chunk = product_mock.reprice.call_args_list[0].args[0]
+            self.assertEqual(first_chunk[1], {"product_id": 2, "product_price": 3.0, "product_name": "New name"})
+
+            result = self.runner.invoke(skus_reprice, ["--file", "-"], input="product_id,product_price\n1,free\n")
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("line 2", result.output)
+            result = self.runner.invoke(skus_reprice, ["--sku", "42"])
+            self.assertNotEqual(result.exit_code, 0)
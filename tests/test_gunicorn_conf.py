@@ -0,0 +1,135 @@
+"""
+Test cases for the gunicorn configuration
+
+"""
+import os
+import tempfile
+import importlib.util
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from service import app, models
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+spec = importlib.util.spec_from_file_location("gunicorn_conf", CONFIG_PATH)
+gunicorn_conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gunicorn_conf)
+
+
+def write_files(root, files):
+    """Writes cgroup files under a root directory"""
+    for name, content in files.items():
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content + "\n")
+
+
+######################################################################
+#  G U N I C O R N   C O N F I G   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(TestCase):
+    """ Test Cases for the gunicorn configuration """
+
+    def setUp(self):
+        self.scratch = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.root = self.scratch.name
+        self.host_cpus = gunicorn_conf.cpu_limit(self.root)
+
+    def tearDown(self):
+        self.scratch.cleanup()
+
+    def test_cgroup_v2_limits(self):
+        """It should read the CPU quota and memory limit of cgroup v2"""
+        write_files(self.root, {"cpu.max": "20000 100000", "memory.max": str(64 * 1024 * 1024)})
+        self.assertAlmostEqual(gunicorn_conf.cpu_limit(self.root), min(self.host_cpus, 0.2))
+        self.assertEqual(gunicorn_conf.memory_limit(self.root), 64)
+
+    def test_cgroup_v1_limits(self):
+        """It should read the CPU quota and memory limit of cgroup v1"""
+        write_files(self.root, {
+            "cpu/cpu.cfs_quota_us": "50000",
+            "cpu/cpu.cfs_period_us": "100000",
+            "memory/memory.limit_in_bytes": str(128 * 1024 * 1024),
+        })
+        self.assertAlmostEqual(gunicorn_conf.cpu_limit(self.root), min(self.host_cpus, 0.5))
+        self.assertEqual(gunicorn_conf.memory_limit(self.root), 128)
+
+    def test_no_limits(self):
+        """It should use the host CPUs and no memory limit without quotas"""
+        write_files(self.root, {"cpu.max": "max 100000", "memory.max": "max"})
+        self.assertEqual(gunicorn_conf.cpu_limit(self.root), self.host_cpus)
+        self.assertIsNone(gunicorn_conf.memory_limit(self.root))
+        write_files(self.root, {"memory/memory.limit_in_bytes": "9223372036854771712"})
+        os.remove(os.path.join(self.root, "memory.max"))
+        self.assertIsNone(gunicorn_conf.memory_limit(self.root))
+
+    def test_fractional_cpu(self):
+        """It should multiplex requests in a lone worker below one CPU"""
+        settings = gunicorn_conf.tune(0.2, 128, env={})
+        self.assertEqual(settings["worker_class"], "gthread")
+        self.assertEqual((settings["workers"], settings["threads"]), (1, 4))
+        self.assertFalse(settings["preload_app"])
+        self.assertEqual(settings["max_requests"], 0)
+
+        settings = gunicorn_conf.tune(0.2, 128, env={"GUNICORN_WORKER_CLASS": "gevent"})
+        self.assertEqual(settings["worker_class"], "gevent")
+        self.assertEqual(settings["threads"], 1)
+        self.assertFalse(settings["preload_app"])
+
+    def test_many_cpus(self):
+        """It should run preloaded sync workers when memory allows"""
+        settings = gunicorn_conf.tune(4, None, env={})
+        self.assertEqual(settings["worker_class"], "sync")
+        self.assertEqual(settings["workers"], 9)
+        self.assertTrue(settings["preload_app"])
+        self.assertEqual(settings["max_requests"], 10000)
+        self.assertEqual(settings["max_requests_jitter"], 1000)
+
+    def test_memory_bound(self):
+        """It should trade workers for threads when memory runs short"""
+        settings = gunicorn_conf.tune(4, 256, env={})
+        self.assertEqual(settings["worker_class"], "gthread")
+        self.assertEqual(settings["workers"], 8)
+        self.assertEqual(settings["threads"], 4)
+        self.assertTrue(settings["preload_app"])
+        # The arbiter and the first worker take 88 MiB, every other worker 24 MiB
+        self.assertEqual(gunicorn_conf.tune(4, 128, env={})["workers"], 2)
+        self.assertEqual(gunicorn_conf.tune(4, 111, env={})["workers"], 1)
+
+    def test_overrides(self):
+        """It should let environment variables override every choice"""
+        env = {
+            "GUNICORN_WORKER_CLASS": "gthread",
+            "WEB_CONCURRENCY": "2",
+            "GUNICORN_THREADS": "8",
+            "GUNICORN_PRELOAD": "false",
+            "GUNICORN_MAX_REQUESTS": "500",
+            "GUNICORN_TIMEOUT": "60",
+        }
+        settings = gunicorn_conf.tune(1, None, env=env)
+        self.assertEqual(settings["worker_class"], "gthread")
+        self.assertEqual((settings["workers"], settings["threads"]), (2, 8))
+        self.assertFalse(settings["preload_app"])
+        self.assertEqual((settings["max_requests"], settings["max_requests_jitter"]), (500, 50))
+        self.assertEqual(settings["timeout"], 60)
+        self.assertEqual(gunicorn_conf.limits({"GUNICORN_CPUS": "0.5", "GUNICORN_MEMORY": "96"}), (0.5, 96))
+
+    def test_post_worker_init(self):
+        """It should only warm up the pool of a worker when asked to"""
+        worker = MagicMock()
+        with patch.object(models, "warm_up") as warm_up, patch.dict(app.config, {"DB_WARMUP": False}):
+            gunicorn_conf.post_worker_init(worker)
+            warm_up.assert_not_called()
+            app.config["DB_WARMUP"] = True
+            gunicorn_conf.post_worker_init(worker)
+            warm_up.assert_called_once_with(app.config["DB_WARMUP_TRIES"], app.config["DB_WARMUP_DELAY"])
+        self.assertEqual(worker.log.info.call_count, 2)
+
+    def test_clear_metrics(self):
+        """It should remove the metrics files of a previous server"""
+        directory = os.path.join(self.root, "metrics")
+        gunicorn_conf.clear_metrics(directory)
+        write_files(directory, {"counter_12.db": "", "gauge_livesum_12.db": "", "keep.txt": ""})
+        gunicorn_conf.clear_metrics(directory)
+        self.assertEqual(os.listdir(directory), ["keep.txt"])
+        gunicorn_conf.clear_metrics(None)
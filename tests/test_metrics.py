@@ -0,0 +1,163 @@
+"""
+Test cases for the Request Metrics
+
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask, Response, stream_with_context
+from flask_restx import Api, Resource
+from prometheus_client import REGISTRY, multiprocess
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy import create_engine, text
+from service.common import metrics
+
+# Runs in a new worker process and records metrics in PROMETHEUS_MULTIPROC_DIR
+WORKER = """
+import sys
+from service.common import metrics
+for _ in range(int(sys.argv[1])):
+    metrics.REQUESTS.labels("WorkerResource.get", "200").inc()
+    metrics.REQUEST_LATENCY.labels("WorkerResource.get").observe(0.02)
+metrics.REQUESTS_IN_PROGRESS.labels("WorkerResource.get").inc()
+print(__import__("os").getpid())
+"""
+
+
+def build_app():
+    """Builds a small instrumented API running statements on an SQLite engine"""
+    app = Flask(__name__)
+    api = Api(app, prefix="/api")
+    engine = create_engine("sqlite://")
+    metrics.init_metrics(app)
+
+    class ThingResource(Resource):
+        """Handles Things"""
+
+        def get(self, count):
+            """Runs a statement per Thing"""
+            with engine.connect() as conn:
+                for number in range(count):
+                    conn.execute(text("SELECT :number"), {"number": number})
+            return {"count": count}
+
+        def delete(self, count):
+            """Fails"""
+            raise RuntimeError(count)
+
+    api.add_resource(ThingResource, "/things/<int:count>")
+
+    @app.route("/stream")
+    def stream_things():
+        """Runs statements while the body is streamed"""
+        def lines():
+            with engine.connect() as conn:
+                for number in range(3):
+                    yield f"{conn.execute(text('SELECT :number'), {'number': number}).scalar()}\n"
+        return Response(stream_with_context(lines()))
+
+    with engine.connect() as conn:
+        # Outside of any request: not recorded
+        conn.execute(text("SELECT 1"))
+    return app
+
+
+def sample(name, **labels):
+    """Returns the value of a sample of the default registry, or 0"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """ Test Cases for the Request Metrics """
+
+    def setUp(self):
+        self.client = build_app().test_client()
+
+    def test_resource_handler(self):
+        """It should record the latency and statements of a resource method"""
+        labels = {"handler": "ThingResource.get"}
+        requests = sample("wishlists_http_requests_total", status="200", **labels)
+        latencies = sample("wishlists_http_request_duration_seconds_count", **labels)
+        statements = sample("wishlists_db_statements_per_request_sum", **labels)
+        within_five = sample("wishlists_db_statements_per_request_bucket", le="5.0", **labels)
+
+        self.assertEqual(self.client.get("/api/things/4").get_json(), {"count": 4})
+        self.assertEqual(self.client.get("/api/things/7").get_json(), {"count": 7})
+        self.assertEqual(sample("wishlists_http_requests_total", status="200", **labels), requests + 2)
+        self.assertEqual(sample("wishlists_http_request_duration_seconds_count", **labels), latencies + 2)
+        self.assertEqual(sample("wishlists_db_statements_per_request_sum", **labels), statements + 11)
+        self.assertEqual(sample("wishlists_db_statements_per_request_bucket", le="5.0", **labels), within_five + 1)
+        self.assertGreater(sample("wishlists_db_seconds_per_request_sum", **labels), 0)
+        self.assertEqual(sample("wishlists_http_requests_in_progress", **labels), 0)
+
+    def test_errors(self):
+        """It should record failed and unmatched requests"""
+        failed = sample("wishlists_http_requests_total", handler="ThingResource.delete", status="500")
+        unmatched = sample("wishlists_http_requests_total", handler=metrics.UNMATCHED, status="404")
+        self.assertEqual(self.client.delete("/api/things/1").status_code, 500)
+        self.assertEqual(self.client.get("/api/nothing").status_code, 404)
+        self.assertEqual(
+            sample("wishlists_http_requests_total", handler="ThingResource.delete", status="500"), failed + 1
+        )
+        self.assertEqual(
+            sample("wishlists_http_requests_total", handler=metrics.UNMATCHED, status="404"), unmatched + 1
+        )
+        self.assertEqual(sample("wishlists_http_requests_in_progress", handler="ThingResource.delete"), 0)
+
+    def test_streamed_body(self):
+        """It should count the statements run while a body is streamed"""
+        statements = sample("wishlists_db_statements_per_request_sum", handler="stream_things")
+        resp = self.client.get("/stream")
+        self.assertEqual(resp.get_data(as_text=True), "0\n1\n2\n")
+        self.assertEqual(sample("wishlists_db_statements_per_request_sum", handler="stream_things"), statements + 3)
+
+    def test_render(self):
+        """It should render the metrics in the Prometheus text format"""
+        self.client.get("/api/things/1")
+        data, content_type = metrics.render()
+        self.assertTrue(content_type.startswith("text/plain"))
+        names = {family.name for family in text_string_to_metric_families(data.decode("utf-8"))}
+        self.assertIn("wishlists_http_request_duration_seconds", names)
+        self.assertIn("wishlists_db_statements_per_request", names)
+
+    def test_workers_aggregated(self):
+        """It should add up the metrics of every worker process"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+            pids = [
+                int(subprocess.run(
+                    [sys.executable, "-c", WORKER, str(count)], env=env, capture_output=True, text=True, check=True
+                ).stdout.splitlines()[-1])
+                for count in (2, 3)
+            ]
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                families = {
+                    family.name: family
+                    for family in text_string_to_metric_families(metrics.render()[0].decode("utf-8"))
+                }
+                values = {
+                    sample.name: sample.value
+                    for family in families.values() for sample in family.samples
+                    if sample.labels.get("handler") == "WorkerResource.get" and "le" not in sample.labels
+                }
+                self.assertEqual(values["wishlists_http_requests_total"], 5)
+                self.assertEqual(values["wishlists_http_request_duration_seconds_count"], 5)
+                self.assertAlmostEqual(values["wishlists_http_request_duration_seconds_sum"], 0.1)
+                self.assertEqual(values["wishlists_http_requests_in_progress"], 2)
+
+                # The gauges of exited workers are dropped, their counters are kept
+                for pid in pids:
+                    multiprocess.mark_process_dead(pid, directory)
+                families = text_string_to_metric_families(metrics.render()[0].decode("utf-8"))
+                names = {
+                    sample.name for family in families for sample in family.samples
+                    if sample.labels.get("handler") == "WorkerResource.get"
+                }
+                self.assertIn("wishlists_http_requests_total", names)
+                self.assertNotIn("wishlists_http_requests_in_progress", names)
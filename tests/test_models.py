@@ -5,8 +5,11 @@ Test cases for Wishlist Model and Product Model
 import os
 import logging
 import unittest
-from service import app
-from service.models import Wishlist, Product, db, DataValidationError
+from unittest.mock import patch
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from service import app, migrations
+from service.models import Wishlist, Product, db, DataValidationError, DataConflictError, warm_up
 from tests.factories import WishlistFactory, ProductFactory
 
 DATABASE_URI = os.getenv(
@@ -30,6 +33,7 @@ class TestWishlist(unittest.TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         app.logger.setLevel(logging.CRITICAL)
         Wishlist.init_db(app)
+        migrations.upgrade()
 
     @classmethod
     def tearDownClass(cls):
@@ -45,6 +49,24 @@ class TestWishlist(unittest.TestCase):
         """ This runs after each test """
         db.session.remove()
 
+    ######################################################################
+    #  H E L P E R   M E T H O D S
+    ######################################################################
+
+    def _count_queries(self, func):
+        """Returns the number of SQL statements executed while calling func"""
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+        return len(statements)
+
     ######################################################################
     #  T E S T   C A S E S
     ######################################################################
@@ -88,6 +110,59 @@ class TestWishlist(unittest.TestCase):
         wishlists = Wishlist.all()
         self.assertEqual(len(wishlists), 5)
 
+    def test_find_a_page_of_wishlists(self):
+        """It should find Wishlists one page at a time ordered by id"""
+        for i, wishlist in enumerate(WishlistFactory.create_batch(5)):
+            wishlist.wishlist_name = f"wishlist-x-{i}"
+            wishlist.create()
+        ids = sorted(wishlist.id for wishlist in Wishlist.all())
+        page = Wishlist.find_page(limit=2)
+        self.assertEqual([wishlist.id for wishlist in page], ids[:2])
+        page = Wishlist.find_page(after=page[-1].id, limit=2)
+        self.assertEqual([wishlist.id for wishlist in page], ids[2:4])
+        page = Wishlist.find_page(after=ids[-1], limit=2)
+        self.assertEqual(page, [])
+
+    def test_read_wishlist_rows(self):
+        """It should read pages of serialized Wishlists without the ORM"""
+        for i, wishlist in enumerate(WishlistFactory.create_batch(4)):
+            wishlist.wishlist_name = f"wishlist-r-{i}"
+            wishlist.wishlist_products = ProductFactory.build_batch(2, wishlist=None)
+            wishlist.create()
+        expected = [wishlist.serialize() for wishlist in Wishlist.all()]
+        db.session.remove()
+        self.assertEqual(self._count_queries(lambda: Wishlist.rows_page(limit=3)), 2)
+        page = Wishlist.rows_page(limit=3)
+        self.assertEqual(page, expected[:3])
+        self.assertEqual(len(db.session.identity_map), 0)
+        self.assertEqual(Wishlist.rows_page(after=page[-1]["id"]), expected[3:])
+        self.assertEqual(Wishlist.rows_page(wishlist_name="wishlist-r-1"), [expected[1]])
+        self.assertEqual(Wishlist.rows_page(wishlist_name="missing"), [])
+
+    def test_find_wishlist_row(self):
+        """It should find a serialized Wishlist and its version without the ORM"""
+        wishlist = WishlistFactory()
+        wishlist.wishlist_products = ProductFactory.build_batch(3, wishlist=None)
+        wishlist.create()
+        expected = wishlist.serialize()
+        found, version, last_updated = Wishlist.find_row(wishlist.id)
+        self.assertEqual(found, expected)
+        self.assertEqual(version, wishlist.version)
+        self.assertEqual(last_updated, wishlist.last_updated)
+        self.assertIsNone(Wishlist.find_row(wishlist.id + 1))
+
+    def test_iterate_all_wishlists(self):
+        """It should iterate over all Wishlists a chunk at a time"""
+        for i, wishlist in enumerate(WishlistFactory.create_batch(5)):
+            wishlist.wishlist_name = f"wishlist-x-{i}"
+            wishlist.wishlist_products = ProductFactory.build_batch(2, wishlist=None)
+            wishlist.create()
+        db.session.remove()
+        wishlists = list(Wishlist.iter_all(chunk_size=2))
+        self.assertEqual(len(wishlists), 5)
+        self.assertEqual([wishlist.id for wishlist in wishlists], sorted(wishlist.id for wishlist in wishlists))
+        self.assertTrue(all(len(wishlist.wishlist_products) == 2 for wishlist in wishlists))
+
     def test_read_a_wishlist(self):
         """It should Read a Wishlist"""
         wishlist = WishlistFactory()
@@ -117,6 +192,61 @@ class TestWishlist(unittest.TestCase):
         # Assert that the name was indeed updated
         self.assertEqual(wishlist.wishlist_name, "Test")
 
+    def test_warm_up(self):
+        """It should warm up the pool, retrying a bounded number of times"""
+        self.assertTrue(warm_up(tries=1, delay=0))
+        error = OperationalError("SELECT 1", {}, Exception("connection refused"))
+        with patch("service.models._ping", side_effect=[error, None]) as ping:
+            self.assertTrue(warm_up(tries=3, delay=0))
+            self.assertEqual(ping.call_count, 2)
+        with patch("service.models._ping", side_effect=error) as ping:
+            self.assertFalse(warm_up(tries=3, delay=0))
+            self.assertEqual(ping.call_count, 3)
+
+    def test_duplicate_wishlist_name(self):
+        """It should raise a DataConflictError when a Wishlist name is taken"""
+        first = WishlistFactory(wishlist_name="first")
+        second = WishlistFactory(wishlist_name="second")
+        first.create()
+        second.create()
+        duplicate = WishlistFactory(wishlist_name=first.wishlist_name)
+        create_queries = self._count_queries(lambda: self.assertRaises(DataConflictError, duplicate.create))
+        self.assertEqual(create_queries, 1)
+        second.wishlist_name = first.wishlist_name
+        self.assertRaises(DataConflictError, second.update)
+        # The session was rolled back and is usable again
+        self.assertEqual(Wishlist.find(second.id).wishlist_name, second.wishlist_name)
+        self.assertNotEqual(second.wishlist_name, first.wishlist_name)
+        self.assertEqual(len(Wishlist.all()), 2)
+
+    def test_other_integrity_errors(self):
+        """It should not report other constraint violations as a name conflict"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        wishlist.wishlist_products.append(Product(product_id=1, product_name=None, product_price=1.0))
+        self.assertRaises(IntegrityError, wishlist.update)
+        # The session was rolled back and is usable again
+        self.assertEqual(Wishlist.find(wishlist.id).wishlist_products, [])
+
+    def test_wishlist_version(self):
+        """It should bump the version of a Wishlist when it or its Products change"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        self.assertEqual(Wishlist.find_version(wishlist.id).version, 1)
+        wishlist.archived = not wishlist.archived
+        wishlist.update()
+        self.assertEqual(Wishlist.find_version(wishlist.id).version, 2)
+        product = ProductFactory(wishlist=wishlist, wishlist_id=wishlist.id)
+        product.create()
+        self.assertEqual(Wishlist.find_version(wishlist.id).version, 3)
+        found, version, last_updated = Product.find_with_version(product.id)
+        self.assertEqual((found.id, version), (product.id, 3))
+        self.assertIsNotNone(last_updated)
+        product.delete()
+        self.assertEqual(Wishlist.find_version(wishlist.id).version, 4)
+        self.assertIsNone(Product.find_with_version(product.id))
+        self.assertIsNone(Wishlist.find_version(wishlist.id + 1))
+
     def test_delete_a_wishlist(self):
         """It should Delete a Wishlist"""
         wishlists = Wishlist.all()
@@ -193,6 +323,11 @@ class TestWishlist(unittest.TestCase):
         self.assertRaises(DataValidationError, wishlist.deserialize, [])
         data = {'user_id': 777, 'wishlist_name': "", 'archived': False}
         self.assertRaises(DataValidationError, wishlist.deserialize, data)
+        # Values that do not fit their columns
+        data = {'user_id': 777, 'wishlist_name': "x" * 64, 'archived': False}
+        self.assertRaises(DataValidationError, wishlist.deserialize, data)
+        data = {'user_id': 2 ** 31, 'wishlist_name': "x" * 63, 'archived': False}
+        self.assertRaises(DataValidationError, wishlist.deserialize, data)
 
     def test_add_wishlist_product(self):
         """It should Create a Wishlist with a Product and add it to the database"""
@@ -243,6 +378,66 @@ class TestWishlist(unittest.TestCase):
             self.assertEqual(fetch_wishlist.wishlist_products[i].product_name, product.product_name)
             self.assertAlmostEqual(fetch_wishlist.wishlist_products[i].product_price, product.product_price)
 
+    def test_serialize_wishlists_in_fixed_queries(self):
+        """It should load the Products of any number of Wishlists in a fixed number of queries"""
+        for count in (2, 6):
+            for i in range(count):
+                wishlist = WishlistFactory(wishlist_name=f"wishlist-{count}-{i}")
+                wishlist.wishlist_products = ProductFactory.build_batch(3, wishlist=None)
+                wishlist.create()
+            db.session.remove()
+            # One query for the Wishlists and one batched query for all of their Products
+            finders = [
+                lambda: [wishlist.serialize() for wishlist in Wishlist.all()],
+                lambda limit=count: [wishlist.serialize() for wishlist in Wishlist.find_page(limit=limit)],
+                lambda name=f"wishlist-{count}-0": [wishlist.serialize() for wishlist in Wishlist.find_by_name(name)],
+            ]
+            for finder in finders:
+                db.session.remove()
+                self.assertEqual(self._count_queries(finder), 2)
+
+    def test_bulk_create_products(self):
+        """It should add many Products to a Wishlist in one go"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        products = ProductFactory.build_batch(4, wishlist=None, wishlist_id=wishlist.id)
+        created = Product.bulk_create(products)
+        self.assertEqual(len(created), 4)
+        self.assertEqual([product.id for product in created], sorted(product.id for product in created))
+        self.assertEqual([product.product_id for product in created], [product.product_id for product in products])
+        self.assertTrue(Wishlist.exists(wishlist.id))
+        self.assertFalse(Wishlist.exists(wishlist.id + 1))
+        self.assertEqual(len(Wishlist.find(wishlist.id).wishlist_products), 4)
+
+    def test_reprice_skus(self):
+        """It should reprice every Product of many SKUs at once"""
+        wishlists = [WishlistFactory(wishlist_name=f"wishlist-p-{i}") for i in range(2)]
+        for wishlist in wishlists:
+            wishlist.create()
+            Product.bulk_create(
+                [ProductFactory.build(wishlist=None, wishlist_id=wishlist.id, product_id=sku) for sku in (1, 2, 3)]
+            )
+        versions = [Wishlist.find_version(wishlist.id).version for wishlist in wishlists]
+        prices = [
+            {"product_id": 1, "product_price": 5},
+            {"product_id": 2, "product_price": 6.5, "product_name": "renamed"},
+            {"product_id": 9, "product_price": 1.0},
+        ]
+        updated, wishlist_ids = Product.reprice(prices)
+        self.assertEqual(updated, 4)
+        self.assertEqual(wishlist_ids, sorted(wishlist.id for wishlist in wishlists))
+        self.assertEqual({product.product_price for product in Product.find_by_product_id(1)}, {5.0})
+        self.assertEqual({product.product_name for product in Product.find_by_product_id(2)}, {"renamed"})
+        self.assertNotIn(6.5, {product.product_price for product in Product.find_by_product_id(3)})
+        for wishlist, version in zip(wishlists, versions):
+            self.assertEqual(Wishlist.find_version(wishlist.id).version, version + 1)
+        self.assertRaises(DataValidationError, Product.reprice, [{"product_id": 1, "product_price": True}])
+        self.assertRaises(DataValidationError, Product.reprice, [{"product_id": "1", "product_price": 1}])
+        self.assertRaises(DataValidationError, Product.reprice, [{"product_id": 1}])
+        self.assertRaises(
+            DataValidationError, Product.reprice, [{"product_id": 1, "product_price": 1, "product_name": "x" * 64}]
+        )
+
     def test_read_a_product_from_wishlist(self):
         """It should return a Product from a Wishlist"""
         wishlist = WishlistFactory()
@@ -341,3 +536,7 @@ class TestWishlist(unittest.TestCase):
         self.assertRaises(DataValidationError, product.deserialize, data)
         data = {'product_id': 1234, 'product_name': "", 'product_price': 123.45, 'wishlist_id': 666}
         self.assertRaises(DataValidationError, product.deserialize, data)
+        data = {'product_id': 1234, 'product_name': "x" * 64, 'product_price': 123.45, 'wishlist_id': 666}
+        self.assertRaises(DataValidationError, product.deserialize, data)
+        data = {'product_id': -2 ** 31 - 1, 'product_name': "x" * 63, 'product_price': 123.45, 'wishlist_id': 666}
+        self.assertRaises(DataValidationError, product.deserialize, data)
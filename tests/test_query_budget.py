@@ -0,0 +1,116 @@
+"""
+Test cases for the SQL Query Budgets
+
+"""
+from collections import Counter
+from unittest import TestCase
+from flask import Flask
+from flask_restx import Api, Resource
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from service.common import metrics
+from service.common.query_budget import (
+    QueryBudgetExceeded,
+    budget_of,
+    check_budget,
+    is_declared,
+    query_budget,
+    repeated_statements,
+)
+
+
+def build_app(mode):
+    """Builds a small instrumented API whose handlers run one statement per Thing"""
+    app = Flask(__name__)
+    app.config["QUERY_BUDGET"] = mode
+    api = Api(app)
+    engine = create_engine("sqlite://")
+    metrics.init_metrics(app)
+
+    class BudgetedThings(Resource):
+        """Handles Things"""
+
+        @query_budget(2)
+        def get(self, count):
+            """Runs a statement per Thing, an N+1 query"""
+            with engine.connect() as conn:
+                for number in range(count):
+                    conn.execute(text("SELECT :number"), {"number": number})
+            return {"count": count}
+
+        def put(self, count):
+            """Runs a statement per Thing, without a budget"""
+            return self.get(count)
+
+    api.add_resource(BudgetedThings, "/things/<int:count>")
+    return app
+
+
+######################################################################
+#  Q U E R Y   B U D G E T   T E S T   C A S E S
+######################################################################
+class TestQueryBudget(TestCase):
+    """ Test Cases for the SQL Query Budgets """
+
+    def test_declare_budget(self):
+        """It should declare the budget of a handler"""
+        @query_budget(4)
+        def handler():
+            """A budgeted handler"""
+
+        @query_budget(None)
+        def unbounded():
+            """A handler without bound"""
+
+        self.assertEqual(budget_of(handler), 4)
+        self.assertTrue(is_declared(unbounded))
+        self.assertIsNone(budget_of(unbounded))
+        self.assertFalse(is_declared(print))
+        self.assertIsNone(budget_of(None))
+
+    def test_repeated_statements(self):
+        """It should report the statements run more than once, most repeated first"""
+        statements = Counter({"SELECT a": 1, "SELECT b": 5, "SELECT c": 2})
+        self.assertEqual(repeated_statements(statements), [("SELECT b", 5), ("SELECT c", 2)])
+        self.assertEqual(repeated_statements(Counter()), [])
+
+    def test_check_budget(self):
+        """It should raise or warn when a budget is exceeded, depending on the mode"""
+        statements = Counter({"SELECT *\n  FROM product\n WHERE id = ?": 3, "SELECT 1": 1})
+        check_budget("Handler.get", 4, statements, "raise")
+        check_budget("Handler.get", None, statements, "raise")
+        check_budget("Handler.get", 1, statements, "off")
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            check_budget("Handler.get", 3, statements, "raise")
+        self.assertEqual(
+            str(raised.exception),
+            "Handler.get ran 4 SQL statements, over its budget of 3; repeated: 3 x SELECT * FROM product WHERE id = ?",
+        )
+        with self.assertLogs("flask.app", "WARNING") as logs:
+            check_budget("Handler.get", 3, statements, "warn")
+        self.assertIn("over its budget of 3", logs.output[0])
+
+    def test_enforce_on_requests(self):
+        """It should check the statements of every request against the budget of its handler"""
+        client = build_app("raise").test_client()
+        self.assertEqual(client.get("/things/2").status_code, 200)
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            client.get("/things/3")
+        self.assertIn("BudgetedThings.get ran 3 SQL statements", str(raised.exception))
+        self.assertIn("repeated: 3 x SELECT ?", str(raised.exception))
+        # Without a budget, nothing is checked
+        self.assertEqual(client.put("/things/3").status_code, 200)
+
+        client = build_app("warn").test_client()
+        with self.assertLogs("flask.app", "WARNING"):
+            self.assertEqual(client.get("/things/3").status_code, 200)
+
+    def test_repeats_metric(self):
+        """It should record the statements repeated by each request"""
+        client = build_app("off").test_client()
+        labels = {"handler": "BudgetedThings.get"}
+        repeats = REGISTRY.get_sample_value("wishlists_db_repeated_statements_per_request_sum", labels) or 0
+        self.assertEqual(client.get("/things/5").status_code, 200)
+        self.assertEqual(
+            REGISTRY.get_sample_value("wishlists_db_repeated_statements_per_request_sum", labels), repeats + 4
+        )
@@ -0,0 +1,47 @@
+"""
+Test cases for the compiled Serializers
+
+"""
+from types import SimpleNamespace
+from unittest import TestCase
+from flask_restx import Model, fields, marshal
+from service.routes import wishlist_model, product_model, serialize_product
+from service.common.serializers import compile_serializer
+from tests.factories import WishlistFactory, ProductFactory
+
+
+######################################################################
+#  S E R I A L I Z E R   T E S T   C A S E S
+######################################################################
+class TestSerializers(TestCase):
+    """ Test Cases for the compiled Serializers """
+
+    def test_serialize_nested_lists(self):
+        """It should serialize a model with a list of nested models exactly like marshal() does"""
+        wishlist = WishlistFactory()
+        wishlist.wishlist_products = ProductFactory.build_batch(3, wishlist=None, wishlist_id=wishlist.id)
+        serialize_wishlist = compile_serializer(wishlist_model)
+        self.assertEqual(serialize_wishlist(wishlist), marshal(wishlist.serialize(), wishlist_model))
+
+    def test_serialize_a_product(self):
+        """It should serialize a Product exactly like marshal() does"""
+        product = ProductFactory(wishlist=None, wishlist_id=7)
+        self.assertEqual(serialize_product(product), marshal(product.serialize(), product_model))
+
+    def test_serialize_missing_values(self):
+        """It should output None for missing values"""
+        row = SimpleNamespace(id=None, user_id=None, wishlist_name=None, archived=None, wishlist_products=None)
+        self.assertEqual(compile_serializer(wishlist_model)(row), marshal(row, wishlist_model))
+
+    def test_fallback_fields(self):
+        """It should output other field types through the fields themselves"""
+        model = Model("Other", {
+            "price": fields.Fixed(decimals=2),
+            "label": fields.String(attribute="name"),
+            "count": fields.Integer(default=0),
+            "class": fields.Raw,
+        })
+        serializer = compile_serializer(model)
+        row = SimpleNamespace(price=1.005, name="thing", count=None, **{"class": "a"})
+        self.assertEqual(serializer(row), marshal(row, model))
+        self.assertIn("def serialize(obj):", serializer.source)